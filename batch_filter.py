@@ -0,0 +1,337 @@
+"""
+Batch CRT Filter
+
+Applies the CRT filter offline to a directory of images, or to a raw RGB24 or
+YUV4MPEG2 (Y4M) video stream read from stdin and written to stdout. Frames
+stream through a process pool a bounded number at a time, so memory stays
+constant, and come out in input order.
+
+Usage:
+    python batch_filter.py --input frames/ --output filtered/
+    ffmpeg -i in.mp4 -f rawvideo -pix_fmt rgb24 - | python batch_filter.py --raw 1920x1080 | ...
+    ffmpeg -i in.mp4 -f yuv4mpegpipe - | python batch_filter.py --y4m > out.y4m
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Raw video goes to stdout, so keep pygame's banner out of it
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from PIL import Image
+from config import FILTER_SETTINGS, FilterSettings
+from crt_filter import CRTFilter
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+Y4M_MAGIC = b'YUV4MPEG2'
+
+# Frame formats passed to workers: packed RGB24, or planar YUV with 4:2:0 or
+# 4:4:4 chroma
+FORMAT_RGB = 'rgb'
+FORMAT_YUV420 = 'yuv420'
+FORMAT_YUV444 = 'yuv444'
+
+# Filter for this worker process; one per process, with contexts per size
+_worker_filter: Optional[CRTFilter] = None
+_worker_settings: Dict = {}
+
+
+def _init_worker(settings: Dict) -> None:
+    """Process pool initializer: remember the settings for this worker's filter."""
+    global _worker_filter, _worker_settings
+    _worker_filter = None
+    _worker_settings = settings
+
+
+def _get_filter(width: int, height: int) -> CRTFilter:
+    """Return this worker's filter context for a frame size."""
+    global _worker_filter
+    if _worker_filter is None:
+        _worker_filter = CRTFilter(width, height)
+        _worker_filter.update_parameters(**_worker_settings)
+    return _worker_filter.get_context(width, height)
+
+
+def filter_frame(data: bytes, width: int, height: int, pixel_format: str = FORMAT_RGB) -> bytes:
+    """Filter one frame of raw data, returning it in the same format."""
+    if pixel_format == FORMAT_RGB:
+        rgb = data
+    else:
+        rgb = yuv_to_rgb(data, width, height, pixel_format).tobytes()
+    
+    # Effects run fastest on 32-bit surfaces
+    surface = pygame.Surface((width, height), 0, 32)
+    surface.blit(pygame.image.frombuffer(rgb, (width, height), 'RGB'), (0, 0))
+    result = _get_filter(width, height).apply_effects(surface)
+    filtered = pygame.image.tostring(result, 'RGB')
+    
+    if pixel_format == FORMAT_RGB:
+        return filtered
+    rgb_array = np.frombuffer(filtered, dtype=np.uint8).reshape(height, width, 3)
+    return rgb_to_yuv(rgb_array, pixel_format)
+
+
+def _filter_job(job: Tuple[bytes, int, int, str]) -> bytes:
+    """Unpack a queued frame for filter_frame."""
+    return filter_frame(*job)
+
+
+def filter_frames(jobs: Iterable[Tuple[bytes, int, int, str]], settings: FilterSettings,
+                  workers: int = 1, max_in_flight: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Filter (data, width, height, format) jobs, yielding results in input order.
+    
+    With workers > 1 jobs go to a process pool, with at most max_in_flight
+    (default twice the workers) submitted but not yet yielded. With one worker
+    frames are filtered in this process.
+    """
+    if workers <= 1:
+        _init_worker(settings.to_dict())
+        for job in jobs:
+            yield _filter_job(job)
+        return
+    
+    max_in_flight = max_in_flight or workers * 2
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(settings.to_dict(),)) as pool:
+        pending: deque = deque()
+        for job in jobs:
+            pending.append(pool.submit(_filter_job, job))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def yuv_to_rgb(data: bytes, width: int, height: int, pixel_format: str) -> np.ndarray:
+    """Convert a planar BT.601 limited-range YUV frame to an RGB array."""
+    chroma_width, chroma_height = chroma_size(width, height, pixel_format)
+    planes = np.frombuffer(data, dtype=np.uint8)
+    luma = planes[:width * height].reshape(height, width)
+    chroma = planes[width * height:].reshape(2, chroma_height, chroma_width)
+    if pixel_format == FORMAT_YUV420:
+        chroma = chroma.repeat(2, axis=1).repeat(2, axis=2)[:, :height, :width]
+    
+    y = (luma.astype(np.float32) - 16) * 1.164
+    u = chroma[0].astype(np.float32) - 128
+    v = chroma[1].astype(np.float32) - 128
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    rgb[:, :, 0] = y + 1.596 * v
+    rgb[:, :, 1] = y - 0.392 * u - 0.813 * v
+    rgb[:, :, 2] = y + 2.017 * u
+    return np.clip(rgb + 0.5, 0, 255).astype(np.uint8)
+
+
+def rgb_to_yuv(rgb: np.ndarray, pixel_format: str) -> bytes:
+    """Convert an RGB array to a planar BT.601 limited-range YUV frame."""
+    height, width = rgb.shape[:2]
+    r, g, b = (rgb[:, :, channel].astype(np.float32) for channel in range(3))
+    y = 16 + 0.257 * r + 0.504 * g + 0.098 * b
+    u = 128 - 0.148 * r - 0.291 * g + 0.439 * b
+    v = 128 + 0.439 * r - 0.368 * g - 0.071 * b
+    
+    if pixel_format == FORMAT_YUV420:
+        # Average each 2x2 block, padding odd sizes by repeating the edge
+        u, v = (np.pad(plane, ((0, height % 2), (0, width % 2)), mode='edge')
+                for plane in (u, v))
+        u, v = (plane.reshape(plane.shape[0] // 2, 2, plane.shape[1] // 2, 2).mean(axis=(1, 3))
+                for plane in (u, v))
+    
+    planes = [np.clip(plane + 0.5, 0, 255).astype(np.uint8) for plane in (y, u, v)]
+    return b''.join(plane.tobytes() for plane in planes)
+
+
+def chroma_size(width: int, height: int, pixel_format: str) -> Tuple[int, int]:
+    """Return the size of each chroma plane."""
+    if pixel_format == FORMAT_YUV420:
+        return (width + 1) // 2, (height + 1) // 2
+    return width, height
+
+
+def frame_bytes(width: int, height: int, pixel_format: str) -> int:
+    """Return the size in bytes of one frame."""
+    if pixel_format == FORMAT_RGB:
+        return width * height * 3
+    chroma_width, chroma_height = chroma_size(width, height, pixel_format)
+    return width * height + 2 * chroma_width * chroma_height
+
+
+def read_exactly(stream: BinaryIO, size: int) -> Optional[bytes]:
+    """Read size bytes, returning None at a clean end of stream."""
+    data = stream.read(size)
+    if not data:
+        return None
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise EOFError(f"stream ended inside a frame ({len(data)} of {size} bytes)")
+        data += more
+    return data
+
+
+def read_raw(stream: BinaryIO, width: int, height: int) -> Iterator[Tuple[bytes, int, int, str]]:
+    """Yield RGB24 frames from a raw stream."""
+    size = frame_bytes(width, height, FORMAT_RGB)
+    while True:
+        data = read_exactly(stream, size)
+        if data is None:
+            return
+        yield data, width, height, FORMAT_RGB
+
+
+def parse_y4m_header(line: bytes) -> Tuple[int, int, str]:
+    """Return (width, height, pixel_format) from a Y4M stream header."""
+    fields = line.split()
+    if not fields or fields[0] != Y4M_MAGIC:
+        raise ValueError("input is not a YUV4MPEG2 stream")
+    
+    params = {field[:1]: field[1:] for field in fields[1:]}
+    colorspace = params.get(b'C', b'420jpeg')
+    if colorspace.startswith(b'420'):
+        pixel_format = FORMAT_YUV420
+    elif colorspace == b'444':
+        pixel_format = FORMAT_YUV444
+    else:
+        raise ValueError(f"unsupported Y4M colorspace: {colorspace.decode()}")
+    return int(params[b'W']), int(params[b'H']), pixel_format
+
+
+def read_y4m(stream: BinaryIO) -> Tuple[bytes, Iterator[Tuple[bytes, int, int, str]]]:
+    """Read a Y4M stream header, returning it and a generator of frames."""
+    header = stream.readline()
+    width, height, pixel_format = parse_y4m_header(header)
+    size = frame_bytes(width, height, pixel_format)
+    
+    def frames() -> Iterator[Tuple[bytes, int, int, str]]:
+        while True:
+            frame_header = stream.readline()
+            if not frame_header:
+                return
+            if not frame_header.startswith(b'FRAME'):
+                raise ValueError("malformed Y4M frame header")
+            data = read_exactly(stream, size)
+            if data is None:
+                raise EOFError("stream ended before frame data")
+            yield data, width, height, pixel_format
+    
+    return header, frames()
+
+
+def write_y4m(stream: BinaryIO, header: bytes, frames: Iterable[bytes]) -> int:
+    """Write a Y4M stream, returning the number of frames written."""
+    stream.write(header)
+    count = 0
+    for data in frames:
+        stream.write(b'FRAME\n')
+        stream.write(data)
+        count += 1
+    stream.flush()
+    return count
+
+
+def write_raw(stream: BinaryIO, frames: Iterable[bytes]) -> int:
+    """Write raw frames back to back, returning the number written."""
+    count = 0
+    for data in frames:
+        stream.write(data)
+        count += 1
+    stream.flush()
+    return count
+
+
+def list_images(directory: str) -> List[str]:
+    """Return the image file names in a directory, sorted."""
+    return sorted(name for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def read_images(directory: str, names: Sequence[str]) -> Iterator[Tuple[bytes, int, int, str]]:
+    """Yield images as RGB24 frames, one file at a time."""
+    for name in names:
+        with Image.open(os.path.join(directory, name)) as image:
+            rgb = image.convert('RGB')
+        yield rgb.tobytes(), rgb.width, rgb.height, FORMAT_RGB
+
+
+def process_directory(input_dir: str, output_dir: str, settings: FilterSettings,
+                      workers: int) -> int:
+    """Filter every image in input_dir into output_dir under the same name."""
+    os.makedirs(output_dir, exist_ok=True)
+    names = list_images(input_dir)
+    sizes = {}
+    
+    def jobs() -> Iterator[Tuple[bytes, int, int, str]]:
+        for name, job in zip(names, read_images(input_dir, names)):
+            sizes[name] = job[1:3]
+            yield job
+    
+    count = 0
+    for name, data in zip(names, filter_frames(jobs(), settings, workers)):
+        Image.frombytes('RGB', sizes.pop(name), data).save(os.path.join(output_dir, name))
+        count += 1
+    return count
+
+
+def load_settings(path: Optional[str], performance_mode: Optional[str]) -> FilterSettings:
+    """Return the configured FilterSettings, optionally overridden from a JSON file."""
+    settings = FILTER_SETTINGS
+    if path:
+        with open(path) as f:
+            settings = FilterSettings.from_dict({**FILTER_SETTINGS.to_dict(), **json.load(f)})
+    if performance_mode is not None:
+        settings = FilterSettings.from_dict({**settings.to_dict(),
+                                             'performance_mode': performance_mode == 'on'})
+    return settings
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the batch filter from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="directory of images to filter")
+    source.add_argument('--raw', metavar='WIDTHxHEIGHT',
+                        help="filter raw RGB24 frames from stdin to stdout")
+    source.add_argument('--y4m', action='store_true',
+                        help="filter a YUV4MPEG2 stream from stdin to stdout")
+    parser.add_argument('--output', help="directory for filtered images (with --input)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--settings', help="JSON file of FilterSettings overrides")
+    parser.add_argument('--performance-mode', choices=('on', 'off'),
+                        help="override the configured performance mode")
+    args = parser.parse_args(argv)
+    if args.input and not args.output:
+        parser.error("--input requires --output")
+    
+    settings = load_settings(args.settings, args.performance_mode)
+    start = time.perf_counter()
+    if args.input:
+        count = process_directory(args.input, args.output, settings, args.workers)
+    elif args.raw:
+        width, height = (int(part) for part in args.raw.lower().split('x'))
+        frames = read_raw(sys.stdin.buffer, width, height)
+        count = write_raw(sys.stdout.buffer, filter_frames(frames, settings, args.workers))
+    else:
+        header, frames = read_y4m(sys.stdin.buffer)
+        count = write_y4m(sys.stdout.buffer, header, filter_frames(frames, settings, args.workers))
+    
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Filtered {count} frames in {elapsed:.1f} s ({rate:.1f} fps, "
+          f"{args.workers} workers)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
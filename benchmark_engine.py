@@ -0,0 +1,290 @@
+"""
+Filter Engine Benchmark
+
+Runs the complete FilterEngine loop - capture, filter, present and frame
+pacing - for a fixed number of frames without the Tk control panel, on a
+private Xvfb display, and reports throughput and per-stage timings, and
+optionally per-stage memory allocation.
+
+Usage:
+    python benchmark_engine.py --frames 300 --size 1920x1080
+    python benchmark_engine.py --source mss --serial --output engine.json
+    python benchmark_engine.py --memory --size 3840x2160
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from config import FilterSettings
+from memory_telemetry import format_bytes, peak_rss_bytes
+
+
+class HeadlessControlPanel:
+    """
+    Stand-in for ControlPanel with the attributes FilterEngine reads.
+    
+    Keyboard shortcuts that adjust Tk variables are not supported.
+    """
+    
+    def __init__(self, settings: FilterSettings):
+        self.running = True
+        self.selected_monitor = 0
+        self.crt_filter = None
+        self.scanline_intensity = settings.scanline_intensity
+        self.curvature = settings.curvature
+        self.vignette_intensity = settings.vignette_intensity
+        self.chromatic_aberration = settings.chromatic_aberration
+        self.performance_mode = settings.performance_mode
+        self.root = _NullRoot()
+
+
+class _NullRoot:
+    """Accepts the Tk root calls FilterEngine makes on exit."""
+    
+    def after(self, delay, callback) -> None:
+        pass
+    
+    def quit(self) -> None:
+        pass
+
+
+def start_xvfb(width: int, height: int) -> Tuple[subprocess.Popen, str]:
+    """Start a private Xvfb server, returning the process and display name."""
+    if not shutil.which('Xvfb'):
+        raise RuntimeError("Xvfb is not installed")
+    
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(
+        ['Xvfb', '-displayfd', str(write_fd), '-screen', '0', f'{width}x{height}x24',
+         '+extension', 'Composite', '-nolisten', 'tcp'],
+        pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as display_pipe:
+        number = display_pipe.readline().strip()
+    if not number:
+        process.kill()
+        raise RuntimeError("Xvfb failed to start")
+    return process, f":{number}"
+
+
+def make_source(name: str, width: int, height: int):
+    """Return what FilterEngine should capture from; synthetic frames match the screen."""
+    from capture_sources import SyntheticSource
+    if name == 'synthetic':
+        return SyntheticSource(width, height)
+    return name
+
+
+def run_engine(frames: int, width: int, height: int, source: str = 'synthetic',
+               settings: Optional[FilterSettings] = None, pipelined: Optional[bool] = None,
+               throttled: bool = False, adaptive: bool = False, memory: bool = False,
+               feedback_detection: bool = False) -> Dict:
+    """
+    Run FilterEngine for a number of presented frames and return a report.
+    
+    The caller must have selected the SDL video driver and X display. Unless
+    throttled, the loop runs as fast as it can rather than at the refresh rate.
+    Unless adaptive, performance mode stays at the scheduler's starting scale.
+    With memory, each stage's allocations are traced too, which slows it.
+    Unless feedback_detection, frames are never taken for the overlay's own
+    output: the synthetic source's frames differ too little to pass, and a
+    detected frame skips the effects and flip, so the loop would be timed
+    passing frames through. Signatures are still computed either way.
+    frames_filtered and frames_flipped count the frames that really were.
+    """
+    import pygame
+    from filter_engine import FilterEngine
+    
+    settings = settings or FilterSettings()
+    monitor = {'left': 0, 'top': 0, 'width': width, 'height': height}
+    control_panel = HeadlessControlPanel(settings)
+    
+    pygame.init()
+    try:
+        engine = FilterEngine(control_panel, monitor, make_source(source, width, height),
+                              max_frames=frames)
+        engine.crt_filter.update_parameters(**settings.to_dict())
+        if pipelined is not None:
+            engine.pipelined = pipelined
+            engine.crt_filter.output_buffers = 3 if pipelined else 1
+        if adaptive:
+            engine.enable_adaptive_quality()
+        else:
+            engine.quality = None
+        if not throttled:
+            engine.refresh_rate = 0
+            engine.pacer.set_refresh_rate(0)
+        if memory:
+            engine.enable_memory_telemetry()
+        if not feedback_detection:
+            # No signature difference is below zero
+            engine.crt_filter.feedback_threshold = 0.0
+        
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        engine.run()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+    finally:
+        pygame.quit()
+    
+    timings = engine.timings
+    frame_wall, _ = timings.samples('frame')
+    intervals_ms = frame_wall / 1e6
+    return {
+        'config': {
+            'frames': frames,
+            'size': [width, height],
+            'source': source,
+            'pipelined': engine.pipelined,
+            'throttled': throttled,
+            'adaptive': adaptive,
+            'refresh_rate': engine.refresh_rate,
+            'settings': settings.to_dict(),
+            'effect_workers': engine.crt_filter.workers,
+            'damage_tracking': engine.crt_filter.incremental,
+            'feedback_detection': feedback_detection,
+        },
+        'frames_presented': engine.frames_presented,
+        'frames_filtered': timings.count('effects'),
+        'frames_flipped': timings.count('flip'),
+        'wall_s': wall,
+        'process_cpu_s': cpu,
+        'quality': engine.quality.describe() if engine.quality else None,
+        'processing_scale': engine.crt_filter.processing_scale,
+        'pacing': {
+            'deadlines_met': engine.pacer.deadlines_met,
+            'deadlines_missed': engine.pacer.deadlines_missed,
+            'vblanks_skipped': engine.pacer.vblanks_skipped,
+            'stale_frames': engine.pacer.stale_frames,
+        },
+        'peak_rss_bytes': peak_rss_bytes(),
+        'memory': engine.memory.report() if engine.memory else None,
+        'fps': engine.frames_presented / wall if wall > 0 else 0.0,
+        'frame_time_ms': {
+            'p50': float(np.percentile(intervals_ms, 50)) if len(intervals_ms) else None,
+            'p95': float(np.percentile(intervals_ms, 95)) if len(intervals_ms) else None,
+            'p99': float(np.percentile(intervals_ms, 99)) if len(intervals_ms) else None,
+            'max': float(intervals_ms.max()) if len(intervals_ms) else None,
+            'histogram': histogram(intervals_ms),
+        },
+        'stages': {stage: timings.summary(stage) for stage in timings.stages()
+                   if stage != 'frame'},
+    }
+
+
+def histogram(samples_ms: np.ndarray) -> Dict[str, int]:
+    """Bucket frame times against common refresh intervals."""
+    edges = [0, 4.2, 6.9, 8.3, 11.1, 16.7, 33.3, 50.0, 100.0, float('inf')]
+    counts, _ = np.histogram(samples_ms, bins=edges)
+    labels = [f"{low:g}-{high:g}ms" for low, high in zip(edges[:-2], edges[1:-1])]
+    labels.append(f"{edges[-2]:g}ms+")
+    return {label: int(count) for label, count in zip(labels, counts)}
+
+
+def print_report(report: Dict) -> None:
+    """Print a readable summary of a report."""
+    config = report['config']
+    print(f"{config['size'][0]}x{config['size'][1]} source={config['source']} "
+          f"{'pipelined' if config['pipelined'] else 'serial'}: "
+          f"{report['frames_presented']} frames in {report['wall_s']:.2f} s = "
+          f"{report['fps']:.1f} fps, process CPU {report['process_cpu_s']:.2f} s")
+    print(f"filtered {report['frames_filtered']}, flipped {report['frames_flipped']} "
+          f"of {report['frames_presented']} frames")
+    if report['quality']:
+        print(f"adaptive quality: {report['quality']}")
+    if config['throttled']:
+        pacing = report['pacing']
+        print(f"deadlines missed {pacing['deadlines_missed']} of "
+              f"{pacing['deadlines_met'] + pacing['deadlines_missed']}, "
+              f"vblanks skipped {pacing['vblanks_skipped']}, "
+              f"stale frames {pacing['stale_frames']}")
+    frame_time = report['frame_time_ms']
+    if frame_time['p50'] is not None:
+        print(f"frame time p50 {frame_time['p50']:.2f} ms  p95 {frame_time['p95']:.2f} ms  "
+              f"p99 {frame_time['p99']:.2f} ms  max {frame_time['max']:.2f} ms")
+    if report['peak_rss_bytes'] is not None:
+        print(f"peak RSS {format_bytes(report['peak_rss_bytes'])}")
+    memory = report['memory']
+    if memory:
+        print(f"traced peak {format_bytes(memory['traced_peak_bytes'])}, "
+              f"pool allocated {format_bytes(memory['pool_allocated_bytes'])}")
+        for stage, stats in memory['stages'].items():
+            print(f"  {stage:<8} alloc mean {format_bytes(stats['allocated_mean']):>10}  "
+                  f"max {format_bytes(stats['allocated_max']):>10}  "
+                  f"retained {format_bytes(stats['retained_total']):>10}")
+    for stage, stats in report['stages'].items():
+        print(f"  {stage:<8} wall p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  "
+              f"cpu mean {stats['cpu_mean_ms']:7.2f} ms  cpu total {stats['cpu_total_ms']:8.1f} ms")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the engine benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--size', help="screen size as WIDTHxHEIGHT (default 1920x1080, "
+                                       "or the recording's size when replaying)")
+    parser.add_argument('--source', default='synthetic',
+                        help="capture source: synthetic, mss, xshm, composite or replay:<file>")
+    parser.add_argument('--serial', action='store_true', help="use the single-threaded loop")
+    parser.add_argument('--throttled', action='store_true',
+                        help="pace frames at the refresh rate instead of running flat out")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="let the quality scheduler adjust scale and effects")
+    parser.add_argument('--memory', action='store_true',
+                        help="trace the memory each stage allocates (slower)")
+    parser.add_argument('--feedback-detection', action='store_true',
+                        help="pass frames through when they match recent ones, as the "
+                             "application does")
+    parser.add_argument('--performance-mode', choices=('on', 'off'), default='on')
+    parser.add_argument('--curvature', type=float, default=0.1)
+    parser.add_argument('--display', help="use this X display instead of starting Xvfb")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+    
+    if args.size:
+        width, height = (int(part) for part in args.size.lower().split('x'))
+    elif args.source.startswith('replay:'):
+        from frame_recording import ReplaySource
+        recording = ReplaySource(args.source[len('replay:'):])
+        width, height = recording.width, recording.height
+        recording.close()
+    else:
+        width, height = 1920, 1080
+    settings = FilterSettings(curvature=args.curvature,
+                              performance_mode=args.performance_mode == 'on')
+    
+    xvfb = None
+    if args.display:
+        os.environ['DISPLAY'] = args.display
+    else:
+        xvfb, os.environ['DISPLAY'] = start_xvfb(width, height)
+    os.environ['SDL_VIDEODRIVER'] = 'x11'
+    
+    try:
+        report = run_engine(args.frames, width, height, args.source, settings,
+                            pipelined=False if args.serial else None,
+                            throttled=args.throttled, adaptive=args.adaptive,
+                            memory=args.memory, feedback_detection=args.feedback_detection)
+    finally:
+        if xvfb is not None:
+            xvfb.kill()
+            xvfb.wait()
+    
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+CRT Filter Benchmark
+
+Times each CRTFilter stage headlessly at common screen resolutions, writes the
+results as JSON and compares them against a saved baseline.
+
+Usage:
+    python benchmark_filter.py --output results.json
+    python benchmark_filter.py --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from capture_sources import BGRX_MASKS, SyntheticSource, source_class
+from config import FilterSettings
+from crt_filter import CRTFilter
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+}
+
+# Stages timed per resolution; the individual effects depend on neither the
+# performance mode nor the worker count, so only the whole-frame stages are
+# repeated across them
+EFFECT_STAGES = ('apply_chromatic_aberration', 'apply_curvature', 'apply_scanlines',
+                 'apply_vignette')
+FRAME_STAGES = ('apply_effects', 'process_frame')
+
+# Distinct noise frames cycled through; feedback detection compares a frame
+# with the two before it, and independent noise differs from them far more
+# than feedback_threshold, so it never fires
+INPUT_FRAMES = 3
+
+
+def parse_resolution(name: str) -> Tuple[str, Tuple[int, int]]:
+    """Resolve a preset name such as '1080p' or an explicit 'WIDTHxHEIGHT'."""
+    key = name.lower()
+    if key in RESOLUTIONS:
+        return key, RESOLUTIONS[key]
+    try:
+        width, height = (int(part) for part in key.split('x'))
+    except ValueError:
+        raise ValueError(f"Unknown resolution: {name}")
+    return key, (width, height)
+
+
+def make_frames(width: int, height: int, count: int = INPUT_FRAMES) -> List[pygame.Surface]:
+    """Grab distinct noise frames from the synthetic source, as the application captures them."""
+    source = SyntheticSource(width, height, noise=True)
+    region = source.monitors()[0]
+    return [source.grab(region) for _ in range(count)]
+
+
+def time_stage(function: Callable[[int], object], repeat: int, warmup: int) -> Dict:
+    """
+    Time a stage and measure its Python/NumPy allocations.
+    
+    function takes the iteration number. Allocations come from a separate
+    traced call, since tracing slows everything down; memory allocated by SDL
+    for surfaces is not visible to tracemalloc.
+    """
+    for index in range(warmup):
+        function(index)
+    
+    samples = np.empty(repeat)
+    for index in range(repeat):
+        start = time.perf_counter()
+        function(index)
+        samples[index] = time.perf_counter() - start
+    
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function(repeat)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'median_ms': float(np.median(samples)) * 1000,
+        'p95_ms': float(np.percentile(samples, 95)) * 1000,
+        'mean_ms': float(samples.mean()) * 1000,
+        'alloc_peak_bytes': int(peak - baseline),
+        'alloc_retained_bytes': int(current - baseline),
+    }
+
+
+def make_filter(width: int, height: int, settings: FilterSettings, performance_mode: bool,
+                workers: int) -> CRTFilter:
+    """Create a filter configured like the running application."""
+    crt_filter = CRTFilter(width, height)
+    crt_filter.update_parameters(**settings.to_dict())
+    crt_filter.performance_mode = performance_mode
+    crt_filter.workers = workers
+    return crt_filter
+
+
+def stage_function(crt_filter: CRTFilter, stage: str,
+                   frames: List[pygame.Surface]) -> Callable[[int], object]:
+    """Return a callable that runs one stage on the input frames."""
+    if stage in ('apply_scanlines', 'apply_vignette'):
+        # These work in place, so give them a surface of their own
+        work = frames[0].copy()
+        method = getattr(crt_filter, stage)
+        return lambda index: method(work)
+    
+    method = getattr(crt_filter, stage)
+    return lambda index: method(frames[index % len(frames)])
+
+
+def mode_label(performance_mode: Optional[bool]) -> str:
+    """Describe a result's performance mode; None means it does not apply."""
+    if performance_mode is None:
+        return '-'
+    return 'on' if performance_mode else 'off'
+
+
+def stage_runs(stages: Sequence[str], performance_modes: Sequence[bool],
+               workers: Sequence[int]) -> List[Tuple[str, Optional[bool], int]]:
+    """List the (stage, performance mode, workers) combinations to time."""
+    runs = []
+    for stage in stages:
+        if stage in FRAME_STAGES:
+            runs += [(stage, mode, count) for mode in performance_modes for count in workers]
+        else:
+            runs.append((stage, None, workers[0]))
+    return runs
+
+
+def run_benchmarks(resolutions: Sequence[str], performance_modes: Sequence[bool] = (False, True),
+                   workers: Sequence[int] = (1,), repeat: int = 20, warmup: int = 3,
+                   settings: Optional[FilterSettings] = None,
+                   stages: Optional[Sequence[str]] = None,
+                   log: Callable[[str], None] = print) -> Dict:
+    """Run every stage at every resolution and mode, returning the JSON report."""
+    settings = settings or FilterSettings(curvature=0.1)
+    stages = stages or EFFECT_STAGES + FRAME_STAGES
+    results = []
+    
+    for name in resolutions:
+        key, (width, height) = parse_resolution(name)
+        frames = make_frames(width, height)
+        
+        for stage, performance_mode, worker_count in stage_runs(stages, performance_modes,
+                                                                 workers):
+            crt_filter = make_filter(width, height, settings, bool(performance_mode),
+                                     worker_count)
+            try:
+                timing = time_stage(stage_function(crt_filter, stage, frames), repeat, warmup)
+            finally:
+                crt_filter.close()
+                    
+            result = {
+                'stage': stage,
+                'resolution': key,
+                'performance_mode': performance_mode,
+                'workers': worker_count,
+            }
+            result.update(timing)
+            results.append(result)
+            log(f"{key:>6} perf={mode_label(performance_mode):<3} "
+                f"workers={worker_count} {stage:<28} "
+                f"median {timing['median_ms']:8.2f} ms  p95 {timing['p95_ms']:8.2f} ms  "
+                f"peak alloc {timing['alloc_peak_bytes'] / 1e6:7.1f} MB")
+    
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'settings': settings.to_dict(),
+        },
+        'results': results,
+    }
+
+
+def run_capture_benchmarks(sources: Sequence[str], resolutions: Sequence[str],
+                           repeat: int = 20, warmup: int = 3,
+                           log: Callable[[str], None] = print) -> List[Dict]:
+    """Time grabs from each capture source, skipping sources that can't run here."""
+    results = []
+    for source_name in sources:
+        try:
+            source = source_class(source_name)()
+        except Exception as e:
+            log(f"capture source {source_name} skipped: {e}")
+            continue
+        
+        try:
+            for name in resolutions:
+                key, (width, height) = parse_resolution(name)
+                region = {'left': 0, 'top': 0, 'width': width, 'height': height}
+                surface = pygame.Surface((width, height), 0, 32, BGRX_MASKS)
+                timing = time_stage(lambda index: source.grab(region, surface), repeat, warmup)
+                
+                result = {
+                    'stage': f'capture_{source_name}',
+                    'resolution': key,
+                    'performance_mode': None,
+                    'workers': 1,
+                }
+                result.update(timing)
+                results.append(result)
+                log(f"{key:>6} capture {source_name:<10} median {timing['median_ms']:8.2f} ms  "
+                    f"p95 {timing['p95_ms']:8.2f} ms  "
+                    f"peak alloc {timing['alloc_peak_bytes'] / 1e6:7.1f} MB")
+        finally:
+            source.close()
+    return results
+
+
+def result_key(result: Dict) -> Tuple:
+    """Identify a result across runs."""
+    return (result['stage'], result['resolution'], result['performance_mode'],
+            result['workers'])
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float = 0.10,
+                    min_delta_ms: float = 0.05) -> List[Dict]:
+    """
+    Return the results whose median regressed against a baseline.
+    
+    A result regresses when its median is more than threshold (a fraction)
+    slower and at least min_delta_ms slower, so tiny timings can't trip it on
+    noise alone.
+    """
+    previous = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        delta = result['median_ms'] - old['median_ms']
+        if delta > min_delta_ms and result['median_ms'] > old['median_ms'] * (1 + threshold):
+            regressions.append({
+                'key': result_key(result),
+                'baseline_ms': old['median_ms'],
+                'current_ms': result['median_ms'],
+                'ratio': result['median_ms'] / old['median_ms'],
+            })
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help="comma-separated presets or WIDTHxHEIGHT sizes")
+    parser.add_argument('--performance-mode', choices=('on', 'off', 'both'), default='both')
+    parser.add_argument('--workers', default='1',
+                        help="comma-separated worker counts for the whole-frame stages")
+    parser.add_argument('--stages', default=None, help="comma-separated subset of stages")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--curvature', type=float, default=0.1)
+    parser.add_argument('--sources', default='synthetic',
+                        help="comma-separated capture sources whose grabs to time as well, "
+                             "e.g. mss,xshm,composite; empty for none")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--compare', help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="allowed fractional slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+    
+    modes = {'on': (True,), 'off': (False,), 'both': (False, True)}[args.performance_mode]
+    pygame.init()
+    try:
+        report = run_benchmarks(
+            args.resolutions.split(','), modes,
+            workers=[int(count) for count in args.workers.split(',')],
+            repeat=args.repeat, warmup=args.warmup,
+            settings=FilterSettings(curvature=args.curvature),
+            stages=args.stages.split(',') if args.stages else None
+        )
+        if args.sources:
+            report['results'] += run_capture_benchmarks(
+                args.sources.split(','), args.resolutions.split(','),
+                repeat=args.repeat, warmup=args.warmup
+            )
+    finally:
+        pygame.quit()
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold)
+        for regression in regressions:
+            stage, resolution, performance_mode, workers = regression['key']
+            print(f"REGRESSION {resolution} perf={mode_label(performance_mode)} "
+                  f"workers={workers} {stage}: {regression['baseline_ms']:.2f} ms -> "
+                  f"{regression['current_ms']:.2f} ms (x{regression['ratio']:.2f})")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
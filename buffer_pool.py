@@ -0,0 +1,113 @@
+"""
+Buffer Pool Module
+
+Keeps frame-sized pygame surfaces and NumPy arrays for reuse, so that once
+the frame loop has warmed up it takes every large buffer from here instead of
+allocating a new one per frame.
+"""
+
+import threading
+import numpy as np
+import pygame
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Channel masks pygame gives a plain 32-bit surface
+DEFAULT_MASKS = (0xFF0000, 0x00FF00, 0x0000FF, 0)
+
+
+class BufferPool:
+    """
+    Free lists of 32-bit surfaces and arrays, keyed on size and format.
+    
+    acquire_* returns a free buffer of the requested size, allocating one only
+    if none is free; release_* hands a buffer back once nothing uses it. At
+    most max_free buffers are kept per key and free lists for at most max_keys
+    sizes, dropping the least recently used, so a resized frame does not pin
+    buffers of its old size. Safe to share between threads.
+    """
+    
+    def __init__(self, max_free: int = 4, max_keys: int = 16):
+        self.max_free = max_free
+        self.max_keys = max_keys
+        self._free: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Buffers created because none was free, their total size, and
+        # requests served from a free list
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+    
+    def _take(self, key) -> Optional[object]:
+        """Pop a free buffer for key, counting the outcome."""
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self._free.move_to_end(key)
+                self.reuses += 1
+                return free.pop()
+            self.allocations += 1
+        return None
+    
+    def _give(self, key, buffer) -> None:
+        """Put a buffer on its free list, evicting old sizes beyond max_keys."""
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            self._free.move_to_end(key)
+            if len(free) < self.max_free and not any(item is buffer for item in free):
+                free.append(buffer)
+            while len(self._free) > self.max_keys:
+                self._free.popitem(last=False)
+    
+    def acquire_surface(self, size: Tuple[int, int],
+                        masks: Tuple[int, int, int, int] = DEFAULT_MASKS) -> pygame.Surface:
+        """Return a 32-bit surface of the given size and channel masks."""
+        key = ('surface', int(size[0]), int(size[1]), tuple(masks))
+        surface = self._take(key)
+        if surface is None:
+            surface = pygame.Surface(size, 0, 32, masks)
+            with self._lock:
+                self.allocated_bytes += size[0] * size[1] * 4
+        return surface
+    
+    def release_surface(self, surface: pygame.Surface) -> None:
+        """Hand back a surface; ones of another pixel format are left alone."""
+        if surface.get_bitsize() != 32:
+            return
+        width, height = surface.get_size()
+        self._give(('surface', width, height, tuple(surface.get_masks())), surface)
+    
+    def acquire_array(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """Return an uninitialised C-contiguous array of the given shape and type."""
+        dtype = np.dtype(dtype)
+        key = ('array', tuple(shape), dtype.str)
+        array = self._take(key)
+        if array is None:
+            array = np.empty(shape, dtype=dtype)
+            with self._lock:
+                self.allocated_bytes += array.nbytes
+        return array
+    
+    def release_array(self, array: np.ndarray) -> None:
+        """Hand back an array; views into other memory are left alone."""
+        if array.base is not None or not array.flags.c_contiguous:
+            return
+        self._give(('array', array.shape, array.dtype.str), array)
+    
+    def free_bytes(self) -> int:
+        """Return the total size of the buffers waiting on free lists."""
+        total = 0
+        with self._lock:
+            for key, free in self._free.items():
+                for buffer in free:
+                    if key[0] == 'surface':
+                        total += buffer.get_width() * buffer.get_height() * 4
+                    else:
+                        total += buffer.nbytes
+        return total
+    
+    def clear(self) -> None:
+        """Drop every free buffer."""
+        with self._lock:
+            self._free.clear()
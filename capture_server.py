@@ -0,0 +1,321 @@
+"""
+Capture Server Module
+
+Runs screen capture in a separate process that writes frames into a
+shared-memory ring, so grabbing and overlay hiding never compete with the
+filter or GUI threads for the GIL.
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+import numpy as np
+import pygame
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+from capture_sources import create_capture_source
+from window_manager import WindowManager
+
+# Header layout (int64 fields): newest sequence number and its slot, then the
+# sequence number held in each slot, then a per-slot "held by reader" flag
+HEADER_LATEST_SEQ = 0
+HEADER_LATEST_SLOT = 1
+HEADER_FIELDS = 2
+HEADER_ALIGNMENT = 64
+
+# Servers started by this process, so signal handlers can stop them
+_active_servers: List['SharedMemoryCapture'] = []
+
+
+def _header_size(slot_count: int) -> int:
+    """Return the byte size of the ring header, padded to a cache line."""
+    size = (HEADER_FIELDS + 2 * slot_count) * 8
+    return -(-size // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+
+
+class FrameRing:
+    """
+    Fixed-size frame slots with sequence numbers in shared memory.
+    
+    The writer never touches the newest slot or any slot a reader holds, so a
+    reader can use a slot in place until it releases it. Slot bookkeeping is
+    guarded by a cross-process lock; frame data is written outside it.
+    """
+    
+    def __init__(self, shm: shared_memory.SharedMemory, lock, width: int, height: int,
+                 slot_count: int):
+        self.shm = shm
+        self.lock = lock
+        self.width = width
+        self.height = height
+        self.slot_count = slot_count
+        self.frame_bytes = width * height * 4
+        
+        header = np.ndarray((HEADER_FIELDS + 2 * slot_count,), dtype=np.int64, buffer=shm.buf)
+        self.header = header
+        self.slot_seq = header[HEADER_FIELDS:HEADER_FIELDS + slot_count]
+        self.held = header[HEADER_FIELDS + slot_count:]
+        
+        offset = _header_size(slot_count)
+        self.slots = [
+            np.ndarray((height, width, 4), dtype=np.uint8, buffer=shm.buf,
+                       offset=offset + index * self.frame_bytes)
+            for index in range(slot_count)
+        ]
+    
+    @staticmethod
+    def required_size(width: int, height: int, slot_count: int) -> int:
+        """Return the shared-memory size needed for a ring."""
+        return _header_size(slot_count) + slot_count * width * height * 4
+    
+    def reset(self) -> None:
+        """Mark every slot empty."""
+        with self.lock:
+            self.header[:] = 0
+            self.header[HEADER_LATEST_SLOT] = -1
+    
+    def begin_write(self) -> Optional[int]:
+        """Pick a slot the writer may fill, or None if all are in use."""
+        with self.lock:
+            latest = self.header[HEADER_LATEST_SLOT]
+            for index in range(self.slot_count):
+                if index != latest and not self.held[index]:
+                    self.slot_seq[index] = -1
+                    return index
+        return None
+    
+    def end_write(self, index: int) -> None:
+        """Publish a filled slot as the newest frame."""
+        with self.lock:
+            seq = self.header[HEADER_LATEST_SEQ] + 1
+            self.slot_seq[index] = seq
+            self.header[HEADER_LATEST_SEQ] = seq
+            self.header[HEADER_LATEST_SLOT] = index
+    
+    def acquire_latest(self, newer_than: int) -> Optional[int]:
+        """Hold the newest completed slot if it is newer than a sequence number."""
+        with self.lock:
+            seq = self.header[HEADER_LATEST_SEQ]
+            index = self.header[HEADER_LATEST_SLOT]
+            if index < 0 or seq <= newer_than:
+                return None
+            self.held[index] = 1
+            return int(index)
+    
+    def release(self, index: int) -> None:
+        """Let the writer reuse a slot."""
+        with self.lock:
+            self.held[index] = 0
+
+
+def clamp_origin(left: int, top: int, width: int, height: int, screen: Dict) -> tuple:
+    """Return the top-left corner nearest (left, top) keeping a region on screen."""
+    right = max(screen['left'], screen['left'] + screen['width'] - width)
+    bottom = max(screen['top'], screen['top'] + screen['height'] - height)
+    return (min(max(left, screen['left']), right), min(max(top, screen['top']), bottom))
+
+
+def _capture_process_main(shm_name: str, lock, frame_ready, stop_event, hides_overlay,
+                          origin, monitor: Dict, window_id: Optional[str], source_name: str,
+                          slot_count: int, parent_pid: int) -> None:
+    """Capture process entry point: grab frames into the ring until stopped."""
+    # The parent owns shutdown; don't die mid-frame on a terminal Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = FrameRing(shm, lock, monitor['width'], monitor['height'], slot_count)
+    window_manager = WindowManager()
+    window_manager.window_id = window_id
+    source = create_capture_source(source_name, window_id)
+    hides_overlay.value = source.needs_overlay_hidden
+    region = {key: monitor[key] for key in ('left', 'top', 'width', 'height')}
+    screen = source.monitors()[0]
+    frame = None
+    
+    try:
+        while not stop_event.is_set() and os.getppid() == parent_pid:
+            index = ring.begin_write()
+            if index is None:
+                # Reader holds every spare slot; wait for it to catch up
+                time.sleep(0.001)
+                continue
+            
+            frame = ring.slots[index]
+            # The region's size is fixed by the ring, but it may be moved; it
+            # is kept on screen so grabs near an edge cannot fail
+            region['left'], region['top'] = clamp_origin(origin[0], origin[1], region['width'],
+                                                         region['height'], screen)
+            try:
+                window_hidden = source.needs_overlay_hidden and window_manager.hide_window()
+                if (not window_hidden and source.needs_overlay_hidden
+                        and window_manager.has_window()):
+                    # Grabbing with the overlay possibly on screen would feed
+                    # the filter its own output
+                    raise RuntimeError("overlay window was not hidden")
+                source.grab_into(region, frame.view(np.uint32)[:, :, 0])
+                if window_hidden:
+                    window_manager.restore_window()
+            except Exception as e:
+                print(f"Error during screen capture: {e}")
+                window_manager.ensure_window_restored()
+                time.sleep(0.1)
+                continue
+            
+            # X servers leave the padding byte undefined; make frames opaque
+            frame[:, :, 3] = 255
+            ring.end_write(index)
+            frame_ready.set()
+    finally:
+        source.close()
+        window_manager.close()
+        # Views into the segment must go before it can be closed
+        frame = ring = None
+        shm.close()
+
+
+class SharedMemoryCapture:
+    """
+    Screen capture served by a separate process through shared memory.
+    
+    Offers the same capture_screen/capture_region/release_surface/close
+    interface as ScreenCapture. Returned surfaces wrap ring slots directly, so
+    nothing is copied on this side; release each surface once it has been
+    processed. Moving the captured region is cheap; resizing it restarts the
+    capture process with a ring of the new size.
+    """
+    
+    def __init__(self, window_manager: WindowManager, monitor: Dict, source: str = 'mss',
+                 slot_count: int = 4, frame_timeout: float = 0.1):
+        self.window_id = window_manager.window_id
+        self.source = source
+        self.slot_count = slot_count
+        self.frame_timeout = frame_timeout
+        self.overlay_known = self.window_id not in (None, 'None')
+        self.process = None
+        # Segments a consumer still held frames of when their server stopped
+        self._retired_shm: List[shared_memory.SharedMemory] = []
+        self._start(monitor)
+        _active_servers.append(self)
+    
+    def _start(self, monitor: Dict) -> None:
+        """Create the ring for the region's size and start the capture process."""
+        self.monitor = dict(monitor)
+        self.last_seq = 0
+        width, height = monitor['width'], monitor['height']
+        context = multiprocessing.get_context('spawn')
+        
+        # Set by the capture process once it knows whether its source needs
+        # the overlay unmapped; assume it does until then
+        self._source_hides = context.Value('b', 1, lock=False)
+        # Top-left corner of the captured region, read by every grab
+        self._origin = context.Array('i', [monitor['left'], monitor['top']], lock=False)
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=FrameRing.required_size(width, height, self.slot_count))
+        self.ring = FrameRing(self.shm, context.Lock(), width, height, self.slot_count)
+        self.ring.reset()
+        
+        # One persistent surface per slot, wrapping the slot's memory
+        self._surfaces = [
+            pygame.image.frombuffer(slot, (width, height), 'BGRA') for slot in self.ring.slots
+        ]
+        self._slot_of = {id(surface): index for index, surface in enumerate(self._surfaces)}
+        
+        self.frame_ready = context.Event()
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=_capture_process_main,
+            args=(self.shm.name, self.ring.lock, self.frame_ready, self.stop_event,
+                  self._source_hides, self._origin, dict(monitor), self.window_id,
+                  self.source, self.slot_count, os.getpid()),
+            name='crt-capture-server',
+            daemon=True
+        )
+        self.process.start()
+    
+    def _stop(self) -> None:
+        """Stop the capture process and free its shared memory."""
+        self.stop_event.set()
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1.0)
+        self.process = None
+        
+        # Views into the segment must go before it can be closed
+        self._surfaces = []
+        self._slot_of = {}
+        self.ring = None
+        self.shm.unlink()
+        self._retired_shm.append(self.shm)
+        for shm in list(self._retired_shm):
+            try:
+                shm.close()
+                self._retired_shm.remove(shm)
+            except BufferError:
+                # A consumer still holds a frame; retry on the next stop
+                pass
+    
+    @property
+    def hides_overlay(self) -> bool:
+        """Whether the capture process unmaps the overlay for its grabs."""
+        return self.overlay_known and bool(self._source_hides.value)
+    
+    def capture_screen(self, monitor_index: int) -> Optional[pygame.Surface]:
+        """
+        Return the newest frame from the capture process.
+        
+        Waits up to frame_timeout for a frame newer than the last one returned
+        and returns None if none arrives. monitor_index is fixed at startup.
+        """
+        ring = self.ring
+        if ring is None:
+            return None
+        
+        index = ring.acquire_latest(self.last_seq)
+        if index is None:
+            self.frame_ready.wait(self.frame_timeout)
+            self.frame_ready.clear()
+            index = ring.acquire_latest(self.last_seq)
+            if index is None:
+                return None
+        
+        self.last_seq = int(ring.slot_seq[index])
+        return self._surfaces[index]
+    
+    def capture_region(self, region: Dict) -> Optional[pygame.Surface]:
+        """
+        Move the captured region and return the newest frame.
+        
+        Frames already in the ring may still show the previous position. A
+        region of another size restarts the capture process, so the first
+        frames at the new size take a little longer.
+        """
+        if self.process is None:
+            return None
+        if (region['width'], region['height']) != (self.monitor['width'], self.monitor['height']):
+            self._stop()
+            self._start(region)
+        self._origin[0] = region['left']
+        self._origin[1] = region['top']
+        return self.capture_screen(0)
+    
+    def release_surface(self, surface: pygame.Surface) -> None:
+        """Hand a frame's slot back to the capture process."""
+        index = self._slot_of.get(id(surface))
+        if index is not None and self.ring is not None:
+            self.ring.release(index)
+    
+    def close(self) -> None:
+        """Stop the capture process and free the shared memory."""
+        if self.process is None:
+            return
+        self._stop()
+        if self in _active_servers:
+            _active_servers.remove(self)
+
+
+def shutdown_capture_servers() -> None:
+    """Stop every capture server started by this process."""
+    for server in list(_active_servers):
+        server.close()
@@ -0,0 +1,392 @@
+"""
+Capture Sources Module
+
+Interchangeable backends that grab a screen region into a 32-bit BGRX
+surface: mss, X MIT-SHM, X Composite, and a synthetic pattern for tests.
+"""
+
+import ctypes
+import numpy as np
+import pygame
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from config import CONFIG
+
+# 32-bit pixel masks whose little-endian byte order is B, G, R, X - the same
+# layout as the BGRA buffers returned by mss and X ZPixmap images
+BGRX_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF, 0)
+
+try:
+    from Xlib import X
+    from Xlib import display as xdisplay
+    from Xlib import error as xerror
+    from Xlib.protocol import rq
+except ImportError:  # python-xlib is optional
+    xdisplay = None
+
+
+class CaptureSourceUnavailable(Exception):
+    """Raised when a capture source cannot run on this system."""
+
+
+class CaptureSource(ABC):
+    """
+    A backend that captures screen regions.
+    
+    Subclasses fill a row-major uint32 BGRX array in grab_into; grab wraps that
+    for surfaces. Sources whose captures would include the overlay set
+    needs_overlay_hidden so callers unmap it around each grab.
+    """
+    
+    name = ''
+    needs_overlay_hidden = True
+    
+    @abstractmethod
+    def monitors(self) -> List[Dict]:
+        """Return monitor regions in mss order: index 0 spans every monitor."""
+    
+    @abstractmethod
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        """Capture a region into a (height, width) uint32 BGRX array."""
+    
+    def grab(self, region: Dict, surface: Optional[pygame.Surface] = None) -> pygame.Surface:
+        """
+        Capture a region into a 32-bit BGRX surface.
+        
+        Pass a previously returned surface to reuse it.
+        """
+        size = (region['width'], region['height'])
+        if surface is None or surface.get_size() != size:
+            surface = pygame.Surface(size, 0, 32, BGRX_MASKS)
+        
+        pixels = pygame.surfarray.pixels2d(surface)
+        try:
+            self.grab_into(region, pixels.T)
+        finally:
+            del pixels
+        return surface
+    
+    def close(self) -> None:
+        """Release the source's resources."""
+
+
+def x_monitors(display) -> List[Dict]:
+    """Return mss-style monitor regions for an X display."""
+    root = display.screen().root.get_geometry()
+    monitors = [{'left': 0, 'top': 0, 'width': root.width, 'height': root.height}]
+    try:
+        screens = display.xinerama_query_screens().screens
+    except Exception:
+        screens = []
+    for screen in screens:
+        monitors.append({'left': screen.x, 'top': screen.y,
+                         'width': screen.width, 'height': screen.height})
+    if len(monitors) == 1:
+        monitors.append(dict(monitors[0]))
+    return monitors
+
+
+class MssSource(CaptureSource):
+    """Captures through mss, which allocates a new buffer for every grab."""
+    
+    name = 'mss'
+    
+    def __init__(self):
+        import mss
+        self.sct = mss.mss()
+    
+    def monitors(self) -> List[Dict]:
+        return self.sct.monitors
+    
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        screen_shot = self.sct.grab(region)
+        source = np.frombuffer(screen_shot.raw, dtype=np.uint32, count=pixels.size)
+        pixels[:] = source.reshape(pixels.shape)
+    
+    def close(self) -> None:
+        self.sct.close()
+
+
+if xdisplay is not None:
+    # MIT-SHM requests, which python-xlib does not ship
+    class _ShmAttach(rq.Request):
+        _request = rq.Struct(
+            rq.Card8('opcode'),
+            rq.Opcode(1),
+            rq.RequestLength(),
+            rq.Card32('shmseg'),
+            rq.Card32('shmid'),
+            rq.Bool('read_only'),
+            rq.Pad(3),
+        )
+    
+    class _ShmDetach(rq.Request):
+        _request = rq.Struct(
+            rq.Card8('opcode'),
+            rq.Opcode(2),
+            rq.RequestLength(),
+            rq.Card32('shmseg'),
+        )
+    
+    class _ShmGetImage(rq.ReplyRequest):
+        _request = rq.Struct(
+            rq.Card8('opcode'),
+            rq.Opcode(4),
+            rq.RequestLength(),
+            rq.Drawable('drawable'),
+            rq.Int16('x'),
+            rq.Int16('y'),
+            rq.Card16('width'),
+            rq.Card16('height'),
+            rq.Card32('plane_mask'),
+            rq.Card8('format'),
+            rq.Pad(3),
+            rq.Card32('shmseg'),
+            rq.Card32('offset'),
+        )
+        _reply = rq.Struct(
+            rq.ReplyCode(),
+            rq.Card8('depth'),
+            rq.Card16('sequence_number'),
+            rq.ReplyLength(),
+            rq.Card32('visual'),
+            rq.Card32('size'),
+            rq.Pad(16),
+        )
+
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+
+class ShmImageReader:
+    """
+    Reads drawables with XShmGetImage into one System V shared-memory segment.
+    
+    The X server writes pixels straight into memory mapped here, so a read
+    allocates nothing. The segment grows only when a larger area is read.
+    Needs a local X server; construction raises CaptureSourceUnavailable
+    otherwise.
+    """
+    
+    def __init__(self, display, size: int):
+        extension = display.query_extension('MIT-SHM')
+        if not extension.present:
+            raise CaptureSourceUnavailable("X server has no MIT-SHM extension")
+        self.display = display
+        self.opcode = extension.major_opcode
+        
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.shmget.argtypes = (ctypes.c_int, ctypes.c_size_t, ctypes.c_int)
+        self.libc.shmat.restype = ctypes.c_void_p
+        self.libc.shmat.argtypes = (ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        self.libc.shmdt.argtypes = (ctypes.c_void_p,)
+        self.libc.shmctl.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+        
+        self.segment = None
+        self.address = None
+        self.buffer = None
+        self.capacity = 0
+        
+        # Fail now rather than on the first frame if the server is remote
+        self._ensure_capacity(size)
+    
+    def _ensure_capacity(self, size: int) -> None:
+        """Attach a shared segment of at least size bytes to us and the server."""
+        if size <= self.capacity:
+            return
+        self._release_segment()
+        
+        shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise CaptureSourceUnavailable(f"shmget failed: errno {ctypes.get_errno()}")
+        address = self.libc.shmat(shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(shmid, IPC_RMID, None)
+            raise CaptureSourceUnavailable(f"shmat failed: errno {ctypes.get_errno()}")
+        
+        segment = self.display.display.allocate_resource_id()
+        catcher = xerror.CatchError()
+        _ShmAttach(display=self.display.display, onerror=catcher, opcode=self.opcode,
+                   shmseg=segment, shmid=shmid, read_only=False)
+        self.display.sync()
+        # Both sides are attached; the segment now goes away once both detach
+        self.libc.shmctl(shmid, IPC_RMID, None)
+        if catcher.get_error():
+            self.libc.shmdt(address)
+            raise CaptureSourceUnavailable("X server could not attach shared memory")
+        
+        self.segment = segment
+        self.address = address
+        self.capacity = size
+        self.buffer = np.ctypeslib.as_array((ctypes.c_uint32 * (size // 4)).from_address(address))
+    
+    def _release_segment(self) -> None:
+        """Detach the current segment, if any."""
+        if self.segment is None:
+            return
+        _ShmDetach(display=self.display.display, opcode=self.opcode, shmseg=self.segment)
+        self.display.sync()
+        self.buffer = None
+        self.libc.shmdt(self.address)
+        self.segment = None
+        self.address = None
+        self.capacity = 0
+    
+    def get_image(self, drawable, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """
+        Read an area of a 24- or 32-bit drawable as a (height, width) uint32 array.
+        
+        The array views the segment and is overwritten by the next read.
+        """
+        self._ensure_capacity(width * height * 4)
+        _ShmGetImage(display=self.display.display, opcode=self.opcode, drawable=drawable,
+                     x=x, y=y, width=width, height=height,
+                     plane_mask=0xFFFFFFFF, format=X.ZPixmap, shmseg=self.segment, offset=0)
+        return self.buffer[:width * height].reshape(height, width)
+    
+    def close(self) -> None:
+        """Detach the segment."""
+        self._release_segment()
+
+
+class XShmSource(CaptureSource):
+    """
+    Captures the root window through a ShmImageReader.
+    
+    A grab costs one copy from the shared segment into the caller's array
+    and allocates nothing.
+    """
+    
+    name = 'xshm'
+    
+    def __init__(self):
+        if xdisplay is None:
+            raise CaptureSourceUnavailable("python-xlib is not installed")
+        try:
+            self.display = xdisplay.Display()
+        except Exception as e:
+            raise CaptureSourceUnavailable(f"cannot open X display: {e}")
+        
+        self.root = self.display.screen().root
+        if self.display.screen().root_depth not in (24, 32):
+            self.display.close()
+            raise CaptureSourceUnavailable("root window is not a 32-bit-pixel visual")
+        self._monitors = x_monitors(self.display)
+        
+        try:
+            self.reader = ShmImageReader(
+                self.display, self._monitors[0]['width'] * self._monitors[0]['height'] * 4)
+        except CaptureSourceUnavailable:
+            self.display.close()
+            raise
+    
+    @property
+    def segment(self) -> Optional[int]:
+        """The X id of the shared segment in use."""
+        return self.reader.segment
+    
+    def monitors(self) -> List[Dict]:
+        return self._monitors
+    
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        pixels[:] = self.reader.get_image(self.root, region['left'], region['top'],
+                                          region['width'], region['height'])
+    
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.display.close()
+        except Exception:
+            pass
+
+
+class SyntheticSource(CaptureSource):
+    """
+    Generates a deterministic moving test pattern instead of reading the screen.
+    
+    Each frame is a fixed color gradient with a bright vertical bar that moves
+    a few pixels per grab, so successive frames differ in a narrow strip -
+    too little for feedback detection to tell them from the overlay's own
+    output. With noise, every frame is instead fresh seeded random noise,
+    so successive frames differ everywhere.
+    """
+    
+    name = 'synthetic'
+    needs_overlay_hidden = False
+    
+    def __init__(self, width: int = 1280, height: int = 720, bar_width: int = 16,
+                 speed: int = 8, noise: bool = False):
+        self.width = width
+        self.height = height
+        self.bar_width = bar_width
+        self.speed = speed
+        self.noise = noise
+        self.frame_index = 0
+        self._background: Optional[np.ndarray] = None
+        self._rng = np.random.default_rng(0)
+    
+    def monitors(self) -> List[Dict]:
+        region = {'left': 0, 'top': 0, 'width': self.width, 'height': self.height}
+        return [region, dict(region)]
+    
+    def _pattern(self, width: int, height: int) -> np.ndarray:
+        """Return the static gradient, building it once per size."""
+        background = self._background
+        if background is None or background.shape != (height, width):
+            red = np.linspace(0, 255, width).astype(np.uint32)
+            green = np.linspace(0, 255, height).astype(np.uint32)
+            background = (red[None, :] << 16) | (green[:, None] << 8) | np.uint32(0x40)
+            self._background = background
+        return background
+    
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        width, height = region['width'], region['height']
+        if self.noise:
+            pixels[:] = self._rng.integers(0, 1 << 24, (height, width), dtype=np.uint32)
+            self.frame_index += 1
+            return
+        np.copyto(pixels, self._pattern(width, height))
+        x = (self.frame_index * self.speed) % max(width, 1)
+        pixels[:, x:x + self.bar_width] = 0xFFFFFF
+        self.frame_index += 1
+
+
+CAPTURE_SOURCES = {
+    'mss': MssSource,
+    'xshm': XShmSource,
+    'synthetic': SyntheticSource,
+}
+
+
+def source_class(name: str) -> type:
+    """Look up a capture source class by its configuration name."""
+    if name == 'composite':
+        from composite_capture import CompositeCapture
+        return CompositeCapture
+    try:
+        return CAPTURE_SOURCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown capture source: {name}")
+
+
+def create_capture_source(name: str, window_id: Optional[str] = None) -> CaptureSource:
+    """
+    Create the named capture source, falling back to mss if it cannot run.
+    
+    'replay:<path>' plays back a recording. window_id identifies the overlay,
+    which the composite source leaves out.
+    """
+    if name.startswith('replay:'):
+        from frame_recording import ReplaySource
+        return ReplaySource(name[len('replay:'):], realtime=CONFIG.replay_realtime)
+    
+    cls = source_class(name)
+    try:
+        if name == 'composite':
+            return cls(window_id)
+        return cls()
+    except CaptureSourceUnavailable as e:
+        print(f"Capture source '{name}' unavailable ({e}), using mss instead")
+        return MssSource()
@@ -0,0 +1,233 @@
+"""
+Capture Target Module
+
+Describes what part of the screen the filter covers: a whole monitor, a fixed
+rectangle, or an X window whose geometry is followed as it moves and resizes.
+The overlay, the capture and the filter are all sized to the target's region.
+"""
+
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from config import CONFIG
+
+try:
+    from Xlib import X
+    from Xlib import display as xdisplay
+    from Xlib.error import XError
+except ImportError:  # python-xlib is optional; fall back to xwininfo/wmctrl
+    xdisplay = None
+
+
+def make_region(left: int, top: int, width: int, height: int) -> Dict:
+    """Return an mss-style region dict."""
+    return {'left': int(left), 'top': int(top), 'width': int(width), 'height': int(height)}
+
+
+def clip_region(region: Dict, bounds: Dict) -> Optional[Dict]:
+    """Return the part of region inside bounds, or None if they don't overlap."""
+    left = max(region['left'], bounds['left'])
+    top = max(region['top'], bounds['top'])
+    right = min(region['left'] + region['width'], bounds['left'] + bounds['width'])
+    bottom = min(region['top'] + region['height'], bounds['top'] + bounds['height'])
+    if right <= left or bottom <= top:
+        return None
+    return make_region(left, top, right - left, bottom - top)
+
+
+def monitor_for_region(region: Dict, monitors: List[Dict]) -> Dict:
+    """Return the monitor containing the centre of region (the first one if none does)."""
+    centre_x = region['left'] + region['width'] // 2
+    centre_y = region['top'] + region['height'] // 2
+    for monitor in monitors:
+        if (monitor['left'] <= centre_x < monitor['left'] + monitor['width']
+                and monitor['top'] <= centre_y < monitor['top'] + monitor['height']):
+            return monitor
+    return monitors[0]
+
+
+def parse_window_id(text: str) -> int:
+    """Parse a window ID in decimal or 0x-prefixed hexadecimal."""
+    text = text.strip().split()[0] if text.strip() else ''
+    try:
+        return int(text, 0)
+    except ValueError:
+        raise ValueError(f"Invalid window ID: {text!r}")
+
+
+class CaptureTarget(ABC):
+    """A screen region to filter; region() is polled once per frame."""
+    
+    @abstractmethod
+    def region(self) -> Dict:
+        """Return the current region in root window coordinates."""
+    
+    def describe(self) -> str:
+        """Return a short description for display."""
+        region = self.region()
+        return f"{region['width']}x{region['height']}+{region['left']}+{region['top']}"
+    
+    def close(self) -> None:
+        """Release any resources held by the target."""
+
+
+class RegionTarget(CaptureTarget):
+    """A fixed rectangle of the screen, such as a whole monitor."""
+    
+    def __init__(self, region: Dict):
+        if region['width'] <= 0 or region['height'] <= 0:
+            raise ValueError("Target region must have a positive size")
+        self._region = make_region(region['left'], region['top'],
+                                   region['width'], region['height'])
+    
+    def region(self) -> Dict:
+        return self._region
+
+
+class WindowTarget(CaptureTarget):
+    """
+    An X window, followed as it moves and resizes.
+    
+    The geometry is queried at most once per poll_interval seconds and clipped
+    to the screen. If the window goes away the last known region is kept and
+    lost is set.
+    """
+    
+    def __init__(self, window_id: int, bounds: Optional[Dict] = None,
+                 poll_interval: Optional[float] = None):
+        self.window_id = window_id
+        self.bounds = bounds
+        self.poll_interval = CONFIG.target_poll_interval if poll_interval is None else poll_interval
+        self.lost = False
+        self._display = None
+        self._window = None
+        self._lock = threading.Lock()
+        self._polled_at = 0.0
+        
+        geometry = self._query_geometry()
+        if geometry is None:
+            self.close()
+            raise ValueError(f"Window {window_id:#x} not found")
+        self._region = self._clip(geometry)
+        self._polled_at = time.monotonic()
+    
+    def _clip(self, geometry: Dict) -> Dict:
+        """Clip a window's geometry to the screen, keeping it at least 1x1."""
+        if self.bounds is None:
+            return geometry
+        clipped = clip_region(geometry, self.bounds)
+        if clipped is None:
+            # Entirely off screen: keep a minimal region at the nearest edge
+            left = min(max(geometry['left'], self.bounds['left']),
+                       self.bounds['left'] + self.bounds['width'] - 1)
+            top = min(max(geometry['top'], self.bounds['top']),
+                      self.bounds['top'] + self.bounds['height'] - 1)
+            clipped = make_region(left, top, 1, 1)
+        return clipped
+    
+    def _query_geometry(self) -> Optional[Dict]:
+        """Return the window's geometry in root coordinates, or None if it is gone."""
+        if xdisplay is not None:
+            return self._query_geometry_xlib()
+        return self._query_geometry_xwininfo()
+    
+    def _query_geometry_xlib(self) -> Optional[Dict]:
+        """Query the geometry over a persistent Xlib connection."""
+        try:
+            if self._display is None:
+                self._display = xdisplay.Display()
+                self._window = self._display.create_resource_object('window', self.window_id)
+            geometry = self._window.get_geometry()
+            origin = self._display.screen().root.translate_coords(self._window, 0, 0)
+            return make_region(origin.x, origin.y, geometry.width, geometry.height)
+        except XError:
+            return None
+    
+    def _query_geometry_xwininfo(self) -> Optional[Dict]:
+        """Query the geometry by running xwininfo."""
+        try:
+            output = subprocess.run(['xwininfo', '-id', str(self.window_id)], capture_output=True,
+                                    text=True, timeout=1.0).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        
+        values = {}
+        for line in output.splitlines():
+            key, _, value = line.strip().partition(':')
+            values[key] = value.strip()
+        try:
+            return make_region(values['Absolute upper-left X'], values['Absolute upper-left Y'],
+                               values['Width'], values['Height'])
+        except (KeyError, ValueError):
+            return None
+    
+    def region(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            if not self.lost and now - self._polled_at >= self.poll_interval:
+                self._polled_at = now
+                geometry = self._query_geometry()
+                if geometry is None:
+                    print(f"Target window {self.window_id:#x} is gone; keeping its last position")
+                    self.lost = True
+                else:
+                    self._region = self._clip(geometry)
+            return self._region
+    
+    def describe(self) -> str:
+        return f"window {self.window_id:#x} ({super().describe()})"
+    
+    def close(self) -> None:
+        if self._display is not None:
+            try:
+                self._display.close()
+            except Exception:
+                pass
+        self._display = None
+        self._window = None
+
+
+def list_windows() -> List[Tuple[int, str]]:
+    """Return (window ID, title) for the window manager's top-level windows."""
+    if xdisplay is not None:
+        try:
+            return _list_windows_xlib()
+        except Exception:
+            pass
+    try:
+        output = subprocess.run(['wmctrl', '-l'], capture_output=True, text=True,
+                                timeout=1.0).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    
+    windows = []
+    for line in output.splitlines():
+        parts = line.split(None, 3)
+        if len(parts) >= 3:
+            windows.append((int(parts[0], 16), parts[3] if len(parts) == 4 else ''))
+    return windows
+
+
+def _list_windows_xlib() -> List[Tuple[int, str]]:
+    """List client windows from the root window's _NET_CLIENT_LIST."""
+    display = xdisplay.Display()
+    try:
+        root = display.screen().root
+        client_list = root.get_full_property(display.intern_atom('_NET_CLIENT_LIST'),
+                                             X.AnyPropertyType)
+        if client_list is None:
+            return []
+        net_wm_name = display.intern_atom('_NET_WM_NAME')
+        windows = []
+        for window_id in client_list.value:
+            window = display.create_resource_object('window', window_id)
+            name = window.get_full_property(net_wm_name, X.AnyPropertyType)
+            title = name.value if name is not None else window.get_wm_name()
+            if isinstance(title, bytes):
+                title = title.decode('utf-8', 'replace')
+            windows.append((int(window_id), title or ''))
+        return windows
+    finally:
+        display.close()
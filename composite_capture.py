@@ -0,0 +1,341 @@
+"""
+Composite Capture Module
+
+Captures the screen beneath the overlay using the X Composite extension, so
+the overlay never has to be hidden for a grab.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from capture_sources import CaptureSource, CaptureSourceUnavailable, ShmImageReader, x_monitors
+
+try:
+    from Xlib import X
+    from Xlib import display as xdisplay
+    from Xlib.ext import composite
+except ImportError:  # python-xlib is optional
+    xdisplay = None
+
+# Root window properties wallpaper setters store their pixmap in, most common first
+ROOT_PIXMAP_PROPERTIES = ('_XROOTPMAP_ID', 'ESETROOT_PMAP_ID')
+
+# Screen rectangle as (x1, y1, x2, y2), right and bottom edges exclusive
+Rect = Tuple[int, int, int, int]
+
+
+def clip_rects(rects: List[Rect], clip: Rect) -> List[Rect]:
+    """Return the non-empty intersections of rectangles with clip."""
+    cx1, cy1, cx2, cy2 = clip
+    result = []
+    for x1, y1, x2, y2 in rects:
+        x1, y1, x2, y2 = max(x1, cx1), max(y1, cy1), min(x2, cx2), min(y2, cy2)
+        if x1 < x2 and y1 < y2:
+            result.append((x1, y1, x2, y2))
+    return result
+
+
+def subtract_rect(rects: List[Rect], cut: Rect) -> List[Rect]:
+    """Return disjoint rectangles covering what of rects lies outside cut."""
+    cx1, cy1, cx2, cy2 = cut
+    result = []
+    for x1, y1, x2, y2 in rects:
+        if cx1 >= x2 or cx2 <= x1 or cy1 >= y2 or cy2 <= y1:
+            result.append((x1, y1, x2, y2))
+            continue
+        # Full-width bands above and below the cut, then the sides beside it
+        if y1 < cy1:
+            result.append((x1, y1, x2, cy1))
+        if cy2 < y2:
+            result.append((x1, cy2, x2, y2))
+        band_top, band_bottom = max(y1, cy1), min(y2, cy2)
+        if x1 < cx1:
+            result.append((x1, band_top, cx1, band_bottom))
+        if cx2 < x2:
+            result.append((cx2, band_top, x2, band_bottom))
+    return result
+
+
+def plan_paint(windows: List[Tuple[object, Rect, bool]], region: Rect
+               ) -> Tuple[List[Tuple[object, List[Rect]]], List[Rect]]:
+    """
+    Work out which parts of stacked windows show within a region.
+    
+    windows lists (key, rect, opaque) bottom to top. Returns (key, visible
+    rectangles) for every window that shows, bottom to top, and the
+    rectangles no opaque window covers, where the root window shows.
+    Translucent windows hide nothing beneath them.
+    """
+    uncovered = [region]
+    plan = []
+    for key, rect, opaque in reversed(windows):
+        if not uncovered:
+            break
+        visible = clip_rects(uncovered, rect)
+        if not visible:
+            continue
+        plan.append((key, visible))
+        if opaque:
+            uncovered = subtract_rect(uncovered, rect)
+    plan.reverse()
+    return plan, uncovered
+
+
+def _bounds(rects: List[Rect]) -> Rect:
+    """Return the smallest rectangle containing all of rects."""
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+class _Window:
+    """Cached stacking entry of one top-level window."""
+    
+    __slots__ = ('window', 'rect', 'depth', 'shown', 'pixmap')
+    
+    def __init__(self, window, rect: Rect, depth: int, shown: bool):
+        self.window = window
+        self.rect = rect
+        self.depth = depth
+        self.shown = shown
+        self.pixmap = None
+    
+    def free_pixmap(self) -> None:
+        """Release the named backing pixmap so the next paint names a fresh one."""
+        if self.pixmap is not None:
+            self.pixmap.free()
+            self.pixmap = None
+
+
+class CompositeCapture(CaptureSource):
+    """
+    Rebuilds a screen region from redirected top-level window pixmaps.
+    
+    All children of the root window are redirected automatically, so the
+    server keeps each one's contents off-screen while still showing them. A
+    grab paints the wallpaper where no window covers the region, then the
+    visible parts of every viewable top-level window except the overlay's,
+    bottom to top; parts hidden by opaque windows above are never read.
+    The stacking order, geometry and named pixmaps are cached and updated
+    from structure events on the root window rather than re-queried every
+    frame, and pixels arrive through MIT-SHM when the server is local.
+    """
+    
+    name = 'composite'
+    needs_overlay_hidden = False
+    
+    def __init__(self, window_id: Optional[str] = None):
+        if xdisplay is None:
+            raise CaptureSourceUnavailable("python-xlib is not installed")
+        
+        try:
+            self.display = xdisplay.Display()
+        except Exception as e:
+            raise CaptureSourceUnavailable(f"cannot open X display: {e}")
+        
+        if not self.display.has_extension('Composite'):
+            self.display.close()
+            raise CaptureSourceUnavailable("X server has no Composite extension")
+        
+        self.root = self.display.screen().root
+        self.display.composite_query_version()
+        self.root.composite_redirect_subwindows(composite.RedirectAutomatic)
+        self.root.change_attributes(event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask)
+        self.display.sync()
+        
+        self.window_id = int(window_id) if window_id and window_id != 'None' else None
+        self._excluded: Optional[int] = None
+        self._windows: List[_Window] = []
+        self._stale = True
+        self._root_atoms = [self.display.intern_atom(name) for name in ROOT_PIXMAP_PROPERTIES]
+        self._background: Optional[tuple] = None
+        
+        screen = x_monitors(self.display)[0]
+        try:
+            self.reader: Optional[ShmImageReader] = ShmImageReader(
+                self.display, screen['width'] * screen['height'] * 4)
+        except CaptureSourceUnavailable:
+            # Remote server: pixels come over the connection instead
+            self.reader = None
+    
+    def _excluded_window(self) -> Optional[int]:
+        """Return the top-level window (WM frame) that contains the overlay."""
+        if self.window_id is None:
+            return None
+        if self._excluded is not None:
+            return self._excluded
+        
+        window = self.display.create_resource_object('window', self.window_id)
+        while True:
+            parent = window.query_tree().parent
+            if parent.id == self.root.id:
+                break
+            window = parent
+        self._excluded = window.id
+        return self._excluded
+    
+    def monitors(self) -> List[Dict]:
+        return x_monitors(self.display)
+    
+    def _process_events(self) -> None:
+        """Apply queued root window events to the cached state."""
+        while self.display.pending_events():
+            event = self.display.next_event()
+            if event.type == X.ConfigureNotify:
+                self._configure(event)
+            elif event.type == X.PropertyNotify:
+                if event.atom in self._root_atoms:
+                    self._background = None
+            elif event.type in (X.CreateNotify, X.DestroyNotify, X.MapNotify, X.UnmapNotify,
+                                X.ReparentNotify, X.CirculateNotify, X.GravityNotify):
+                self._stale = True
+    
+    def _configure(self, event) -> None:
+        """Follow a top-level window moving or resizing in place."""
+        if self._stale:
+            return
+        index = next((i for i, entry in enumerate(self._windows)
+                      if entry.window.id == event.window.id), None)
+        if index is None:
+            self._stale = True
+            return
+        
+        entry = self._windows[index]
+        border = 2 * event.border_width
+        rect = (event.x, event.y, event.x + event.width + border, event.y + event.height + border)
+        if rect[2] - rect[0] != entry.rect[2] - entry.rect[0] or \
+                rect[3] - rect[1] != entry.rect[3] - entry.rect[1]:
+            # Resizing gives the window a new backing pixmap
+            entry.free_pixmap()
+        entry.rect = rect
+        
+        # A changed sibling below means the window was restacked
+        below = self._windows[index - 1].window.id if index else X.NONE
+        if getattr(event.above_sibling, 'id', event.above_sibling) != below:
+            self._stale = True
+    
+    def _refresh_windows(self) -> None:
+        """Re-read the stacking order and geometry of every top-level window."""
+        for entry in self._windows:
+            entry.free_pixmap()
+        # Events arriving while reading mark the list stale again
+        self._stale = False
+        self._excluded = None
+        try:
+            excluded = self._excluded_window()
+        except Exception:
+            excluded = None  # the overlay is gone
+        
+        windows = []
+        for window in self.root.query_tree().children:
+            try:
+                attributes = window.get_attributes()
+                geometry = window.get_geometry()
+            except Exception:
+                # Windows can vanish between listing and reading
+                continue
+            border = 2 * geometry.border_width
+            rect = (geometry.x, geometry.y,
+                    geometry.x + geometry.width + border, geometry.y + geometry.height + border)
+            shown = (attributes.map_state == X.IsViewable
+                     and attributes.win_class != X.InputOnly
+                     and geometry.depth in (24, 32)
+                     and window.id != excluded)
+            windows.append(_Window(window, rect, geometry.depth, shown))
+        self._windows = windows
+    
+    def _root_pixmap(self) -> tuple:
+        """Return the wallpaper pixmap and its size, or (None, 0, 0) without one."""
+        if self._background is not None:
+            return self._background
+        
+        self._background = (None, 0, 0)
+        for atom in self._root_atoms:
+            prop = self.root.get_full_property(atom, X.AnyPropertyType)
+            if prop is None or not len(prop.value):
+                continue
+            pixmap = self.display.create_resource_object('pixmap', int(prop.value[0]))
+            try:
+                geometry = pixmap.get_geometry()
+            except Exception:
+                continue
+            if geometry.depth in (24, 32):
+                self._background = (pixmap, geometry.width, geometry.height)
+                break
+        return self._background
+    
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        """Capture a region of the screen without the overlay."""
+        left, top = region['left'], region['top']
+        area = (left, top, left + pixels.shape[1], top + pixels.shape[0])
+        
+        self._process_events()
+        if self._stale:
+            self._refresh_windows()
+        
+        # Depth-32 windows carry alpha, so they may not hide what is beneath
+        stack = [(entry, entry.rect, entry.depth == 24) for entry in self._windows if entry.shown]
+        plan, background = plan_paint(stack, area)
+        
+        self._paint_background(background, pixels, left, top)
+        for entry, rects in plan:
+            try:
+                if entry.pixmap is None:
+                    entry.pixmap = entry.window.composite_name_window_pixmap()
+                self._copy(entry.pixmap, entry.rect[0], entry.rect[1], rects, pixels, left, top)
+            except Exception:
+                # The window changed since the last refresh; its events are on the way
+                for x1, y1, x2, y2 in rects:
+                    pixels[y1 - top:y2 - top, x1 - left:x2 - left] = 0
+                self._stale = True
+    
+    def _paint_background(self, rects: List[Rect], canvas: np.ndarray, left: int, top: int) -> None:
+        """Paint the wallpaper into rectangles no window covers, black outside it."""
+        pixmap, width, height = self._root_pixmap()
+        black = rects
+        if pixmap is not None:
+            wallpaper = (0, 0, width, height)
+            black = []
+            for rect in rects:
+                black.extend(subtract_rect([rect], wallpaper))
+            shown = clip_rects(rects, wallpaper)
+            if shown:
+                try:
+                    self._copy(pixmap, 0, 0, shown, canvas, left, top)
+                except Exception:
+                    # The wallpaper was replaced; reread it next frame
+                    self._background = None
+                    black = rects
+        
+        for x1, y1, x2, y2 in black:
+            canvas[y1 - top:y2 - top, x1 - left:x2 - left] = 0
+        
+    def _copy(self, drawable, origin_x: int, origin_y: int, rects: List[Rect],
+              canvas: np.ndarray, left: int, top: int) -> None:
+        """
+        Copy screen rectangles of a drawable placed at origin into the canvas.
+        
+        Reads the rectangles' bounding box with a single request.
+        """
+        x1, y1, x2, y2 = _bounds(rects)
+        width, height = x2 - x1, y2 - y1
+        if self.reader is not None:
+            image = self.reader.get_image(drawable, x1 - origin_x, y1 - origin_y, width, height)
+        else:
+            reply = drawable.get_image(x1 - origin_x, y1 - origin_y, width, height,
+                                       X.ZPixmap, 0xFFFFFFFF)
+            image = np.frombuffer(reply.data, dtype=np.uint32).reshape(height, width)
+        
+        for rx1, ry1, rx2, ry2 in rects:
+            canvas[ry1 - top:ry2 - top, rx1 - left:rx2 - left] = \
+                image[ry1 - y1:ry2 - y1, rx1 - x1:rx2 - x1]
+    
+    def close(self) -> None:
+        """Stop redirecting windows and close the X connection."""
+        try:
+            for entry in self._windows:
+                entry.free_pixmap()
+            if self.reader is not None:
+                self.reader.close()
+            self.root.composite_unredirect_subwindows(composite.RedirectAutomatic)
+            self.display.close()
+        except Exception:
+            pass
@@ -39,11 +39,73 @@ class AppConfig:
     default_monitor: int = 0
     preview_size: tuple = (300, 200)
     preview_update_rate: int = 100  # milliseconds
+    preview_frame_interval: int = 6  # frames between engine preview thumbnails (0 disables)
     refresh_rate_fallback: float = 60.0
     
     # Window management
     capture_delay: float = 0.02  # seconds
     window_operation_timeout: float = 0.1  # seconds
+    target_poll_interval: float = 0.25  # seconds between window target geometry checks
+    
+    # Frame loop: overlap capture, filtering and presenting on separate
+    # threads, or run them strictly in sequence for comparison
+    pipelined_loop: bool = True
+    pipeline_stage_timeout: float = 0.05  # seconds
+    
+    # Frame pacing: presents wait for refresh-period deadlines, sleeping until
+    # pacing_spin_margin before each one and spinning the rest. Captured frames
+    # older than stale_frame_periods refresh periods are not filtered when a
+    # newer one is already waiting
+    pacing_spin_margin: float = 0.002  # seconds
+    stale_frame_periods: float = 2.0
+    
+    # Grab frames in a separate process that shares them through memory
+    capture_process: bool = False
+    
+    # Capture backend: 'mss', 'xshm' (X MIT-SHM into one reused segment),
+    # 'composite' (windows beneath the overlay via X Composite, so the overlay
+    # is never hidden) or 'synthetic' (moving test pattern). Backends that
+    # cannot run fall back to 'mss'
+    capture_source: str = 'mss'
+    
+    # Record captured frames to this file ('' disables recording) with the
+    # 'raw', 'zlib' or 'delta' codec; play one back with
+    # capture_source = 'replay:<file>', at recorded speed or flat out
+    record_path: str = ''
+    record_codec: str = 'zlib'
+    replay_realtime: bool = True
+    
+    # Append per-stage timing samples to this file: CSV if it ends in .csv,
+    # JSON lines otherwise ('' disables)
+    timing_log_path: str = ''
+    
+    # Lower the processing scale, then switch off curvature and chromatic
+    # aberration, while frames take longer than this fraction of the refresh
+    # interval, and restore them once there is headroom. Without performance
+    # mode only effects are switched off. Off by default because it changes
+    # the picture on its own
+    adaptive_quality: bool = False
+    quality_headroom: float = 0.85
+    
+    # Performance mode scaling: 'fast' box-filters down and repeats pixels up
+    # at 1/2 and 1/3 scale (other scales use smoothscale); 'smooth' always
+    # uses smoothscale
+    scale_quality: str = 'fast'
+    
+    # Threads rendering horizontal bands of each frame (1 disables the pool)
+    effect_workers: int = 1
+    
+    # Refilter and redraw only screen tiles that changed since the last frame
+    damage_tracking: bool = True
+    damage_tile_size: int = 64  # pixels
+    
+    # Trace the memory each stage allocates and show it with the timings
+    # (slows the loop; for diagnosis). A steady-state frame should allocate
+    # at most frame_allocation_base bytes, for work of a fixed size such as
+    # feedback signatures, plus frame_allocation_budget bytes per pixel
+    memory_telemetry: bool = False
+    frame_allocation_base: int = 256 * 1024  # bytes
+    frame_allocation_budget: float = 1.0  # bytes per pixel
     
     # Feedback detection
     frame_buffer_size: int = 3
@@ -63,7 +125,8 @@ class AppConfig:
                 "3/4": "Adjust Curvature (±0.1)",
                 "5/6": "Adjust Chromatic Aberration (±0.5)",
                 "7/8": "Adjust Vignette (±0.05)",
-                "P": "Toggle Performance Mode"
+                "P": "Toggle Performance Mode",
+                "H": "Show/Hide Timing HUD"
             }
 
 
@@ -6,66 +6,381 @@ Contains all the visual effects and processing logic for the CRT filter.
 
 import pygame
 import numpy as np
-from typing import Tuple, Optional
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Optional
+from buffer_pool import BufferPool
+from config import CONFIG
+from damage_tracker import DamageTracker
+from frame_timing import StageTimings
 
 
-class CRTFilter:
-    """Applies various CRT monitor effects to pygame surfaces."""
+class LRUCache:
+    """
+    Small bounded mapping that evicts the least recently used entry.
+    
+    Safe to share between threads; a value returned by get() stays usable
+    after it is evicted or cleared.
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value for key, or None if it is not cached."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value) -> None:
+        """Store value under key, evicting old entries beyond the bound."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FrameWorkspace:
+    """Preallocated per-resolution buffers for the fused effect pipeline."""
     
     def __init__(self, width: int, height: int):
         self.width = width
         self.height = height
         
-        # Effect parameters
-        self.scanline_intensity = 0.05
-        self.curvature = 0.0
-        self.vignette_intensity = 0.1
-        self.chromatic_aberration = 0.5
-        self.performance_mode = True
+        # Row-major (height, width, 3) buffers, matching the memory order of
+        # pygame surfaces so row ranges are contiguous
+        self.shifted = np.empty((height, width, 3), dtype=np.uint8)
+        self.curved = np.empty((height, width, 3), dtype=np.uint8)
+        self.shaded = np.empty((height, width, 3), dtype=np.uint16)
+        
+        # Per-band source rows (including halos) for parallel rendering
+        self._band_buffers = {}
+    
+    def get_band_buffer(self, index: int, band: 'FrameRegion') -> np.ndarray:
+        """Return the shifted-rows buffer for a full-width band."""
+        if band.table is None:
+            # Bands without curvature read only their own rows
+            return self.shifted[band.y0:band.y1]
+        
+        rows = band.src_y1 - band.src_y0
+        buffer = self._band_buffers.get(index)
+        if buffer is None or buffer.shape[0] != rows:
+            buffer = np.empty((rows, self.width, 3), dtype=np.uint8)
+            self._band_buffers[index] = buffer
+        return buffer
+
+
+class ScaleWorkspace:
+    """Preallocated buffers for integer-factor performance mode scaling."""
+    
+    def __init__(self, width: int, height: int, factor: int):
+        self.factor = factor
+        self.small_width = width // factor
+        self.small_height = height // factor
+        
+        # Column sums of each block of factor rows, one uint16 per byte of
+        # BGRX pixel data, and the block sums with a pixel in each uint64
+        self.row_sums = np.empty((self.small_height, self.small_width * factor * 4), dtype=np.uint16)
+        self.block_sums = np.empty((self.small_height, self.small_width), dtype=np.uint64)
+        
+        # The downsampled frame effects run on, and their output
+        self.small = pygame.Surface((self.small_width, self.small_height))
+        self.filtered = pygame.Surface((self.small_width, self.small_height))
+        
+        # Filtered pixels darkened by the scanline gain, for upsampling
+        self.dark = np.empty((self.small_height, self.small_width), dtype=np.uint32)
+        self.dark_product = np.empty((self.small_height, self.small_width * 4), dtype=np.uint16)
+
+
+@dataclass
+class FrameRegion:
+    """A rectangle of output pixels and the window of shifted pixels it reads."""
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+    src_x0: int
+    src_y0: int
+    src_x1: int
+    src_y1: int
+    table: Optional[np.ndarray]  # remap table into the source window, or None
+
+
+@dataclass
+class DamageLayout:
+    """For each output tile, the span of input tiles that can affect it."""
+    tile_size: int
+    tile_y0: np.ndarray
+    tile_y1: np.ndarray
+    tile_x0: np.ndarray
+    tile_x1: np.ndarray
+
+
+@dataclass
+class EffectParameters:
+    """Effect settings shared by every processing context of a filter."""
+    scanline_intensity: float = 0.05
+    curvature: float = 0.0
+    vignette_intensity: float = 0.1
+    chromatic_aberration: float = 0.5
+    performance_mode: bool = True
+    
+    # Fraction of the output size effects run at in performance mode, and
+    # effects switched off to keep up (set by QualityScheduler)
+    processing_scale: float = 0.5
+    suspended_effects: Tuple[str, ...] = ()
+    
+    # Scale integer factors (1/2, 1/3) with a box filter and pixel
+    # repetition ('fast') or always use smoothscale ('smooth')
+    scale_quality: str = 'fast'
+    
+    # Frame width chromatic_aberration is measured in; smaller frames get a
+    # proportionally smaller shift
+    reference_width: int = 1920
+    
+    # Values last requested through update_parameters, kept while suspended
+    requested: Dict[str, float] = field(default_factory=dict)
+
+
+class SharedParameter:
+    """CRTFilter attribute stored on its shared EffectParameters."""
+    
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+    
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance.parameters, self.name)
+    
+    def __set__(self, instance, value) -> None:
+        setattr(instance.parameters, self.name, value)
+
+
+class CRTFilter:
+    """
+    Applies various CRT monitor effects to pygame surfaces.
+    
+    A filter processes frames of any size, but keeps its caches warm for one
+    size. get_context returns filters for other sizes that share this one's
+    EffectParameters and have caches of their own.
+    """
+    
+    scanline_intensity = SharedParameter()
+    curvature = SharedParameter()
+    vignette_intensity = SharedParameter()
+    chromatic_aberration = SharedParameter()
+    performance_mode = SharedParameter()
+    processing_scale = SharedParameter()
+    suspended_effects = SharedParameter()
+    scale_quality = SharedParameter()
+    reference_width = SharedParameter()
+    
+    def __init__(self, width: int, height: int, parameters: Optional[EffectParameters] = None):
+        self.width = width
+        self.height = height
+        if parameters is None:
+            parameters = EffectParameters(scale_quality=CONFIG.scale_quality,
+                                          reference_width=width)
+        self.parameters = parameters
+        
+        # Processing contexts for other frame sizes, keyed on (width, height)
+        self._contexts = LRUCache(max_entries=2)
+        
+        # Output surfaces and per-frame scratch buffers come from here;
+        # FilterEngine shares one pool with its capture
+        self.pool = BufferPool()
+        
+        # Outputs rotate through output_buffers surfaces, so a consumer may
+        # keep using one until that many more frames have been rendered. With
+        # output_leases, each surface process_frame returns is instead lent
+        # until release_output() hands it back, and lent surfaces are never
+        # rendered into; process_frame returns None if every one is lent
+        self.output_buffers = 1
+        self.output_leases = False
+        self._outputs: List[pygame.Surface] = []
+        self._output_next = 0
+        self._output_index = 0
+        self._output_frames: List[Optional[int]] = []
+        self._leases: Dict[int, list] = {}
+        self._retired: List[pygame.Surface] = []
+        self._outputs_free = threading.Condition()
         
-        # Frame buffer for feedback detection
+        # Run all effects over preallocated buffers instead of chaining surfaces
+        self.fused_pipeline = True
+        
+        # Worker threads for band-parallel rendering (1 renders on the caller)
+        self.workers = 1
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_workers = 0
+        
+        # Feedback detection on compact per-frame signatures
         self.prev_frame: Optional[pygame.Surface] = None
-        self.frame_buffer = []
-        self.buffer_size = 3
+        self.buffer_size = CONFIG.frame_buffer_size
+        self.feedback_threshold = CONFIG.feedback_threshold
         self.capture_retry_count = 0
-        self.max_retries = 5
+        self.max_retries = CONFIG.max_feedback_retries
+        self.retry_delay = CONFIG.feedback_retry_delay
+        self.signature_size = (64, 36)  # approximate thumbnail width, height
+        self._signatures: Optional[np.ndarray] = None
+        self._signature_count = 0
+        
+        # Barrel-distortion remap tables keyed on (width, height, curvature)
+        self._remap_cache = LRUCache(max_entries=4)
+        
+        # Scanline/vignette gain masks keyed on size and effect intensities
+        self._gain_mask_cache = LRUCache(max_entries=4)
+        
+        # Fused pipeline buffers keyed on (width, height)
+        self._workspace_cache = LRUCache(max_entries=3)
+        
+        # Integer-factor scaling buffers keyed on (width, height, factor)
+        self._scale_cache = LRUCache(max_entries=2)
+        
+        # Row band layouts keyed on size, curvature and band count
+        self._band_cache = LRUCache(max_entries=4)
+        
+        # Set when curvature changes, so the rendering thread drops the remap,
+        # band and damage tables built for the old value
+        self._geometry_stale = False
+        
+        # Dirty-tile incremental rendering into the output ring
+        self.incremental = False
+        self.damage_tracker = DamageTracker()
+        self.last_damage_rects: Optional[List[pygame.Rect]] = None
+        self._damage_cache = LRUCache(max_entries=2)
+        self._damage_history: deque = deque()
+        self._incremental_state = None
+        self._incremental_frame = 0
+        
+        # Feedback check and effects durations; FilterEngine shares its own
+        self.timings = StageTimings()
     
     def update_parameters(self, **kwargs) -> None:
         """Update filter parameters from keyword arguments."""
-        for key, value in kwargs.items():
+        self.parameters.requested.update(kwargs)
+        self._apply_parameters(kwargs)
+    
+    def _apply_parameters(self, values: Dict) -> None:
+        """Set parameters, holding suspended effects at zero."""
+        values = {key: 0.0 if key in self.suspended_effects else value
+                  for key, value in values.items()}
+        if 'curvature' in values and values['curvature'] != self.curvature:
+            # The control panel calls this while the filter thread renders, so
+            # the tables for the old curvature are dropped on the next render
+            self._geometry_stale = True
+        
+        for key, value in values.items():
             if hasattr(self, key):
                 setattr(self, key, value)
     
+    def set_quality(self, scale: float, suspended: Tuple[str, ...] = ()) -> None:
+        """
+        Set the performance mode processing scale and the effects to switch off.
+        
+        Suspended effects keep the value last requested through
+        update_parameters and get it back once they are no longer suspended.
+        """
+        requested = self.parameters.requested
+        self.processing_scale = scale
+        for key in suspended:
+            requested.setdefault(key, getattr(self, key))
+        changed = set(self.suspended_effects) ^ set(suspended)
+        self.suspended_effects = tuple(suspended)
+        self._apply_parameters({key: requested[key] for key in changed})
+    
+    def get_context(self, width: int, height: int) -> 'CRTFilter':
+        """
+        Return a filter for frames of another size sharing these parameters.
+        
+        Contexts render on the caller's thread and keep their own caches, so
+        they can be used from another thread than this filter.
+        """
+        if (width, height) == (self.width, self.height):
+            return self
+        context = self._contexts.get((width, height))
+        if context is None:
+            context = CRTFilter(width, height, self.parameters)
+            context.fused_pipeline = self.fused_pipeline
+            context.pool = self.pool
+            self._contexts.put((width, height), context)
+        return context
+    
+    def close(self) -> None:
+        """Shut down the band worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._executor_workers = 0
+    
+    def compute_frame_signature(self, frame: pygame.Surface) -> np.ndarray:
+        """
+        Return a small thumbnail of the frame for similarity checks.
+        
+        The thumbnail is a strided sample of roughly signature_size pixels, so
+        its cost does not grow with the frame size.
+        """
+        width, height = frame.get_size()
+        step_x = max(1, width // self.signature_size[0])
+        step_y = max(1, height // self.signature_size[1])
+        
+        pixels = pygame.surfarray.pixels3d(frame)
+        signature = pixels[::step_x, ::step_y].astype(np.int16)
+        del pixels
+        return signature
+    
+    def _store_signature(self, signature: np.ndarray) -> None:
+        """Append a signature to the fixed ring of recent frames."""
+        ring = self._signatures
+        if ring is None or ring.shape[1:] != signature.shape or len(ring) != self.buffer_size:
+            ring = np.empty((self.buffer_size,) + signature.shape, dtype=np.int16)
+            self._signatures = ring
+            self._signature_count = 0
+        
+        ring[self._signature_count % len(ring)] = signature
+        self._signature_count += 1
+    
+    def _matches_recent_frames(self, signature: np.ndarray) -> bool:
+        """Return True if a signature is too similar to the last two buffered ones."""
+        ring = self._signatures
+        if ring is None or self._signature_count < 2 or ring.shape[1:] != signature.shape:
+            return False
+        
+        for back in (1, 2):
+            buffered = ring[(self._signature_count - back) % len(ring)]
+            diff = np.mean(np.abs(signature - buffered))
+            
+            # If difference is too small, we might have a feedback loop
+            if diff < self.feedback_threshold:
+                return True
+        return False
+    
     def add_frame_to_buffer(self, frame: pygame.Surface) -> None:
-        """Add frame to buffer and maintain buffer size."""
-        self.frame_buffer.append(frame)
-        if len(self.frame_buffer) > self.buffer_size:
-            self.frame_buffer.pop(0)
+        """Add a frame's signature to the buffer of recent frames."""
+        self._store_signature(self.compute_frame_signature(frame))
     
     def detect_feedback_loop(self, current_frame: pygame.Surface) -> bool:
         """Detect if current frame is too similar to recent frames (feedback loop)."""
-        if len(self.frame_buffer) < 2:
-            return False
-        
         try:
-            # Convert current frame to numpy array for comparison
-            current_array = pygame.surfarray.array3d(current_frame)
-            
-            # Compare with recent frames
-            for buffered_frame in self.frame_buffer[-2:]:  # Check last 2 frames
-                buffered_array = pygame.surfarray.array3d(buffered_frame)
-                
-                # Calculate difference
-                diff = np.mean(np.abs(current_array.astype(float) - buffered_array.astype(float)))
-                
-                # If difference is too small, we might have a feedback loop
-                if diff < 5.0:  # Threshold for similarity
-                    return True
-                    
+            return self._matches_recent_frames(self.compute_frame_signature(current_frame))
         except Exception:
-            pass  # If comparison fails, assume no feedback
-            
-        return False
+            return False  # If comparison fails, assume no feedback
     
     def create_coordinate_grid(self, width: int, height: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Create coordinate grids for geometric transformations."""
@@ -75,23 +390,115 @@ class CRTFilter:
         R = np.sqrt(X**2 + Y**2)
         return X, Y, R
     
+    def _drop_stale_geometry(self) -> None:
+        """Clear the curvature-dependent caches after a curvature change."""
+        if self._geometry_stale:
+            self._geometry_stale = False
+            self._remap_cache.clear()
+            self._band_cache.clear()
+            self._damage_cache.clear()
+    
+    def get_remap_table(self, width: int, height: int) -> np.ndarray:
+        """
+        Return the barrel-distortion remap table for the given size.
+        
+        The table is an (height, width) int32 array of flat source indices
+        (source_y * width + source_x), cached per (width, height, curvature).
+        """
+        self._drop_stale_geometry()
+        key = (width, height, self.curvature)
+        table = self._remap_cache.get(key)
+        if table is not None:
+            return table
+        
+        # Calculate distortion with reduced strength
+        X, Y, R = self.create_coordinate_grid(width, height)
+        F = 1 + R * (self.curvature * R * 0.25)  # Further reduce effect strength
+        
+        source_x = ((X * F + 1) * width / 2).astype(np.int32)
+        source_y = ((Y * F + 1) * height / 2).astype(np.int32)
+        
+        np.clip(source_x, 0, width - 1, out=source_x)
+        np.clip(source_y, 0, height - 1, out=source_y)
+        
+        table = source_y
+        table *= width
+        table += source_x
+        table.flags.writeable = False
+        
+        self._remap_cache.put(key, table)
+        return table
+    
+    def get_gain_mask(self, width: int, height: int,
+                      scanlines: bool = True, vignette: bool = True) -> Optional[np.ndarray]:
+        """
+        Return the combined scanline/vignette gain mask for the given size.
+        
+        The mask is an (height, width) uint16 array in 8.8 fixed point, so a
+        value of 256 leaves a pixel unchanged. Returns None when the selected
+        effects are disabled and the mask would be the identity.
+        """
+        scanline_intensity = self.scanline_intensity if scanlines else 0.0
+        vignette_intensity = self.vignette_intensity if vignette else 0.0
+        if scanline_intensity == 0 and vignette_intensity == 0:
+            return None
+        
+        key = (width, height, scanline_intensity, vignette_intensity)
+        mask = self._gain_mask_cache.get(key)
+        if mask is not None:
+            return mask
+        
+        gain = np.ones((height, width), dtype=np.float64)
+        if vignette_intensity:
+            _, _, R = self.create_coordinate_grid(width, height)
+            gain *= np.clip(1.0 - R * vignette_intensity, 0, 1)
+        if scanline_intensity:
+            # Darken every other row like the old alpha-blended black lines
+            gain[::2] *= 1.0 - int(255 * scanline_intensity) / 255
+        
+        mask = np.rint(gain * 256).astype(np.uint16)
+        mask.flags.writeable = False
+        
+        self._gain_mask_cache.put(key, mask)
+        return mask
+    
+    def _multiply_by_mask(self, surface: pygame.Surface, mask: Optional[np.ndarray]) -> None:
+        """Scale the surface's pixels in place by a fixed-point gain mask."""
+        if mask is None:
+            return
+        
+        pixels = pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+        shaded = self.pool.acquire_array(pixels.shape, np.uint16)
+        np.multiply(pixels, mask[:, :, np.newaxis], out=shaded)
+        shaded >>= 8
+        pixels[:] = shaded
+        self.pool.release_array(shaded)
+        del pixels
+    
+    def apply_gain_mask(self, surface: pygame.Surface, scanlines: bool = True) -> None:
+        """Apply scanlines and vignette together with a single mask multiply."""
+        width, height = surface.get_size()
+        self._multiply_by_mask(surface, self.get_gain_mask(width, height, scanlines=scanlines))
+    
+    def scanline_gain(self) -> int:
+        """Return the 8.8 fixed-point gain of darkened rows (256 if disabled)."""
+        return int(np.rint((1.0 - int(255 * self.scanline_intensity) / 255) * 256))
+    
     def apply_scanlines(self, surface: pygame.Surface) -> None:
         """Apply horizontal scanlines to simulate CRT scan pattern."""
-        height = surface.get_height()
-        width = surface.get_width()
-        
-        for y in range(0, height, 2):
-            line_surface = pygame.Surface((width, 1), pygame.SRCALPHA)
-            line_surface.fill((0, 0, 0, int(255 * self.scanline_intensity)))
-            surface.blit(line_surface, (0, y))
+        width, height = surface.get_size()
+        self._multiply_by_mask(surface, self.get_gain_mask(width, height, vignette=False))
     
     def apply_chromatic_aberration(self, surface: pygame.Surface) -> pygame.Surface:
         """Apply chromatic aberration effect (color channel separation)."""
         result = surface.copy()
         width = surface.get_width()
         
+        offset = self._aberration_offset(width)
+        if offset == 0 or offset >= width:
+            return result
+        
         pixels = pygame.surfarray.pixels3d(result)
-        offset = max(1, int(self.chromatic_aberration * (width / self.width)))
         
         # Separate and shift color channels
         red = pixels[:, :, 0].copy()
@@ -105,19 +512,8 @@ class CRTFilter:
     
     def apply_vignette(self, surface: pygame.Surface) -> None:
         """Apply vignette effect (darkening at edges)."""
-        width = surface.get_width()
-        height = surface.get_height()
-        
-        _, _, R = self.create_coordinate_grid(width, height)
-        intensity = np.clip(1.0 - R * self.vignette_intensity, 0, 1)
-        color_values = (intensity * 255).astype(np.uint8)
-        
-        vignette = pygame.Surface((width, height), pygame.SRCALPHA)
-        pixels = pygame.surfarray.pixels3d(vignette)
-        pixels[:] = color_values.T[:, :, np.newaxis]
-        del pixels
-        
-        surface.blit(vignette, (0, 0), special_flags=pygame.BLEND_MULT)
+        width, height = surface.get_size()
+        self._multiply_by_mask(surface, self.get_gain_mask(width, height, scanlines=False))
     
     def apply_curvature(self, surface: pygame.Surface) -> pygame.Surface:
         """Apply barrel distortion to simulate curved CRT screen."""
@@ -129,81 +525,681 @@ class CRTFilter:
         
         # Create curved surface with same format as input
         curved = pygame.Surface((width, height), surface.get_flags())
+        table = self.get_remap_table(width, height)
         
-        # Calculate distortion with reduced strength
-        X, Y, R = self.create_coordinate_grid(width, height)
-        F = 1 + R * (self.curvature * R * 0.25)  # Further reduce effect strength
-        
-        source_x = ((X * F + 1) * width / 2).astype(np.int32)
-        source_y = ((Y * F + 1) * height / 2).astype(np.int32)
-        
-        source_x = np.clip(source_x, 0, width - 1)
-        source_y = np.clip(source_y, 0, height - 1)
-        
-        # Copy pixels with proper format preservation
+        # Gather through the cached table; surfarray views are (x, y) ordered,
+        # so work on their row-major transposes
         pixels = pygame.surfarray.pixels3d(curved)
         source_pixels = pygame.surfarray.pixels3d(surface)
-        pixels[:] = source_pixels[source_x.T, source_y.T]
+        source_rows = source_pixels.transpose(1, 0, 2).reshape(-1, 3)
+        pixels.transpose(1, 0, 2)[:] = source_rows[table]
         
         del pixels
         del source_pixels
         return curved
     
-    def apply_effects(self, surface: pygame.Surface) -> pygame.Surface:
-        """Apply all CRT effects to the surface."""
-        result = surface.copy()
+    def get_workspace(self, width: int, height: int) -> FrameWorkspace:
+        """Return the fused pipeline buffers for the given size."""
+        key = (width, height)
+        workspace = self._workspace_cache.get(key)
+        if workspace is None:
+            workspace = FrameWorkspace(width, height)
+            self._workspace_cache.put(key, workspace)
+        return workspace
+    
+    def _aberration_offset(self, width: int) -> int:
+        """Return the chromatic aberration shift in pixels for a frame width."""
+        if self.chromatic_aberration <= 0:
+            return 0
+        return max(1, int(self.chromatic_aberration * (width / self.reference_width)))
+    
+    def get_row_bands(self, width: int, height: int, count: int) -> List[FrameRegion]:
+        """
+        Split the frame into count horizontal bands for parallel rendering.
         
-        if self.performance_mode:
-            # Process at lower resolution for better performance
-            scale = 0.5
-            small_size = (int(self.width * scale), int(self.height * scale))
-            small_surface = pygame.transform.smoothscale(result, small_size)
+        With curvature enabled each band carries the range of source rows its
+        remap gather reads (its halo) and a remap table rebased onto that range.
+        """
+        count = max(1, min(count, height))
+        self._drop_stale_geometry()
+        key = (width, height, self.curvature, count)
+        bands = self._band_cache.get(key)
+        if bands is not None:
+            return bands
+        
+        table = self.get_remap_table(width, height) if self.curvature != 0 else None
+        bounds = np.linspace(0, height, count + 1).astype(int)
+        bands = []
+        for y0, y1 in zip(bounds[:-1], bounds[1:]):
+            if table is None:
+                bands.append(FrameRegion(0, y0, width, y1, 0, y0, width, y1, None))
+                continue
             
-            small_surface = self.apply_chromatic_aberration(small_surface)
-            small_surface = self.apply_curvature(small_surface)
-            self.apply_scanlines(small_surface)
-            self.apply_vignette(small_surface)
+            band_table = table[y0:y1]
+            src_y0 = int(band_table.min()) // width
+            src_y1 = int(band_table.max()) // width + 1
+            # np.take would convert other index types to intp on every frame
+            band_table = band_table.astype(np.intp)
+            if src_y0:
+                band_table -= src_y0 * width
+            bands.append(FrameRegion(0, y0, width, y1, 0, src_y0, width, src_y1, band_table))
+        
+        self._band_cache.put(key, bands)
+        return bands
+    
+    def get_region(self, width: int, height: int, x0: int, y0: int, x1: int, y1: int) -> FrameRegion:
+        """Describe an arbitrary output rectangle, with its remap table rebased."""
+        if self.curvature == 0:
+            return FrameRegion(x0, y0, x1, y1, x0, y0, x1, y1, None)
+        
+        table = self.get_remap_table(width, height)[y0:y1, x0:x1]
+        source_y = table // width
+        source_x = table - source_y * width
+        src_y0, src_y1 = int(source_y.min()), int(source_y.max()) + 1
+        src_x0, src_x1 = int(source_x.min()), int(source_x.max()) + 1
+        
+        source_y -= src_y0
+        source_y *= src_x1 - src_x0
+        source_y += source_x
+        source_y -= src_x0
+        return FrameRegion(x0, y0, x1, y1, src_x0, src_y0, src_x1, src_y1, source_y)
+    
+    def _render_region(self, source: np.ndarray, target: np.ndarray, region: FrameRegion,
+                       mask: Optional[np.ndarray], shifted: np.ndarray,
+                       curved: np.ndarray, shaded: np.ndarray) -> None:
+        """
+        Run the fused effect chain for one output rectangle.
+        
+        source and target are row-major (height, width, 3) views of the input
+        and output surfaces. shifted receives the region's source window, and
+        curved and shaded are scratch buffers of the region's size. Matches
+        apply_chromatic_aberration, apply_curvature and apply_gain_mask applied
+        in sequence.
+        """
+        width = source.shape[1]
+        offset = self._aberration_offset(width)
+        x0, y0, x1, y1 = region.x0, region.y0, region.x1, region.y1
+        c0, c1 = region.src_x0, region.src_x1
+        
+        # Chromatic aberration: red moves right, blue moves left
+        rows = source[region.src_y0:region.src_y1]
+        shifted[:] = rows[:, c0:c1]
+        if 0 < offset < width:
+            red_start = min(max(c0, offset), c1)
+            shifted[:, red_start - c0:, 0] = rows[:, red_start - offset:c1 - offset, 0]
+            blue_end = max(min(c1, width - offset), c0)
+            shifted[:, :blue_end - c0, 2] = rows[:, c0 + offset:blue_end + offset, 2]
+        
+        # Curvature: one gather through the cached remap table
+        if region.table is not None:
+            np.take(shifted.reshape(-1, 3), region.table, axis=0, out=curved, mode='clip')
+        else:
+            curved = shifted
+        
+        # Scanlines and vignette: one multiply by the cached gain mask
+        if mask is None:
+            target[y0:y1, x0:x1] = curved
+        else:
+            np.multiply(curved, mask[y0:y1, x0:x1, np.newaxis], out=shaded)
+            shaded >>= 8
+            target[y0:y1, x0:x1] = shaded
+    
+    def _render_band(self, source: np.ndarray, target: np.ndarray, workspace: FrameWorkspace,
+                     index: int, band: FrameRegion, mask: Optional[np.ndarray]) -> None:
+        """Render a full-width band using the workspace buffers."""
+        if index is None:
+            shifted = workspace.shifted[band.src_y0:band.src_y1]
+        else:
+            shifted = workspace.get_band_buffer(index, band)
+        self._render_region(source, target, band, mask, shifted,
+                            workspace.curved[band.y0:band.y1], workspace.shaded[band.y0:band.y1])
+    
+    def _render_tile(self, source: np.ndarray, target: np.ndarray, region: FrameRegion,
+                     mask: Optional[np.ndarray]) -> None:
+        """Render a small output rectangle with its own scratch buffers."""
+        size = (region.y1 - region.y0, region.x1 - region.x0, 3)
+        window = (region.src_y1 - region.src_y0, region.src_x1 - region.src_x0, 3)
+        self._render_region(source, target, region, mask, np.empty(window, dtype=np.uint8),
+                            np.empty(size, dtype=np.uint8), np.empty(size, dtype=np.uint16))
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the persistent band worker pool, sized to self.workers."""
+        if self._executor is None or self._executor_workers != self.workers:
+            self.close()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='crt-band')
+            self._executor_workers = self.workers
+        return self._executor
+    
+    def _run_jobs(self, function, jobs: List[tuple]) -> None:
+        """Run function over argument tuples, on the worker pool if enabled."""
+        if self.workers <= 1 or len(jobs) <= 1:
+            for args in jobs:
+                function(*args)
+            return
+        
+        executor = self._get_executor()
+        for future in [executor.submit(function, *args) for args in jobs]:
+            future.result()
+    
+    def _render_frame(self, surface: pygame.Surface, result: pygame.Surface,
+                      scanlines: bool = True) -> None:
+        """Render every effect for the whole of surface into result."""
+        width, height = surface.get_size()
+        workspace = self.get_workspace(width, height)
+        bands = self.get_row_bands(width, height, self.workers)
+        mask = self.get_gain_mask(width, height, scanlines=scanlines)
+        
+        source_pixels = pygame.surfarray.pixels3d(surface)
+        target_pixels = pygame.surfarray.pixels3d(result)
+        source = source_pixels.transpose(1, 0, 2)
+        target = target_pixels.transpose(1, 0, 2)
+        
+        if len(bands) == 1:
+            self._render_band(source, target, workspace, None, bands[0], mask)
+        else:
+            self._run_jobs(self._render_band, [
+                (source, target, workspace, index, band, mask)
+                for index, band in enumerate(bands)
+            ])
+        
+        del source, target
+        del source_pixels
+        del target_pixels
+    
+    def apply_effects_fused(self, surface: pygame.Surface, scanlines: bool = True,
+                            result: Optional[pygame.Surface] = None) -> pygame.Surface:
+        """
+        Apply all CRT effects in one pass over preallocated buffers.
+        
+        With workers > 1 the frame is split into horizontal bands rendered on a
+        persistent thread pool; NumPy releases the GIL for the heavy work.
+        Renders into result if given, else into a new surface.
+        """
+        if result is None:
+            result = pygame.Surface(surface.get_size())
+        self._render_frame(surface, result, scanlines)
+        return result
+    
+    def _next_output(self, width: int, height: int) -> Optional[pygame.Surface]:
+        """
+        Return the surface to render the next output into, rebuilding the ring
+        for a new size.
+        
+        Without output_leases the ring is used round robin. With them, the
+        free surface holding the newest frame is chosen, or None if every
+        surface is lent.
+        """
+        with self._outputs_free:
+            outputs = self._outputs
+            if len(outputs) != self.output_buffers or outputs[0].get_size() != (width, height):
+                self._retire_outputs()
+                outputs = [self.pool.acquire_surface((width, height))
+                           for _ in range(self.output_buffers)]
+                self._outputs = outputs
+                self._output_next = 0
+                self._output_frames = [None] * len(outputs)
+                self._incremental_state = None
             
-            result = pygame.transform.smoothscale(small_surface, (self.width, self.height))
+            if not self.output_leases:
+                index = self._output_next
+                self._output_next = (index + 1) % len(outputs)
+            else:
+                free = [index for index, output in enumerate(outputs)
+                        if id(output) not in self._leases]
+                if not free:
+                    return None
+                index = max(free, key=lambda index: -1 if self._output_frames[index] is None
+                            else self._output_frames[index])
+            self._output_index = index
+            return outputs[index]
+    
+    def _retire_outputs(self) -> None:
+        """Drop the current ring; call with the outputs lock held."""
+        if any(output is self.prev_frame for output in self._outputs):
+            self.prev_frame = None
+        if not self.output_leases:
+            # Unleased outputs may still be on screen, so are not handed back
+            return
+        for output in self._outputs:
+            if id(output) in self._leases:
+                self._retired.append(output)
+            else:
+                self.pool.release_surface(output)
+    
+    def _lend_output(self, surface: Optional[pygame.Surface]) -> Optional[pygame.Surface]:
+        """Record a returned output as lent, if output_leases is on."""
+        if surface is not None and self.output_leases:
+            with self._outputs_free:
+                lease = self._leases.setdefault(id(surface), [surface, 0])
+                lease[1] += 1
+        return surface
+    
+    def release_output(self, surface: pygame.Surface) -> None:
+        """
+        Hand back a surface process_frame lent out.
+        
+        Every return of process_frame is a separate loan, even when the same
+        surface is returned twice. Does nothing without output_leases.
+        """
+        with self._outputs_free:
+            lease = self._leases.get(id(surface))
+            if lease is None or lease[0] is not surface:
+                return
+            lease[1] -= 1
+            if lease[1] > 0:
+                return
+            del self._leases[id(surface)]
+            for index, retired in enumerate(self._retired):
+                if retired is surface:
+                    del self._retired[index]
+                    self.pool.release_surface(surface)
+                    break
+            self._outputs_free.notify_all()
+    
+    def wait_for_output(self, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds until an output surface is free.
+        
+        Returns True at once without output_leases, or while the ring is
+        still to be built.
+        """
+        with self._outputs_free:
+            return self._outputs_free.wait_for(
+                lambda: not self.output_leases or len(self._outputs) != self.output_buffers
+                or any(id(output) not in self._leases for output in self._outputs),
+                timeout)
+    
+    def _render_into(self, surface: pygame.Surface, result: pygame.Surface,
+                     scanlines: bool = True) -> pygame.Surface:
+        """Apply all effects, rendering into result when the fused pipeline is on."""
+        if self.fused_pipeline:
+            self._render_frame(surface, result, scanlines)
+            return result
+        return self.apply_effects_chain(surface, scanlines)
+    
+    def get_damage_layout(self, width: int, height: int, tile_size: int) -> DamageLayout:
+        """
+        Map each output tile to the input tiles its pixels are computed from.
+        
+        Covers the curvature gather and the chromatic aberration reach, so an
+        output tile only needs rerendering when an input tile in its span changed.
+        """
+        offset = self._aberration_offset(width)
+        self._drop_stale_geometry()
+        key = (width, height, self.curvature, offset, tile_size)
+        layout = self._damage_cache.get(key)
+        if layout is not None:
+            return layout
+        
+        rows = np.arange(0, height, tile_size)
+        cols = np.arange(0, width, tile_size)
+        if self.curvature != 0:
+            table = self.get_remap_table(width, height)
+            source_y = table // width
+            source_x = table - source_y * width
+            y_min = np.minimum.reduceat(np.minimum.reduceat(source_y, rows, axis=0), cols, axis=1)
+            y_max = np.maximum.reduceat(np.maximum.reduceat(source_y, rows, axis=0), cols, axis=1)
+            x_min = np.minimum.reduceat(np.minimum.reduceat(source_x, rows, axis=0), cols, axis=1)
+            x_max = np.maximum.reduceat(np.maximum.reduceat(source_x, rows, axis=0), cols, axis=1)
         else:
-            # Full resolution processing
-            result = self.apply_chromatic_aberration(result)
-            result = self.apply_curvature(result)
-            self.apply_scanlines(result)
-            self.apply_vignette(result)
+            y_min, x_min = np.meshgrid(rows, cols, indexing='ij')
+            y_max = np.minimum(y_min + tile_size, height) - 1
+            x_max = np.minimum(x_min + tile_size, width) - 1
+        
+        # Shifted pixels read source columns up to offset away
+        x_min = np.clip(x_min - offset, 0, width - 1)
+        x_max = np.clip(x_max + offset, 0, width - 1)
         
+        layout = DamageLayout(tile_size, y_min // tile_size, y_max // tile_size + 1,
+                              x_min // tile_size, x_max // tile_size + 1)
+        self._damage_cache.put(key, layout)
+        return layout
+    
+    @staticmethod
+    def propagate_damage(input_dirty: np.ndarray, layout: DamageLayout) -> np.ndarray:
+        """Return the output tiles affected by a set of changed input tiles."""
+        # Integral image of changed tiles, so each span is four lookups
+        counts = np.zeros((input_dirty.shape[0] + 1, input_dirty.shape[1] + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(input_dirty, axis=0), axis=1, out=counts[1:, 1:])
+        
+        changed = (counts[layout.tile_y1, layout.tile_x1] - counts[layout.tile_y0, layout.tile_x1]
+                   - counts[layout.tile_y1, layout.tile_x0] + counts[layout.tile_y0, layout.tile_x0])
+        return changed > 0
+    
+    @staticmethod
+    def tile_rects(dirty: np.ndarray, width: int, height: int, tile_size: int) -> List[pygame.Rect]:
+        """Return rectangles covering dirty tiles, merging runs within a tile row."""
+        rects = []
+        for tile_y, row in enumerate(dirty):
+            if not row.any():
+                continue
+            y0 = tile_y * tile_size
+            y1 = min(y0 + tile_size, height)
+            
+            # Starts and ends of runs of dirty tiles
+            edges = np.diff(np.concatenate(([0], row.view(np.int8), [0])))
+            for start, end in zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]):
+                x0 = start * tile_size
+                x1 = min(end * tile_size, width)
+                rects.append(pygame.Rect(x0, y0, x1 - x0, y1 - y0))
+        return rects
+    
+    def _render_dirty_tiles(self, surface: pygame.Surface, result: pygame.Surface,
+                            dirty: np.ndarray, tile_size: int) -> None:
+        """Rerender only the given output tiles of result."""
+        width, height = surface.get_size()
+        mask = self.get_gain_mask(width, height)
+        
+        source_pixels = pygame.surfarray.pixels3d(surface)
+        target_pixels = pygame.surfarray.pixels3d(result)
+        source = source_pixels.transpose(1, 0, 2)
+        target = target_pixels.transpose(1, 0, 2)
+        
+        jobs = []
+        for tile_y, tile_x in zip(*np.nonzero(dirty)):
+            y0, x0 = int(tile_y) * tile_size, int(tile_x) * tile_size
+            region = self.get_region(width, height, x0, y0,
+                                     min(x0 + tile_size, width), min(y0 + tile_size, height))
+            jobs.append((source, target, region, mask))
+        self._run_jobs(self._render_tile, jobs)
+        
+        del jobs, source, target
+        del source_pixels
+        del target_pixels
+    
+    def apply_effects_incremental(self, surface: pygame.Surface) -> Tuple[pygame.Surface, Optional[List[pygame.Rect]]]:
+        """
+        Apply all CRT effects, rerendering only tiles whose inputs changed.
+        
+        Output goes to the ring of output_buffers persistent surfaces, so a
+        consumer may keep using a returned surface until that many more frames
+        have been rendered. Returns the surface and the rectangles that differ
+        from the previous output, or None if all of it may differ, or
+        (None, None) if every output is lent. The pixels match
+        apply_effects_fused exactly.
+        """
+        width, height = surface.get_size()
+        tile_size = self.damage_tracker.tile_size
+        input_dirty = self.damage_tracker.update(surface)
+        
+        result = self._next_output(width, height)
+        if result is None:
+            return None, None
+        index = self._output_index
+        
+        state = (width, height, self.reference_width, self.curvature, self.chromatic_aberration,
+                 self.scanline_intensity, self.vignette_intensity, tile_size)
+        layout = self.get_damage_layout(width, height, tile_size)
+        
+        if input_dirty is None or state != self._incremental_state:
+            # Render everything, and treat the other buffers as fully stale
+            self._incremental_state = state
+            self._incremental_frame = 0
+            self._output_frames = [None] * len(self._outputs)
+            self._output_frames[index] = 0
+            self._damage_history = deque(maxlen=2 * len(self._outputs))
+            self._render_frame(surface, result)
+            return result, None
+        
+        output_dirty = self.propagate_damage(input_dirty, layout)
+        self._incremental_frame += 1
+        self._damage_history.append(output_dirty)
+        
+        # This buffer needs every change since the frame it last received
+        last = self._output_frames[index]
+        behind = None if last is None else self._incremental_frame - last
+        if behind is None or behind > len(self._damage_history):
+            stale = np.ones(layout.tile_y0.shape, dtype=bool)
+        else:
+            stale = np.logical_or.reduce(list(self._damage_history)[-behind:])
+        self._output_frames[index] = self._incremental_frame
+        if stale.any():
+            self._render_dirty_tiles(surface, result, stale, tile_size)
+        return result, self.tile_rects(output_dirty, width, height, tile_size)
+    
+    def apply_effects_chain(self, surface: pygame.Surface, scanlines: bool = True) -> pygame.Surface:
+        """Apply all CRT effects one surface at a time."""
+        result = self.apply_chromatic_aberration(surface)
+        result = self.apply_curvature(result)
+        self.apply_gain_mask(result, scanlines)
         return result
     
-    def process_frame(self, surface: pygame.Surface) -> pygame.Surface:
+    def apply_effects(self, surface: pygame.Surface) -> Optional[pygame.Surface]:
+        """
+        Apply all CRT effects to the surface.
+        
+        The result belongs to the output ring (see output_buffers); None means
+        every output is lent. With the fused pipeline, no large buffer is
+        allocated once the ring and the scratch buffers for this size exist.
+        """
+        width, height = surface.get_size()
+        result = self._next_output(width, height)
+        if result is None:
+            return None
+        if self._scaled():
+            # Process at lower resolution for better performance; scanlines
+            # are added at output resolution so upscaling cannot blur them
+            factor = self._integer_factor()
+            if self.scale_quality == 'fast' and factor and min(width, height) >= factor \
+                    and surface.get_bytesize() == 4:
+                return self._apply_effects_box_scaled(surface, factor, result)
+            return self._apply_effects_smooth_scaled(surface, result)
+        
+        # Full resolution processing
+        return self._render_into(surface, result)
+    
+    def _apply_effects_smooth_scaled(self, surface: pygame.Surface,
+                                     result: pygame.Surface) -> pygame.Surface:
+        """Apply effects at processing_scale, resampling both ways with smoothscale."""
+        width, height = surface.get_size()
+        scale = self.processing_scale
+        small_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        
+        if surface.get_bytesize() == 4:
+            # The downscale keeps the input's byte order, so it needs its masks
+            small_surface = self.pool.acquire_surface(small_size, surface.get_masks())
+            pygame.transform.smoothscale(surface, small_size, small_surface)
+        else:
+            small_surface = pygame.transform.smoothscale(surface, small_size)
+        filtered_small = self.pool.acquire_surface(small_size)
+        filtered = self._render_into(small_surface, filtered_small, scanlines=False)
+        
+        pygame.transform.smoothscale(filtered, (width, height), result)
+        self.pool.release_surface(small_surface)
+        self.pool.release_surface(filtered_small)
+        self._darken_scanline_rows(result)
+        return result
+    
+    def _integer_factor(self) -> int:
+        """Return the downscale factor if processing_scale is 1/n, else 0."""
+        factor = round(1.0 / self.processing_scale)
+        if factor >= 2 and abs(factor * self.processing_scale - 1.0) < 0.02:
+            return factor
+        return 0
+    
+    def get_scale_workspace(self, width: int, height: int, factor: int) -> ScaleWorkspace:
+        """Return the integer-factor scaling buffers for the given size."""
+        key = (width, height, factor)
+        workspace = self._scale_cache.get(key)
+        if workspace is None:
+            workspace = ScaleWorkspace(width, height, factor)
+            self._scale_cache.put(key, workspace)
+        return workspace
+    
+    def _darken_scanline_rows(self, surface: pygame.Surface) -> None:
+        """Apply the scanline gain to every other row of an output frame."""
+        gain = self.scanline_gain()
+        if gain == 256:
+            return
+        if surface.get_bytesize() != 4:
+            self._multiply_by_mask(surface, self.get_gain_mask(*surface.get_size(), vignette=False))
+            return
+        pixels = pygame.surfarray.pixels2d(surface)
+        rows = pixels.T.view(np.uint8)[::2]
+        shaded = self.pool.acquire_array(rows.shape, np.uint16)
+        np.multiply(rows, gain, out=shaded, dtype=np.uint16)
+        shaded >>= 8
+        np.copyto(rows, shaded, casting='unsafe')
+        self.pool.release_array(shaded)
+        del rows
+        del pixels
+    
+    def _box_downsample(self, surface: pygame.Surface, workspace: ScaleWorkspace) -> None:
+        """
+        Average factor x factor blocks of surface into workspace.small.
+        
+        Works on the raw BGRX bytes so every NumPy loop runs along whole rows:
+        rows are summed into uint16 lanes, then each pixel's four lanes are
+        added as one uint64.
+        """
+        factor = workspace.factor
+        rows, cols = workspace.small_height * factor, workspace.small_width * factor
+        source_pixels = pygame.surfarray.pixels2d(surface)
+        source = source_pixels.T[:rows, :cols].view(np.uint8)
+        
+        row_sums = workspace.row_sums
+        np.add(source[0::factor], source[1::factor], out=row_sums, dtype=np.uint16)
+        for dy in range(2, factor):
+            np.add(row_sums, source[dy::factor], out=row_sums, dtype=np.uint16)
+        
+        pixel_sums = row_sums.view(np.uint64)
+        block_sums = workspace.block_sums
+        np.add(pixel_sums[:, 0::factor], pixel_sums[:, 1::factor], out=block_sums)
+        for dx in range(2, factor):
+            np.add(block_sums, pixel_sums[:, dx::factor], out=block_sums)
+        
+        # Lanes hold at most 255 * 9, so they never carry into each other
+        lanes = block_sums.view(np.uint16)
+        lanes += np.uint16(factor * factor // 2)
+        if factor == 2:
+            lanes >>= 2
+        else:
+            lanes //= np.uint16(factor * factor)
+        
+        small_pixels = pygame.surfarray.pixels2d(workspace.small)
+        np.copyto(small_pixels.T.view(np.uint8), lanes, casting='unsafe')
+        del source
+        del source_pixels
+        del small_pixels
+    
+    def _repeat_upsample(self, filtered: pygame.Surface, result: pygame.Surface,
+                         workspace: ScaleWorkspace) -> None:
+        """
+        Repeat each filtered pixel factor x factor times into result.
+        
+        Rows darkened by scanlines take their pixels from the darkened copy,
+        so the scanline pattern lands on output rows. Output rows and columns
+        beyond a whole number of blocks repeat the last block.
+        """
+        factor = workspace.factor
+        rows, cols = workspace.small_height * factor, workspace.small_width * factor
+        filtered_pixels = pygame.surfarray.pixels2d(filtered)
+        target_pixels = pygame.surfarray.pixels2d(result)
+        small = filtered_pixels.T
+        target = target_pixels.T
+        
+        gain = self.scanline_gain()
+        if gain == 256:
+            dark = small
+        else:
+            dark = workspace.dark
+            product = workspace.dark_product
+            np.multiply(small.view(np.uint8), gain, out=product, dtype=np.uint16)
+            product >>= 8
+            np.copyto(dark.view(np.uint8), product, casting='unsafe')
+        
+        # Output row dy + factor * k is darkened when it is even
+        for dy in range(factor):
+            block_rows = target[dy:rows:factor]
+            for dx in range(factor):
+                block = block_rows[:, dx:cols:factor]
+                if factor % 2 == 0:
+                    block[:] = dark if dy % 2 == 0 else small
+                else:
+                    block[dy % 2::2] = dark[dy % 2::2]
+                    block[1 - dy % 2::2] = small[1 - dy % 2::2]
+        
+        if cols < target.shape[1]:
+            target[:rows, cols:] = target[:rows, cols - 1:cols]
+        for y in range(rows, target.shape[0]):
+            # Copy the last full row with the same scanline parity
+            target[y] = target[rows - 2 + (y - rows) % 2]
+        
+        del small, target, dark
+        del filtered_pixels
+        del target_pixels
+    
+    def _apply_effects_box_scaled(self, surface: pygame.Surface, factor: int,
+                                  result: pygame.Surface) -> pygame.Surface:
+        """Apply effects at 1/factor size with box downsampling and pixel repetition."""
+        width, height = surface.get_size()
+        workspace = self.get_scale_workspace(width, height, factor)
+        self._box_downsample(surface, workspace)
+        filtered = self._render_into(workspace.small, workspace.filtered, scanlines=False)
+        self._repeat_upsample(filtered, result, workspace)
+        return result
+    
+    def _scaled(self) -> bool:
+        """Return True if effects run below the output resolution."""
+        return self.performance_mode and self.processing_scale < 1.0
+    
+    def _filter_and_remember(self, surface: pygame.Surface) -> Optional[pygame.Surface]:
+        """Filter a frame, keep it as prev_frame, record its damage and lend it."""
+        if self.incremental and self.fused_pipeline and not self._scaled():
+            filtered_surface, self.last_damage_rects = self.apply_effects_incremental(surface)
+        else:
+            self.damage_tracker.reset()
+            filtered_surface = self.apply_effects(surface)
+            self.last_damage_rects = None
+        if filtered_surface is None:
+            return None
+        
+        # Ring outputs are not reused until further frames are rendered, or
+        # while lent, so the previous frame needs no copy
+        self.prev_frame = filtered_surface
+        return self._lend_output(filtered_surface)
+    
+    def process_frame(self, surface: pygame.Surface) -> Optional[pygame.Surface]:
         """
         Process a frame with feedback detection and frame buffering.
         
-        Returns the processed surface, handling feedback loops appropriately.
+        Returns the processed surface, handling feedback loops appropriately,
+        or None if output_leases is on and every output is lent.
+        Afterwards last_damage_rects lists the areas that differ from the
+        previous result, or is None if all of it may differ.
         """
         # Check for feedback loop before processing
-        if self.detect_feedback_loop(surface):
+        with self.timings.measure('feedback'):
+            try:
+                signature = self.compute_frame_signature(surface)
+                feedback = self._matches_recent_frames(signature)
+            except Exception:
+                signature = None
+                feedback = False  # If comparison fails, assume no feedback
+        
+        if feedback:
             # Use previous frame if feedback detected
             if self.prev_frame is not None:
                 self.capture_retry_count += 1
                 
                 # If too many retries, pause briefly
                 if self.capture_retry_count > self.max_retries:
-                    import time
-                    time.sleep(0.1)
+                    time.sleep(self.retry_delay)
                     self.capture_retry_count = 0
                 
-                return self.prev_frame
+                self.last_damage_rects = []
+                return self._lend_output(self.prev_frame)
             else:
                 # No previous frame, apply filter anyway
-                filtered_surface = self.apply_effects(surface)
-                self.prev_frame = filtered_surface.copy()
-                return filtered_surface
+                with self.timings.measure('effects'):
+                    return self._filter_and_remember(surface)
         else:
             # No feedback detected, process normally
             self.capture_retry_count = 0
-            self.add_frame_to_buffer(surface.copy())
+            if signature is not None:
+                self._store_signature(signature)
             
             # Apply filter
-            filtered_surface = self.apply_effects(surface)
-            self.prev_frame = filtered_surface.copy()
-            return filtered_surface
+            with self.timings.measure('effects'):
+                return self._filter_and_remember(surface)
@@ -0,0 +1,69 @@
+"""
+Damage Tracker Module
+
+Finds which tiles of the screen changed between consecutive captured frames,
+so mostly-static desktops only need the changed areas refiltered.
+"""
+
+import numpy as np
+import pygame
+from typing import Optional, Tuple
+
+
+class DamageTracker:
+    """Compares each captured frame against the previous one, tile by tile."""
+    
+    def __init__(self, tile_size: int = 64):
+        self.tile_size = tile_size
+        self._previous: Optional[np.ndarray] = None
+        self._changed: Optional[np.ndarray] = None
+    
+    def tile_starts(self, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the first row and first column of each tile row and column."""
+        return np.arange(0, height, self.tile_size), np.arange(0, width, self.tile_size)
+    
+    def grid_shape(self, width: int, height: int) -> Tuple[int, int]:
+        """Return the number of tile rows and tile columns for a frame size."""
+        return -(-height // self.tile_size), -(-width // self.tile_size)
+    
+    def reset(self) -> None:
+        """Forget the previous frame, so the next one counts as fully changed."""
+        self._previous = None
+    
+    def update(self, surface: pygame.Surface) -> Optional[np.ndarray]:
+        """
+        Compare a frame with the previous one and remember it.
+        
+        Returns a (tile rows, tile columns) bool array of changed tiles, or None
+        when there is no comparable previous frame and everything has changed.
+        """
+        if surface.get_bytesize() != 4:
+            self.reset()
+            return None
+        
+        pixels = pygame.surfarray.pixels2d(surface)
+        try:
+            # Compare whole 32-bit pixels in row-major order
+            current = pixels.T
+            previous = self._previous
+            if previous is None or previous.shape != current.shape:
+                self._previous = np.array(current)
+                self._changed = np.empty(current.shape, dtype=bool)
+                return None
+            
+            np.not_equal(current, previous, out=self._changed)
+            rows, cols = self.tile_starts(current.shape[1], current.shape[0])
+            dirty = np.logical_or.reduceat(self._changed, rows, axis=0)
+            dirty = np.logical_or.reduceat(dirty, cols, axis=1)
+            
+            # Remember the new frame, copying only changed tiles when few changed
+            if dirty.mean() > 0.5:
+                np.copyto(previous, current)
+            else:
+                size = self.tile_size
+                for tile_y, tile_x in zip(*np.nonzero(dirty)):
+                    y, x = tile_y * size, tile_x * size
+                    previous[y:y + size, x:x + size] = current[y:y + size, x:x + size]
+            return dirty
+        finally:
+            del pixels
@@ -4,30 +4,206 @@ Filter Engine Module
 Main engine that coordinates screen capture, filtering, and display.
 """
 
+import numpy as np
 import pygame
+import queue
 import sys
+import threading
 import time
-from typing import Dict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+from capture_sources import CaptureSource
+from capture_target import CaptureTarget, RegionTarget
+from config import CONFIG
 from crt_filter import CRTFilter
+from frame_pacer import FramePacer
+from frame_timing import StageTimings, TimingExporter, TimingHud
+from quality_scheduler import QualityScheduler
 from window_manager import WindowManager, get_monitor_refresh_rate
 from screen_capture import ScreenCapture
+from capture_server import SharedMemoryCapture
+from buffer_pool import BufferPool
+from memory_telemetry import MemoryTelemetry
+
+
+class LatestFrameQueue:
+    """
+    Bounded single-slot queue between pipeline stages.
+    
+    Putting a frame while one is still waiting drops the older frame, so the
+    consumer always receives the newest one. on_drop is called with the
+    dropped frame and the frame replacing it, before the new one is queued.
+    A producer that should not run ahead calls wait_until_taken first.
+    """
+    
+    def __init__(self, on_drop: Optional[Callable] = None):
+        self._queue = queue.Queue(maxsize=1)
+        self._taken = threading.Condition()
+        self.on_drop = on_drop
+        self.dropped = 0
+    
+    def put(self, frame) -> None:
+        """Queue a frame, discarding the waiting one if the slot is full."""
+        while True:
+            try:
+                self._queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    stale = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(stale, frame)
+    
+    def waiting(self) -> bool:
+        """Return True if a frame is queued."""
+        return not self._queue.empty()
+    
+    def get(self, timeout: float) -> Optional[object]:
+        """Return the waiting frame, or None if none arrives within timeout."""
+        try:
+            frame = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._taken:
+            self._taken.notify_all()
+        return frame
+    
+    def wait_until_taken(self, timeout: float) -> bool:
+        """Wait until no frame is queued; returns False if one still is after timeout."""
+        with self._taken:
+            return self._taken.wait_for(self._queue.empty, timeout)
+
+
+class PreviewMailbox:
+    """
+    Single-slot mailbox holding the newest preview thumbnail.
+    
+    Posting replaces the slot with one reference assignment, so the engine
+    never waits for the control panel and the panel never sees a partly
+    written thumbnail; thumbnails nobody took are simply replaced.
+    """
+    
+    def __init__(self):
+        self.posted = 0
+        self._latest: Optional[tuple] = None
+    
+    def post(self, thumbnail: np.ndarray) -> None:
+        """Publish a thumbnail, replacing any that was not taken."""
+        self.posted += 1
+        self._latest = (self.posted, thumbnail)
+    
+    def take(self, seen: int = 0) -> Optional[tuple]:
+        """Return (number, thumbnail) if one newer than seen was posted."""
+        latest = self._latest
+        if latest is None or latest[0] <= seen:
+            return None
+        return latest
+
+
+def make_thumbnail(surface: pygame.Surface, max_size: tuple) -> np.ndarray:
+    """Return a strided (height, width, 3) RGB copy of surface within max_size."""
+    width, height = surface.get_size()
+    step = max(1, -(-width // max_size[0]), -(-height // max_size[1]))
+    pixels = pygame.surfarray.pixels3d(surface)
+    thumbnail = np.ascontiguousarray(pixels[::step, ::step].transpose(1, 0, 2))
+    del pixels
+    return thumbnail
+
+
+@dataclass
+class CapturedFrame:
+    """A captured frame and when it was grabbed, on the frame pacer's clock."""
+    surface: pygame.Surface
+    captured_at: float
+
+
+@dataclass
+class FilteredFrame:
+    """A filtered frame and the areas that changed since the previous one."""
+    surface: pygame.Surface
+    rects: Optional[List[pygame.Rect]]  # None when the whole frame changed
+    
+    def absorb(self, older: 'FilteredFrame') -> None:
+        """Take over the damage of an older frame that will never be presented."""
+        if self.rects is None or older.rects is None:
+            self.rects = None
+        else:
+            self.rects = self.rects + older.rects
 
 
 class FilterEngine:
     """Main engine that runs the CRT filter loop."""
     
-    def __init__(self, control_panel, monitor: Dict):
+    def __init__(self, control_panel, monitor: Dict,
+                 capture_source: Union[str, CaptureSource, None] = None,
+                 max_frames: Optional[int] = None,
+                 target: Optional[CaptureTarget] = None):
         self.control_panel = control_panel
         self.monitor = monitor
+        
+        # The overlay, capture and filter cover the target's region, which
+        # defaults to the whole monitor; monitor still sets the refresh rate
+        self.target = target if target is not None else RegionTarget(monitor)
+        region = self.target.region()
+        self._overlay_region = region
         self.running = True
+        self.pipelined = CONFIG.pipelined_loop
+        self.stage_timeout = CONFIG.pipeline_stage_timeout
+        
+        # Stop after presenting this many frames (None runs until closed)
+        self.max_frames = max_frames
+        self.frames_presented = 0
+        self._last_present_ns: Optional[int] = None
+        
+        # Per-stage timings, shown on the overlay HUD and in the control panel
+        self.timings = StageTimings()
+        self.control_panel.stage_timings = self.timings
+        self.show_hud = False
+        self.hud = TimingHud()
+        self._full_redraw = False
+        self.timing_exporter: Optional[TimingExporter] = None
+        if CONFIG.timing_log_path:
+            self.timing_exporter = TimingExporter(CONFIG.timing_log_path)
+        self._exported_at = 0.0
+        
+        # Thumbnails of presented frames for the control panel preview
+        self.preview_mailbox = PreviewMailbox()
+        self.preview_interval = CONFIG.preview_frame_interval
+        self.control_panel.preview_mailbox = self.preview_mailbox
+        
+        if capture_source is None:
+            capture_source = CONFIG.capture_source
+        
+        # Capture surfaces, filter outputs and scratch buffers are checked out
+        # of one pool, so the frame loop stops allocating once warmed up
+        self.pool = BufferPool()
+        
+        # Per-stage allocation accounting, off unless memory_telemetry is set
+        self.memory: Optional[MemoryTelemetry] = None
+        self.control_panel.memory_telemetry = None
+        if CONFIG.memory_telemetry:
+            self.enable_memory_telemetry()
         
         # Initialize components
         self.window_manager = WindowManager()
-        self.screen_capture = ScreenCapture(self.window_manager)
         
         # Setup display
-        self.screen = self.window_manager.setup_overlay_window(monitor)
-        self.clock = pygame.time.Clock()
+        self.screen = self.window_manager.setup_overlay_window(region)
+        
+        # Capture needs the overlay's window ID to hide it, so comes after setup
+        if CONFIG.capture_process:
+            self.screen_capture = SharedMemoryCapture(self.window_manager, region,
+                                                      capture_source)
+            if CONFIG.record_path:
+                print("Recording is not supported with capture_process; not recording")
+        else:
+            self.screen_capture = ScreenCapture(self.window_manager, capture_source, self.pool)
+            self.screen_capture.timings = self.timings
+            if CONFIG.record_path:
+                self.screen_capture.start_recording(CONFIG.record_path, CONFIG.record_codec)
         
         # Get refresh rate
         if sys.platform == 'linux':
@@ -36,9 +212,48 @@ class FilterEngine:
             self.refresh_rate = 60.0
         print(f"Using refresh rate: {self.refresh_rate} Hz")
         
+        # Presents are paced to refresh-period deadlines; the control panel
+        # shows the missed-deadline counts
+        self.pacer = FramePacer(self.refresh_rate)
+        self.control_panel.frame_pacer = self.pacer
+        
         # Create CRT filter
-        self.crt_filter = CRTFilter(monitor['width'], monitor['height'])
+        self.crt_filter = CRTFilter(region['width'], region['height'])
+        self.crt_filter.pool = self.pool
+        self.crt_filter.timings = self.timings
+        self.crt_filter.workers = CONFIG.effect_workers
+        self.crt_filter.incremental = CONFIG.damage_tracking
+        self.crt_filter.damage_tracker.tile_size = CONFIG.damage_tile_size
+        # Presented, queued and in-progress outputs must not share a buffer:
+        # each output is lent until it has been presented or dropped
+        self.crt_filter.output_buffers = 3 if self.pipelined else 1
+        self.crt_filter.output_leases = True
         self._sync_filter_settings()
+        
+        # Trade processing scale and effects for frame rate; the control panel
+        # shows the current level
+        self.quality: Optional[QualityScheduler] = None
+        self.control_panel.quality_scheduler = None
+        if CONFIG.adaptive_quality:
+            self.enable_adaptive_quality()
+    
+    def enable_adaptive_quality(self) -> QualityScheduler:
+        """Start trading processing scale and effects for frame rate."""
+        if self.quality is None:
+            self.quality = QualityScheduler(self.refresh_rate, CONFIG.quality_headroom,
+                                            allow_scaling=self.crt_filter.performance_mode)
+            self._apply_quality()
+            self.control_panel.quality_scheduler = self.quality
+        return self.quality
+    
+    def enable_memory_telemetry(self) -> MemoryTelemetry:
+        """Start accounting each stage's allocations alongside its timings."""
+        if self.memory is None:
+            self.memory = MemoryTelemetry(self.pool)
+            self.memory.start()
+            self.timings.memory = self.memory
+            self.control_panel.memory_telemetry = self.memory
+        return self.memory
     
     def _sync_filter_settings(self) -> None:
         """Sync filter settings from control panel."""
@@ -55,6 +270,20 @@ class FilterEngine:
         # Set control panel's filter reference
         self.control_panel.crt_filter = self.crt_filter
     
+    def _apply_quality(self) -> None:
+        """Pass the scheduler's current level on to the filter."""
+        level = self.quality.level
+        self.crt_filter.set_quality(level.scale, level.suspended)
+    
+    def _update_quality(self, work_ns: int) -> None:
+        """Feed one frame's work time to the quality scheduler."""
+        if self.quality is None:
+            return
+        changed = self.quality.set_allow_scaling(self.crt_filter.performance_mode)
+        changed = self.quality.observe(work_ns / 1e6) or changed
+        if changed:
+            self._apply_quality()
+    
     def handle_keyboard_input(self, event: pygame.event.Event) -> bool:
         """
         Handle keyboard input for filter adjustments.
@@ -93,50 +322,266 @@ class FilterEngine:
         elif event.key == pygame.K_p:
             self.control_panel.perf_var.set(not self.control_panel.perf_var.get())
             self.control_panel.update_filter_params()
+        elif event.key == pygame.K_h:
+            self.show_hud = not self.show_hud
+            # Clear the HUD's area from the overlay when it is hidden
+            self._full_redraw = not self.show_hud
         
         return True
     
+    def _is_running(self) -> bool:
+        """Return True while both the engine and the control panel are active."""
+        return self.control_panel.running and self.running
+    
+    def _handle_events(self) -> None:
+        """Process pending pygame events."""
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.control_panel.running = False
+                break
+            elif event.type == pygame.KEYDOWN:
+                if not self.handle_keyboard_input(event):
+                    break
+    
+    def _follow_target(self) -> None:
+        """Move or resize the overlay when the target's region has changed."""
+        region = self.target.region()
+        if region == self._overlay_region:
+            return
+        
+        if (region['width'], region['height']) != (self._overlay_region['width'],
+                                                   self._overlay_region['height']):
+            self.screen = self.window_manager.resize_overlay(region)
+        else:
+            self.window_manager.move_overlay(region)
+        self._overlay_region = region
+        self._full_redraw = True
+    
+    def _present(self, filtered_surface: pygame.Surface,
+                 rects: Optional[List[pygame.Rect]] = None) -> None:
+        """
+        Draw a filtered frame to the overlay.
+        
+        With rects, only those areas are redrawn. That is only valid while the
+        overlay keeps its contents, so full redraws are used whenever capture
+        hides and restores the overlay.
+        """
+        hud = self.hud.render(self.timings) if self.show_hud else None
+        
+        if rects is None or self.screen_capture.hides_overlay or self._full_redraw:
+            self._full_redraw = False
+            self.screen.fill((0, 0, 0))
+            self.screen.blit(filtered_surface, (0, 0))
+            if hud is not None:
+                self.screen.blit(hud, self.hud.position)
+            with self.timings.measure('flip'):
+                pygame.display.flip()
+            return
+        
+        if hud is not None:
+            # The HUD changes every frame, so redraw the frame beneath it too
+            rects = rects + [self.hud.rect()]
+        if rects:
+            for rect in rects:
+                self.screen.blit(filtered_surface, rect, rect)
+            if hud is not None:
+                self.screen.blit(hud, self.hud.position)
+            with self.timings.measure('flip'):
+                pygame.display.update(rects)
+    
+    def _export_timings(self, force: bool = False) -> None:
+        """Append new timing samples to the log about once a second."""
+        if self.timing_exporter is None:
+            return
+        now = time.perf_counter()
+        if force or now - self._exported_at >= 1.0:
+            self._exported_at = now
+            self.timing_exporter.export(self.timings)
+    
+    def _frame_presented(self, surface: pygame.Surface) -> None:
+        """
+        Count a presented frame, record the interval, publish a preview
+        thumbnail every preview_interval frames and honour max_frames.
+        """
+        now = time.perf_counter_ns()
+        if self._last_present_ns is not None:
+            self.timings.record('frame', now - self._last_present_ns)
+        self._last_present_ns = now
+        if self.memory is not None:
+            self.memory.mark_frame()
+        
+        self._export_timings()
+        
+        if self.preview_interval and self.frames_presented % self.preview_interval == 0:
+            self.preview_mailbox.post(make_thumbnail(surface, CONFIG.preview_size))
+        
+        self.frames_presented += 1
+        if self.max_frames is not None and self.frames_presented >= self.max_frames:
+            self.running = False
+    
     def run(self) -> None:
         """Main filter loop."""
         try:
-            while self.control_panel.running and self.running:
-                # Handle events
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        self.control_panel.running = False
-                        break
-                    elif event.type == pygame.KEYDOWN:
-                        if not self.handle_keyboard_input(event):
-                            break
-                
-                # Capture and process frame
-                screen_surface = self.screen_capture.capture_screen(self.control_panel.selected_monitor)
-                
-                if screen_surface is not None:
-                    # Process frame through CRT filter
-                    filtered_surface = self.crt_filter.process_frame(screen_surface)
-                    
-                    # Update display
-                    self.screen.fill((0, 0, 0))
-                    self.screen.blit(filtered_surface, (0, 0))
-                    pygame.display.flip()
+            if self.pipelined:
+                self._run_pipelined()
+            else:
+                self._run_serial()
+        finally:
+            self.cleanup()
+    
+    def _run_serial(self) -> None:
+        """Capture, filter and present each frame in turn on one thread."""
+        while self._is_running():
+            self._handle_events()
+            
+            # Capture and process frame
+            started = time.perf_counter_ns()
+            with self.timings.measure('capture'):
+                screen_surface = self.screen_capture.capture_region(self.target.region())
+            
+            if screen_surface is None:
+                time.sleep(self.stage_timeout)
+                continue
+            
+            # Process frame through CRT filter
+            with self.timings.measure('filter'):
+                filtered_surface = self.crt_filter.process_frame(screen_surface)
+                self.screen_capture.release_surface(screen_surface)
+            work_ns = time.perf_counter_ns() - started
+            if filtered_surface is None:
+                continue
+            
+            # Hold the frame until its present deadline
+            with self.timings.measure('wait'):
+                self.pacer.wait()
+            
+            started = time.perf_counter_ns()
+            with self.timings.measure('present'):
+                self._follow_target()
+                self._present(filtered_surface, self.crt_filter.last_damage_rects)
+            self._update_quality(work_ns + time.perf_counter_ns() - started)
+            self._frame_presented(filtered_surface)
+            self.crt_filter.release_output(filtered_surface)
+    
+    def _run_pipelined(self) -> None:
+        """
+        Run capture and filtering on their own threads and present here.
+        
+        Stages hand frames over through single-slot queues, so capturing frame
+        N+1 overlaps filtering frame N. Each stage waits for the next to take
+        its previous frame, so the presenter's pace sets every stage's.
+        Presenting stays on this thread because it owns the pygame display,
+        and waits for each present deadline.
+        """
+        captured = LatestFrameQueue(
+            on_drop=lambda stale, frame: self.screen_capture.release_surface(stale.surface))
+        filtered = LatestFrameQueue(on_drop=self._drop_filtered)
+        
+        stages = [
+            threading.Thread(target=self._capture_stage, args=(captured,),
+                             name='crt-capture', daemon=True),
+            threading.Thread(target=self._filter_stage, args=(captured, filtered),
+                             name='crt-filter', daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        
+        try:
+            while self._is_running():
+                self._handle_events()
                 
-                # Control frame rate
-                self.clock.tick(self.refresh_rate)
+                filtered_frame = filtered.get(timeout=self.stage_timeout)
+                if filtered_frame is None:
+                    continue
                 
+                with self.timings.measure('wait'):
+                    self.pacer.wait()
+                with self.timings.measure('present'):
+                    self._follow_target()
+                    self._present(filtered_frame.surface, filtered_frame.rects)
+                self._frame_presented(filtered_frame.surface)
+                self.crt_filter.release_output(filtered_frame.surface)
         finally:
-            self.cleanup()
+            self.running = False
+            for stage in stages:
+                stage.join()
+    
+    def _drop_filtered(self, stale: 'FilteredFrame', frame: 'FilteredFrame') -> None:
+        """Merge a filtered frame that was never presented into its successor."""
+        frame.absorb(stale)
+        self.crt_filter.release_output(stale.surface)
+    
+    def _capture_stage(self, captured: LatestFrameQueue) -> None:
+        """
+        Pipeline stage: grab frames and queue them for filtering.
+        
+        The next grab waits until the filter stage has taken the previous
+        frame. The filter in turn waits for a free output, which only
+        presenting returns, so capture runs at the presented frame rate
+        instead of grabbing - and hiding the overlay - flat out.
+        """
+        while self._is_running():
+            if not captured.wait_until_taken(self.stage_timeout):
+                continue
+            with self.timings.measure('capture'):
+                screen_surface = self.screen_capture.capture_region(self.target.region())
+            if screen_surface is not None:
+                captured.put(CapturedFrame(screen_surface, self.pacer.clock()))
+            else:
+                time.sleep(self.stage_timeout)
+    
+    def _filter_stage(self, captured: LatestFrameQueue, filtered: LatestFrameQueue) -> None:
+        """
+        Pipeline stage: filter the newest captured frame and queue it.
+        
+        A frame that waited too long to be picked up is dropped unfiltered
+        only if a newer one has been queued meanwhile; otherwise filtering it
+        still beats waiting idle for the next grab.
+        """
+        while self._is_running():
+            # Only filter once the presenter has taken the last result and an
+            # output is neither queued nor on screen
+            if not filtered.wait_until_taken(self.stage_timeout):
+                continue
+            if not self.crt_filter.wait_for_output(self.stage_timeout):
+                continue
+            captured_frame = captured.get(timeout=self.stage_timeout)
+            if captured_frame is None:
+                continue
+            screen_surface = captured_frame.surface
+            if self.pacer.skip_stale(captured_frame.captured_at, captured.waiting()):
+                self.screen_capture.release_surface(screen_surface)
+                continue
+            
+            # Filtering is the slowest stage, so it sets the pipeline's frame rate
+            started = time.perf_counter_ns()
+            with self.timings.measure('filter'):
+                filtered_surface = self.crt_filter.process_frame(screen_surface)
+                self.screen_capture.release_surface(screen_surface)
+            if filtered_surface is None:
+                continue
+            self._update_quality(time.perf_counter_ns() - started)
+            filtered.put(FilteredFrame(filtered_surface, self.crt_filter.last_damage_rects))
     
     def cleanup(self) -> None:
         """Clean up resources."""
+        if self.timing_exporter is not None:
+            self._export_timings(force=True)
+            self.timing_exporter.close()
         self.screen_capture.close()
+        self.crt_filter.close()
+        self.window_manager.close()
+        self.target.close()
+        if self.memory is not None:
+            self.memory.stop()
 
 
-def run_filter(control_panel, monitor: Dict) -> None:
+def run_filter(control_panel, monitor: Dict, target: Optional[CaptureTarget] = None) -> None:
     """
     Main entry point for running the CRT filter.
     
-    This function creates and runs the FilterEngine.
+    This function creates and runs the FilterEngine, covering target (a
+    region or window on monitor) or else the whole monitor.
     """
-    engine = FilterEngine(control_panel, monitor)
+    engine = FilterEngine(control_panel, monitor, target=target)
     engine.run()
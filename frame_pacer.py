@@ -0,0 +1,122 @@
+"""
+Frame Pacer Module
+
+Plans presents against deadlines spaced one refresh period apart, sleeping
+precisely up to each one, resynchronising after late frames instead of
+bursting to catch up, and recognising captured frames too stale to filter
+when a newer one is ready.
+"""
+
+import time
+from typing import Callable, Optional
+from config import CONFIG
+
+
+class FramePacer:
+    """
+    Waits for vblank-aligned present deadlines and counts the ones missed.
+    
+    Deadlines lie on a grid of refresh periods anchored at the first present,
+    which pygame cannot tie to the real vertical blank, so the grid keeps the
+    monitor's rate and a constant phase. wait() sleeps until spin_margin before
+    the deadline and spins the rest, yielding the GIL on every pass. A frame
+    that is ready after its deadline is presented at once and the grid
+    continues from the vblank it missed, so one late frame never causes a
+    burst of catch-up presents.
+    """
+    
+    def __init__(self, refresh_rate: float, spin_margin: Optional[float] = None,
+                 stale_periods: Optional[float] = None,
+                 clock: Callable[[], float] = time.perf_counter,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.spin_margin = CONFIG.pacing_spin_margin if spin_margin is None else spin_margin
+        self.stale_periods = CONFIG.stale_frame_periods if stale_periods is None else stale_periods
+        self.clock = clock
+        self.sleep = sleep
+        
+        # Presents that waited for their deadline, and ones that came too late
+        self.deadlines_met = 0
+        self.deadlines_missed = 0
+        # Whole refresh periods that passed without a present
+        self.vblanks_skipped = 0
+        # Captured frames dropped before filtering because they were stale
+        # and a newer one was waiting
+        self.stale_frames = 0
+        
+        self.period = 0.0
+        self._deadline: Optional[float] = None
+        self.set_refresh_rate(refresh_rate)
+    
+    def set_refresh_rate(self, refresh_rate: float) -> None:
+        """Change the deadline spacing; 0 disables pacing."""
+        self.period = 1.0 / refresh_rate if refresh_rate > 0 else 0.0
+        self._deadline = None
+    
+    def next_deadline(self) -> Optional[float]:
+        """Return the deadline wait() is aiming for, or None before the first present."""
+        if self._deadline is None or not self.period:
+            return None
+        return self._deadline + self.period
+    
+    def wait(self) -> bool:
+        """
+        Block until the next present deadline.
+        
+        Returns False without waiting if the deadline has already passed.
+        """
+        if not self.period:
+            return True
+        
+        now = self.clock()
+        if self._deadline is None:
+            # The first present anchors the grid
+            self._deadline = now
+            return True
+        
+        deadline = self._deadline + self.period
+        if now > deadline:
+            skipped = int((now - deadline) // self.period)
+            self.deadlines_missed += 1
+            self.vblanks_skipped += skipped
+            self._deadline = deadline + skipped * self.period
+            return False
+        
+        self._sleep_until(deadline)
+        self._deadline = deadline
+        self.deadlines_met += 1
+        return True
+    
+    def _sleep_until(self, deadline: float) -> None:
+        """Sleep coarsely, then spin the last spin_margin seconds."""
+        remaining = deadline - self.clock()
+        if remaining > self.spin_margin:
+            self.sleep(remaining - self.spin_margin)
+        while self.clock() < deadline:
+            # sleep(0) releases the GIL so pipeline threads keep running
+            self.sleep(0)
+    
+    def is_stale(self, captured_at: float) -> bool:
+        """Return True if a frame captured at captured_at is too old to filter."""
+        if not self.period:
+            return False
+        return self.clock() - captured_at > self.stale_periods * self.period
+    
+    def skip_stale(self, captured_at: float, newer_waiting: bool) -> bool:
+        """
+        Return True if a frame should be dropped unfiltered, counting it.
+        
+        Only a stale frame with a newer one already waiting is dropped; when
+        capture is slower than the stale threshold, an old frame still beats
+        filtering nothing until the next grab.
+        """
+        stale = newer_waiting and self.is_stale(captured_at)
+        if stale:
+            self.stale_frames += 1
+        return stale
+    
+    def describe(self) -> str:
+        """Return the deadline counters for display."""
+        presents = self.deadlines_met + self.deadlines_missed
+        return (f"Deadlines missed: {self.deadlines_missed}/{presents}, "
+                f"vblanks skipped: {self.vblanks_skipped}, "
+                f"stale frames skipped: {self.stale_frames}")
@@ -0,0 +1,272 @@
+"""
+Frame Recording Module
+
+Records captured frames with their timestamps to a compact file and replays
+them as a capture source, so performance problems can be reproduced with the
+exact frames a user saw.
+
+File layout: a header (magic, version, width, height, flags) followed by one
+record per frame (timestamp, codec, payload length) and its payload, padded
+to 8 bytes so raw payloads can be read in place. Codecs are raw BGRX pixels,
+zlib-compressed pixels, or the zlib-compressed XOR against the previous frame.
+"""
+
+import mmap
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+import pygame
+from typing import Dict, List, Optional
+from capture_sources import CaptureSource
+
+MAGIC = b'CRTREC\x00\x01'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sIIII')    # magic, version, width, height, flags
+RECORD_HEADER = struct.Struct('<dB7xQ')   # timestamp, codec, payload length
+ALIGNMENT = 8
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_DELTA = 2
+CODECS = {'raw': CODEC_RAW, 'zlib': CODEC_ZLIB, 'delta': CODEC_DELTA}
+
+# Delta frames refer back to the previous frame; a full frame every so often
+# bounds how much is lost if a record is damaged
+KEYFRAME_INTERVAL = 120
+ZLIB_LEVEL = 1
+
+
+def _padding(length: int) -> int:
+    """Return the bytes needed to pad a payload to the record alignment."""
+    return -length % ALIGNMENT
+
+
+class FrameRecorder:
+    """
+    Streams frames to a recording file from a background writer thread.
+    
+    write copies the frame into a pooled buffer and returns immediately;
+    encoding and disk writes happen on the writer thread. When the writer falls
+    behind by more than max_pending frames, new frames are dropped rather than
+    slowing capture down.
+    """
+    
+    def __init__(self, path: str, width: int, height: int, codec: str = 'zlib',
+                 max_pending: int = 8):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown recording codec: {codec}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.codec = CODECS[codec]
+        self.frames_written = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, width, height, 0))
+        self._start: Optional[float] = None
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._free: List[np.ndarray] = [np.empty((height, width), dtype=np.uint32)
+                                        for _ in range(max_pending + 1)]
+        self._free_lock = threading.Lock()
+        self._previous: Optional[np.ndarray] = None
+        self._scratch: Optional[np.ndarray] = None
+        self._thread = threading.Thread(target=self._write_frames, name='crt-recorder',
+                                        daemon=True)
+        self._thread.start()
+    
+    def write(self, surface: pygame.Surface, timestamp: Optional[float] = None) -> bool:
+        """
+        Queue a copy of a frame for writing.
+        
+        Returns False if the frame was dropped because the writer is behind or
+        the frame has the wrong size.
+        """
+        if surface.get_size() != (self.width, self.height):
+            self.dropped += 1
+            return False
+        with self._free_lock:
+            buffer = self._free.pop() if self._free else None
+        if buffer is None:
+            self.dropped += 1
+            return False
+        
+        pixels = pygame.surfarray.pixels2d(surface)
+        np.copyto(buffer, pixels.T)
+        del pixels
+        
+        now = time.perf_counter() if timestamp is None else timestamp
+        if self._start is None:
+            self._start = now
+        try:
+            self._pending.put_nowait((now - self._start, buffer))
+        except queue.Full:
+            self._recycle(buffer)
+            self.dropped += 1
+            return False
+        return True
+    
+    def _recycle(self, buffer: np.ndarray) -> None:
+        """Return a frame buffer to the pool."""
+        with self._free_lock:
+            self._free.append(buffer)
+    
+    def _encode(self, frame: np.ndarray) -> tuple:
+        """Return (codec, payload) for a frame, updating the delta reference."""
+        codec = self.codec
+        if codec == CODEC_RAW:
+            return codec, frame
+        if codec == CODEC_DELTA and self._previous is not None \
+                and self.frames_written % KEYFRAME_INTERVAL:
+            np.bitwise_xor(frame, self._previous, out=self._scratch)
+            payload = zlib.compress(self._scratch, ZLIB_LEVEL)
+        else:
+            codec = CODEC_ZLIB
+            payload = zlib.compress(frame, ZLIB_LEVEL)
+        
+        if self.codec == CODEC_DELTA:
+            if self._previous is None:
+                self._previous = np.empty_like(frame)
+                self._scratch = np.empty_like(frame)
+            np.copyto(self._previous, frame)
+        return codec, payload
+    
+    def _write_frames(self) -> None:
+        """Writer thread: encode and append queued frames until closed."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            timestamp, frame = item
+            try:
+                codec, payload = self._encode(frame)
+                length = memoryview(payload).nbytes
+                self._file.write(RECORD_HEADER.pack(timestamp, codec, length))
+                self._file.write(payload)
+                self._file.write(b'\0' * _padding(length))
+                self.bytes_written += RECORD_HEADER.size + length + _padding(length)
+                self.frames_written += 1
+            finally:
+                self._recycle(frame)
+    
+    def close(self) -> None:
+        """Write out every queued frame and close the file."""
+        if self._thread is None:
+            return
+        self._pending.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+
+class ReplaySource(CaptureSource):
+    """
+    Capture source that plays back a recording through a memory map.
+    
+    With realtime set, each grab waits until its frame's recorded time, so the
+    engine sees the original frame timing; otherwise frames are returned as
+    fast as they are requested. Playback loops at the end of the recording.
+    """
+    
+    name = 'replay'
+    needs_overlay_hidden = False
+    
+    def __init__(self, path: str, realtime: bool = True, loop: bool = True):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, _ = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a frame recording")
+        
+        self.timestamps, self.codecs, self.offsets, self.lengths = self._index()
+        if not self.offsets:
+            self.close()
+            raise ValueError(f"{path} contains no frames")
+        
+        self.frame_index = 0
+        self._frame = np.zeros((self.height, self.width), dtype=np.uint32)
+        self._clock_start: Optional[float] = None
+    
+    def _index(self) -> tuple:
+        """Scan record headers, stopping at the end or at a truncated record."""
+        timestamps, codecs, offsets, lengths = [], [], [], []
+        offset = FILE_HEADER.size
+        size = len(self._map)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, codec, length = RECORD_HEADER.unpack_from(self._map, offset)
+            payload = offset + RECORD_HEADER.size
+            if payload + length > size:
+                break
+            timestamps.append(timestamp)
+            codecs.append(codec)
+            offsets.append(payload)
+            lengths.append(length)
+            offset = payload + length + _padding(length)
+        return timestamps, codecs, offsets, lengths
+    
+    @property
+    def frame_count(self) -> int:
+        return len(self.offsets)
+    
+    def monitors(self) -> List[Dict]:
+        region = {'left': 0, 'top': 0, 'width': self.width, 'height': self.height}
+        return [region, dict(region)]
+    
+    def _decode(self, index: int) -> None:
+        """Decode a frame into the current-frame buffer."""
+        codec, offset, length = self.codecs[index], self.offsets[index], self.lengths[index]
+        frame = self._frame
+        if codec == CODEC_RAW:
+            frame.reshape(-1)[:] = np.frombuffer(self._map, dtype=np.uint32,
+                                                 count=frame.size, offset=offset)
+            return
+        
+        data = zlib.decompress(memoryview(self._map)[offset:offset + length])
+        decoded = np.frombuffer(data, dtype=np.uint32).reshape(frame.shape)
+        if codec == CODEC_DELTA:
+            np.bitwise_xor(frame, decoded, out=frame)
+        else:
+            frame[:] = decoded
+    
+    def _wait_for(self, index: int) -> None:
+        """Sleep until a frame's recorded time relative to playback start."""
+        now = time.perf_counter()
+        if index == 0 or self._clock_start is None:
+            self._clock_start = now - self.timestamps[index]
+            return
+        delay = self._clock_start + self.timestamps[index] - now
+        if delay > 0:
+            time.sleep(delay)
+    
+    def grab_into(self, region: Dict, pixels: np.ndarray) -> None:
+        if self.frame_index >= self.frame_count:
+            if not self.loop:
+                raise EOFError("end of recording")
+            self.frame_index = 0
+        
+        index = self.frame_index
+        self._decode(index)
+        if self.realtime:
+            self._wait_for(index)
+        self.frame_index += 1
+        
+        top, left = region['top'], region['left']
+        view = self._frame[top:top + region['height'], left:left + region['width']]
+        if view.shape != pixels.shape:
+            pixels.fill(0)
+        pixels[:view.shape[0], :view.shape[1]] = view
+    
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
@@ -0,0 +1,245 @@
+"""
+Frame Timing Module
+
+Records how long each stage of the filter loop takes, in wall-clock and
+thread CPU time, into fixed-size ring buffers, and presents the results as an
+overlay HUD, a text table or an exported log.
+"""
+
+import csv
+import json
+import threading
+import time
+import numpy as np
+import pygame
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Stages in the order they happen in a frame; others are listed after them
+STAGE_ORDER = ('capture', 'hide', 'grab', 'restore', 'filter', 'feedback', 'effects',
+               'present', 'flip', 'wait')
+
+
+class StageTimings:
+    """
+    Per-stage ring buffers of wall and CPU durations in nanoseconds.
+    
+    Each stage should be recorded from a single thread; different stages may
+    be recorded from different threads. Only the newest capacity samples of
+    each stage are kept.
+    """
+    
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._wall: Dict[str, np.ndarray] = {}
+        self._cpu: Dict[str, np.ndarray] = {}
+        self._end: Dict[str, np.ndarray] = {}
+        self._count: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        
+        # MemoryTelemetry that measure() also accounts allocations to, if any
+        self.memory = None
+    
+    def _add_stage(self, stage: str, wall_ns: int, cpu_ns: int, end_ns: int) -> None:
+        """
+        Allocate the ring buffers for a stage seen for the first time.
+        
+        The first sample is written before the stage's count appears, so
+        readers on other threads never see a stage without samples.
+        """
+        with self._lock:
+            if stage not in self._count:
+                for buffers, value in ((self._wall, wall_ns), (self._cpu, cpu_ns),
+                                       (self._end, end_ns)):
+                    buffers[stage] = np.zeros(self.capacity, dtype=np.int64)
+                    buffers[stage][0] = value
+                self._count[stage] = 1
+    
+    def record(self, stage: str, wall_ns: int, cpu_ns: int = 0,
+               end_ns: Optional[int] = None) -> None:
+        """Add one sample for a stage that finished at end_ns (default now)."""
+        if end_ns is None:
+            end_ns = time.perf_counter_ns()
+        if stage not in self._count:
+            self._add_stage(stage, wall_ns, cpu_ns, end_ns)
+            return
+        index = self._count[stage] % self.capacity
+        self._wall[stage][index] = wall_ns
+        self._cpu[stage][index] = cpu_ns
+        self._end[stage][index] = end_ns
+        self._count[stage] += 1
+    
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Time the body of a with block as one sample of a stage."""
+        with self.memory.measure(stage) if self.memory is not None else nullcontext():
+            wall_start = time.perf_counter_ns()
+            cpu_start = time.thread_time_ns()
+            try:
+                yield
+            finally:
+                end = time.perf_counter_ns()
+                self.record(stage, end - wall_start, time.thread_time_ns() - cpu_start, end)
+    
+    def stages(self) -> List[str]:
+        """Return the recorded stage names, in frame order where known."""
+        recorded = list(self._count)
+        known = [stage for stage in STAGE_ORDER if stage in recorded]
+        return known + [stage for stage in recorded if stage not in STAGE_ORDER]
+    
+    def count(self, stage: str) -> int:
+        """Return how many samples a stage has recorded in total."""
+        return self._count.get(stage, 0)
+    
+    def samples(self, stage: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the retained (wall, cpu) samples of a stage, oldest first."""
+        _, _, wall, cpu = self.samples_since(stage, 0)
+        return wall, cpu
+    
+    def samples_since(self, stage: str, since: int) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return retained samples numbered since or later, oldest first.
+        
+        Returns (next sample number, end times, wall times, cpu times); pass the
+        first value back in to continue where this call stopped.
+        """
+        count = self._count.get(stage, 0)
+        first = max(since, count - self.capacity)
+        if count <= first:
+            empty = np.zeros(0, dtype=np.int64)
+            return max(since, count), empty, empty, empty
+        order = np.arange(first, count) % self.capacity
+        return count, self._end[stage][order], self._wall[stage][order], self._cpu[stage][order]
+    
+    def summary(self, stage: str) -> Optional[Dict[str, float]]:
+        """Return millisecond statistics for a stage, or None without samples."""
+        wall, cpu = self.samples(stage)
+        if len(wall) == 0:
+            return None
+        wall_ms = wall / 1e6
+        p50, p95, p99 = np.percentile(wall_ms, (50, 95, 99))
+        return {
+            'count': self._count[stage],
+            'mean_ms': float(wall_ms.mean()),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(wall_ms.max()),
+            'cpu_mean_ms': float(cpu.mean() / 1e6),
+            'cpu_total_ms': float(cpu.sum() / 1e6),
+        }
+    
+    def reset(self) -> None:
+        """Forget every sample."""
+        with self._lock:
+            self._wall.clear()
+            self._cpu.clear()
+            self._end.clear()
+            self._count.clear()
+
+
+def format_stage_table(timings: StageTimings) -> List[str]:
+    """Return text lines with fps and p50/p99 wall time per stage."""
+    lines = []
+    frame = timings.summary('frame')
+    if frame is not None and frame['mean_ms'] > 0:
+        lines.append(f"{1000 / frame['mean_ms']:6.1f} fps  frame p50 {frame['p50_ms']:6.2f} "
+                     f"p99 {frame['p99_ms']:6.2f} ms")
+    for stage in timings.stages():
+        if stage == 'frame':
+            continue
+        stats = timings.summary(stage)
+        if stats is None:
+            # Emptied by reset() since stages() listed it
+            continue
+        lines.append(f"{stage:<9} p50 {stats['p50_ms']:6.2f}  p99 {stats['p99_ms']:6.2f} ms")
+    return lines
+
+
+class TimingHud:
+    """
+    Small translucent panel listing fps and stage timings.
+    
+    The panel is re-rendered at most every refresh_interval seconds, so
+    showing it costs little more than one blit per frame.
+    """
+    
+    def __init__(self, refresh_interval: float = 0.25, font_size: int = 16):
+        self.refresh_interval = refresh_interval
+        self.font_size = font_size
+        self.position = (8, 8)
+        self._font: Optional[pygame.font.Font] = None
+        self._surface: Optional[pygame.Surface] = None
+        self._rendered_at = 0.0
+    
+    def render(self, timings: StageTimings) -> pygame.Surface:
+        """Return the HUD panel, re-rendering it if it is stale."""
+        now = time.perf_counter()
+        if self._surface is not None and now - self._rendered_at < self.refresh_interval:
+            return self._surface
+        
+        if self._font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            self._font = pygame.font.Font(None, self.font_size)
+        
+        lines = format_stage_table(timings) or ["waiting for frames"]
+        rendered = [self._font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(line.get_width() for line in rendered) + 12
+        height = sum(line.get_height() for line in rendered) + 12
+        panel = pygame.Surface((width, height))
+        panel.fill((0, 0, 0))
+        panel.set_alpha(200)
+        y = 6
+        for line in rendered:
+            panel.blit(line, (6, y))
+            y += line.get_height()
+        
+        self._surface = panel
+        self._rendered_at = now
+        return panel
+    
+    def rect(self) -> Optional[pygame.Rect]:
+        """Return the area the last rendered panel covers."""
+        if self._surface is None:
+            return None
+        return self._surface.get_rect(topleft=self.position)
+
+
+class TimingExporter:
+    """
+    Appends stage samples to a CSV (.csv) or JSON-lines file.
+    
+    Each export writes only the samples recorded since the previous one, so
+    calling it about once a second loses nothing as long as no stage records
+    more than the ring capacity in between.
+    """
+    
+    FIELDS = ('stage', 'end_ns', 'wall_ns', 'cpu_ns')
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.as_csv = path.lower().endswith('.csv')
+        self._file = open(path, 'w', newline='')
+        self._exported: Dict[str, int] = {}
+        if self.as_csv:
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.FIELDS)
+    
+    def export(self, timings: StageTimings) -> None:
+        """Write the samples recorded since the last export."""
+        for stage in timings.stages():
+            self._exported[stage], ends, wall, cpu = timings.samples_since(
+                stage, self._exported.get(stage, 0))
+            for end_ns, wall_ns, cpu_ns in zip(ends.tolist(), wall.tolist(), cpu.tolist()):
+                if self.as_csv:
+                    self._writer.writerow((stage, end_ns, wall_ns, cpu_ns))
+                else:
+                    self._file.write(json.dumps(dict(zip(self.FIELDS,
+                                                         (stage, end_ns, wall_ns, cpu_ns)))))
+                    self._file.write('\n')
+        self._file.flush()
+    
+    def close(self) -> None:
+        """Close the log file."""
+        self._file.close()
@@ -11,7 +11,13 @@ import pygame
 import threading
 from PIL import Image, ImageTk
 from typing import Optional
+from capture_target import (CaptureTarget, RegionTarget, WindowTarget, clip_region,
+                            list_windows, make_region, monitor_for_region, parse_window_id)
+from config import CONFIG
+from crt_filter import CRTFilter, EffectParameters
 from filter_engine import run_filter
+from frame_timing import format_stage_table
+from memory_telemetry import format_memory_table
 
 
 class ControlPanel:
@@ -22,6 +28,13 @@ class ControlPanel:
         self.selected_monitor = 0
         self.filter_thread: Optional[threading.Thread] = None
         self.crt_filter = None  # Will be set by FilterEngine
+        self.stage_timings = None  # Will be set by FilterEngine
+        self.quality_scheduler = None  # Will be set by FilterEngine
+        self.frame_pacer = None  # Will be set by FilterEngine
+        self.memory_telemetry = None  # Will be set by FilterEngine
+        self.preview_mailbox = None  # Will be set by FilterEngine
+        self._preview_seen = 0
+        self.preview_filter: Optional[CRTFilter] = None
         self.sct = mss.mss()
         self.preview_update_id: Optional[str] = None
         
@@ -66,7 +79,8 @@ class ControlPanel:
             "3/4 - Adjust Curvature (±0.1)",
             "5/6 - Adjust Chromatic Aberration (±0.5)",
             "7/8 - Adjust Vignette (±0.05)",
-            "P - Toggle Performance Mode"
+            "P - Toggle Performance Mode",
+            "H - Show/Hide Timing HUD"
         ]
         
         help_menu.add_command(
@@ -92,12 +106,15 @@ class ControlPanel:
         # Create tabs
         self.target_tab = ttk.Frame(self.notebook)
         self.settings_tab = ttk.Frame(self.notebook)
+        self.stats_tab = ttk.Frame(self.notebook)
         
         self.notebook.add(self.target_tab, text='Select Target')
         self.notebook.add(self.settings_tab, text='Filter Settings')
+        self.notebook.add(self.stats_tab, text='Stats')
         
         self._setup_target_tab()
         self._setup_settings_tab()
+        self._setup_stats_tab()
     
     def _setup_target_tab(self) -> None:
         """Setup the target selection tab."""
@@ -118,13 +135,15 @@ class ControlPanel:
                 command=self._on_monitor_select
             ).pack(anchor='w')
         
+        self._setup_target_area()
+        
         # Start button
         self.start_button = ttk.Button(
-            monitor_frame, 
+            self.target_tab, 
             text="Start Filter", 
             command=self.toggle_filter
         )
-        self.start_button.pack(pady=10)
+        self.start_button.pack(pady=5)
         
         # Preview
         preview_frame = ttk.LabelFrame(self.target_tab, text="Preview", padding=10)
@@ -133,6 +152,70 @@ class ControlPanel:
         self.preview_label = ttk.Label(preview_frame)
         self.preview_label.pack()
     
+    def _setup_target_area(self) -> None:
+        """Setup the choice between the whole monitor, a rectangle and a window."""
+        area_frame = ttk.LabelFrame(self.target_tab, text="Target Area", padding=10)
+        area_frame.pack(fill='x', padx=5, pady=5)
+        
+        self.target_mode_var = tk.StringVar(value='monitor')
+        for text, mode in (("Whole monitor", 'monitor'), ("Rectangle", 'region'),
+                           ("Window", 'window')):
+            ttk.Radiobutton(area_frame, text=text, variable=self.target_mode_var,
+                            value=mode).pack(anchor='w')
+        
+        # Rectangle, relative to the selected monitor
+        region_frame = ttk.Frame(area_frame)
+        region_frame.pack(fill='x', pady=2)
+        self.region_vars = {}
+        for key, default in (('left', 0), ('top', 0), ('width', 640), ('height', 480)):
+            ttk.Label(region_frame, text=key.capitalize()).pack(side='left')
+            self.region_vars[key] = tk.IntVar(value=default)
+            ttk.Entry(region_frame, textvariable=self.region_vars[key],
+                      width=6).pack(side='left', padx=(2, 6))
+        
+        # Window, picked from the list or typed as an X window ID
+        window_frame = ttk.Frame(area_frame)
+        window_frame.pack(fill='x', pady=2)
+        self.window_var = tk.StringVar()
+        self.window_combo = ttk.Combobox(window_frame, textvariable=self.window_var, width=40)
+        self.window_combo.pack(side='left', fill='x', expand=True)
+        ttk.Button(window_frame, text="Refresh",
+                   command=self._refresh_windows).pack(side='left', padx=5)
+        self._refresh_windows()
+        
+        self.target_status = ttk.Label(area_frame, text="")
+        self.target_status.pack(anchor='w')
+    
+    def _refresh_windows(self) -> None:
+        """Fill the window list from the window manager."""
+        self.window_combo['values'] = [f"{window_id:#x} {title}"
+                                       for window_id, title in list_windows()]
+    
+    def _build_target(self, monitor: dict) -> Optional[CaptureTarget]:
+        """
+        Create the capture target chosen in the Select Target tab.
+        
+        Returns None for the whole monitor. Raises ValueError for a region
+        outside the monitor or a window that cannot be found.
+        """
+        mode = self.target_mode_var.get()
+        if mode == 'region':
+            try:
+                values = {key: var.get() for key, var in self.region_vars.items()}
+            except tk.TclError:
+                raise ValueError("Rectangle values must be whole numbers")
+            if values['width'] <= 0 or values['height'] <= 0:
+                raise ValueError("Rectangle must have a positive size")
+            region = make_region(monitor['left'] + values['left'], monitor['top'] + values['top'],
+                                 values['width'], values['height'])
+            clipped = clip_region(region, monitor)
+            if clipped is None:
+                raise ValueError("Rectangle is outside the selected monitor")
+            return RegionTarget(clipped)
+        if mode == 'window':
+            return WindowTarget(parse_window_id(self.window_var.get()), bounds=self.sct.monitors[0])
+        return None
+    
     def _setup_settings_tab(self) -> None:
         """Setup the filter settings tab."""
         # Scanlines
@@ -178,6 +261,38 @@ class ControlPanel:
             variable=self.perf_var,
             command=self.update_filter_params
         ).pack()
+        
+        self.quality_label = ttk.Label(perf_frame)
+        self.quality_label.pack()
+    
+    def _setup_stats_tab(self) -> None:
+        """Setup the frame timing statistics tab."""
+        stats_frame = ttk.LabelFrame(self.stats_tab, text="Frame Timing", padding=10)
+        stats_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        self.stats_label = ttk.Label(stats_frame, font='TkFixedFont', justify='left')
+        self.stats_label.pack(anchor='w')
+        self.update_stats()
+    
+    def update_stats(self) -> None:
+        """Refresh the timing statistics and quality level twice a second."""
+        # Schedule the next refresh first, so one failed refresh cannot stop them
+        self.root.after(500, self.update_stats)
+        
+        if self.running and self.stage_timings is not None:
+            lines = format_stage_table(self.stage_timings) or ["Waiting for frames..."]
+            if self.frame_pacer is not None:
+                lines.append(self.frame_pacer.describe())
+            if self.memory_telemetry is not None:
+                lines.extend(format_memory_table(self.memory_telemetry))
+        else:
+            lines = ["Start the filter to see frame timings."]
+        self.stats_label.configure(text='\n'.join(lines))
+        
+        if self.running and self.quality_scheduler is not None:
+            self.quality_label.configure(text=f"Adaptive quality: {self.quality_scheduler.describe()}")
+        else:
+            self.quality_label.configure(text="")
     
     def _create_setting_frame(self, title: str, initial_value: float, 
                             min_val: float, max_val: float, var_name: str) -> None:
@@ -204,14 +319,19 @@ class ControlPanel:
         self.chromatic_aberration = self.chroma_var.get()
         self.performance_mode = self.perf_var.get()
         
-        if self.crt_filter:
-            self.crt_filter.update_parameters(
-                scanline_intensity=self.scanline_intensity,
-                curvature=self.curvature,
-                vignette_intensity=self.vignette_intensity,
-                chromatic_aberration=self.chromatic_aberration,
-                performance_mode=self.performance_mode
-            )
+        for crt_filter in (self.crt_filter, self.preview_filter):
+            if crt_filter:
+                crt_filter.update_parameters(**self._filter_parameters())
+    
+    def _filter_parameters(self) -> dict:
+        """Return the current effect settings as update_parameters arguments."""
+        return {
+            'scanline_intensity': self.scanline_intensity,
+            'curvature': self.curvature,
+            'vignette_intensity': self.vignette_intensity,
+            'chromatic_aberration': self.chromatic_aberration,
+            'performance_mode': self.performance_mode
+        }
     
     def _on_monitor_select(self) -> None:
         """Handle monitor selection change."""
@@ -219,48 +339,65 @@ class ControlPanel:
         self.selected_monitor = monitor_num
     
     def update_preview(self) -> None:
-        """Update the preview image."""
-        if not self.running and self.preview_update_id:
-            self.preview_update_id = None
-            return
+        """
+        Update the preview image.
         
+        While the filter runs the preview shows the engine's latest filtered
+        thumbnail; the monitor is only captured here while it is stopped.
+        """
         try:
-            monitor = self.sct.monitors[self.selected_monitor + 1]
-            screenshot = self.sct.grab(monitor)
-            
-            # Convert to PIL Image and resize for preview
-            img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-            img.thumbnail((300, 200))
+            if self.running:
+                img = self._take_engine_preview()
+            else:
+                img = self._capture_preview()
             
-            # Apply preview filter if running
-            if self.running and self.crt_filter:
-                img = self._apply_preview_filter(img)
-            
-            # Convert to PhotoImage and update display
-            photo = ImageTk.PhotoImage(img)
-            self.preview_label.configure(image=photo)
-            self.preview_label.image = photo
+            if img is not None:
+                # Convert to PhotoImage and update display
+                photo = ImageTk.PhotoImage(img)
+                self.preview_label.configure(image=photo)
+                self.preview_label.image = photo
             
         except Exception as e:
             print(f"Preview update error: {e}")
         
-        if not self.preview_update_id:
-            self.preview_update_id = self.root.after(100, self.update_preview)
+        self.preview_update_id = self.root.after(CONFIG.preview_update_rate, self.update_preview)
     
-    def _apply_preview_filter(self, img: Image.Image) -> Image.Image:
-        """Apply CRT filter to preview image."""
-        try:
-            # Convert to pygame surface for filtering
-            img_str = img.tobytes()
-            img_surface = pygame.image.fromstring(img_str, img.size, img.mode)
-            filtered_surface = self.crt_filter.apply_effects(img_surface)
-            
-            # Convert back to PIL
-            filtered_str = pygame.image.tostring(filtered_surface, 'RGB')
-            return Image.frombytes('RGB', filtered_surface.get_size(), filtered_str)
-        except Exception as e:
-            print(f"Preview filter error: {e}")
-            return img
+    def _take_engine_preview(self) -> Optional[Image.Image]:
+        """Return the newest thumbnail published by the engine, if there is one."""
+        if self.preview_mailbox is None:
+            return None
+        posted = self.preview_mailbox.take(self._preview_seen)
+        if posted is None:
+            return None
+        self._preview_seen, thumbnail = posted
+        img = Image.fromarray(thumbnail)
+        img.thumbnail(CONFIG.preview_size)
+        return img
+    
+    def _capture_preview(self) -> Image.Image:
+        """Capture the selected monitor and filter it at preview size."""
+        monitor = self.sct.monitors[self.selected_monitor + 1]
+        screenshot = self.sct.grab(monitor)
+        
+        # Convert to PIL Image and resize for preview
+        img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
+        img.thumbnail(CONFIG.preview_size)
+        return self._apply_preview_filter(img, monitor['width'])
+    
+    def _apply_preview_filter(self, img: Image.Image, monitor_width: int) -> Image.Image:
+        """Apply the current settings to a preview image at its own size."""
+        if self.preview_filter is None:
+            parameters = EffectParameters(scale_quality=CONFIG.scale_quality)
+            self.preview_filter = CRTFilter(img.width, img.height, parameters)
+            self.preview_filter.update_parameters(**self._filter_parameters())
+        # Shift colours by as much of the image as on the monitor
+        self.preview_filter.reference_width = monitor_width
+        context = self.preview_filter.get_context(img.width, img.height)
+        
+        surface = pygame.image.fromstring(img.convert('RGBX').tobytes(), img.size, 'RGBX')
+        filtered_surface = context.apply_effects(surface)
+        filtered_str = pygame.image.tostring(filtered_surface, 'RGB')
+        return Image.frombytes('RGB', filtered_surface.get_size(), filtered_str)
     
     def toggle_filter(self) -> None:
         """Start or stop the CRT filter."""
@@ -271,12 +408,25 @@ class ControlPanel:
     
     def _start_filter(self) -> None:
         """Start the CRT filter."""
-        pygame.init()
         monitor = self.sct.monitors[self.selected_monitor + 1]
+        try:
+            target = self._build_target(monitor)
+        except ValueError as e:
+            self.target_status.configure(text=str(e))
+            return
+        if target is None:
+            self.target_status.configure(text="")
+        else:
+            # Refresh rate comes from the monitor the target is on
+            monitor = monitor_for_region(target.region(), self.sct.monitors[1:])
+            self.target_status.configure(text=f"Filtering {target.describe()}")
         
+        pygame.init()
         self.running = True
+        self.preview_mailbox = None
+        self._preview_seen = 0
         self.start_button.configure(text="Stop Filter")
-        self.filter_thread = threading.Thread(target=run_filter, args=(self, monitor))
+        self.filter_thread = threading.Thread(target=run_filter, args=(self, monitor, target))
         self.filter_thread.start()
         self.root.bind('<Escape>', lambda e: self._stop_filter())
     
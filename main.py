@@ -18,6 +18,7 @@ its own output, leading to a black screen or feedback loop.
 import sys
 import signal
 from gui import ControlPanel
+from capture_server import shutdown_capture_servers
 
 
 def main():
@@ -28,6 +29,7 @@ def main():
         """Handle exit signals gracefully."""
         print("\nExiting...")
         control_panel.running = False
+        shutdown_capture_servers()
         try:
             control_panel.root.quit()
         except Exception:
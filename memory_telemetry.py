@@ -0,0 +1,234 @@
+"""
+Memory Telemetry Module
+
+Opt-in accounting of the memory each stage of the filter loop allocates: the
+peak of Python and NumPy allocations traced by tracemalloc above the level a
+stage started at, what the stage left allocated, and the bytes of surfaces and
+arrays the buffer pool had to create, which tracemalloc misses because SDL
+allocates surface pixels itself. Peak RSS comes from the operating system.
+"""
+
+import sys
+import threading
+import tracemalloc
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from config import CONFIG
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Return the process's peak resident set size, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def frame_allocation_budget(width: int, height: int, bytes_per_pixel: Optional[float] = None,
+                            base: Optional[int] = None) -> int:
+    """Return the most a steady-state frame of this size may allocate, in bytes."""
+    if bytes_per_pixel is None:
+        bytes_per_pixel = CONFIG.frame_allocation_budget
+    if base is None:
+        base = CONFIG.frame_allocation_base
+    return int(base + width * height * bytes_per_pixel)
+
+
+def format_bytes(count: float) -> str:
+    """Format a byte count with a binary unit."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(count) < 1024:
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.2f} GiB"
+
+
+class _Measurement:
+    """Traced level, highest traced level and pool total while a stage runs."""
+    
+    __slots__ = ('start', 'peak', 'pool_start')
+    
+    def __init__(self, start: int, pool_start: int):
+        self.start = start
+        self.peak = start
+        self.pool_start = pool_start
+
+
+class MemoryTelemetry:
+    """
+    Per-stage ring buffers of transient, retained and pool-allocated bytes.
+    
+    A sample's transient bytes are the traced peak above the level the stage
+    started at; its allocated bytes add what the pool created for it. The
+    'frame' stage spans one present to the next. tracemalloc keeps a single
+    process-wide peak, so every open measurement takes its share of the peak
+    before a new one resets it; nested stages such as grab within capture
+    both see it. Stages running on other threads count towards each other's
+    peaks, so the serial loop attributes memory exactly and the pipelined
+    loop only roughly. Tracing slows allocation-heavy code severalfold.
+    """
+    
+    # Columns of each stage's samples
+    FIELDS = ('transient', 'retained', 'pool')
+    
+    def __init__(self, pool=None, capacity: int = 1024):
+        self.pool = pool
+        self.capacity = capacity
+        self._samples: Dict[str, np.ndarray] = {}
+        self._count: Dict[str, int] = {}
+        self._open: List[_Measurement] = []
+        self._frame: Optional[_Measurement] = None
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        
+        # Highest traced total seen, and the traced total when tracing stopped
+        self.traced_peak = 0
+        self._traced_at_stop = 0
+    
+    def start(self) -> None:
+        """Start tracing allocations unless something already is."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+    
+    def stop(self) -> None:
+        """Stop tracing if start() started it; recorded samples are kept."""
+        with self._lock:
+            self._open.clear()
+            self._frame = None
+            self._traced_at_stop = tracemalloc.get_traced_memory()[0]
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+    
+    def _pool_bytes(self) -> int:
+        return self.pool.allocated_bytes if self.pool is not None else 0
+    
+    def _fold_peak(self) -> int:
+        """Pass the traced peak to every open measurement; returns the current total."""
+        current, peak = tracemalloc.get_traced_memory()
+        for measurement in self._open:
+            measurement.peak = max(measurement.peak, peak)
+        self.traced_peak = max(self.traced_peak, peak)
+        return current
+    
+    def _begin(self) -> _Measurement:
+        """Open a measurement at the current traced level; call with the lock held."""
+        current = self._fold_peak()
+        tracemalloc.reset_peak()
+        measurement = _Measurement(current, self._pool_bytes())
+        self._open.append(measurement)
+        return measurement
+    
+    def _end(self, stage: str, measurement: _Measurement) -> None:
+        """Close a measurement and record it; call with the lock held."""
+        current = self._fold_peak()
+        if measurement not in self._open:
+            return  # stop() was called while it was open
+        self._open.remove(measurement)
+        self._record(stage, (measurement.peak - measurement.start, current - measurement.start,
+                             self._pool_bytes() - measurement.pool_start))
+    
+    def _record(self, stage: str, sample: tuple) -> None:
+        if stage not in self._count:
+            self._samples[stage] = np.zeros((self.capacity, len(self.FIELDS)), dtype=np.int64)
+            self._count[stage] = 0
+        self._samples[stage][self._count[stage] % self.capacity] = sample
+        self._count[stage] += 1
+    
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Account the allocations in the body of a with block to a stage."""
+        with self._lock:
+            measurement = self._begin()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._end(stage, measurement)
+    
+    def mark_frame(self) -> None:
+        """Close the 'frame' sample at a present and open the next one."""
+        with self._lock:
+            if self._frame is not None:
+                self._end('frame', self._frame)
+            self._frame = self._begin()
+    
+    def stages(self) -> List[str]:
+        """Return the recorded stage names."""
+        return list(self._count)
+    
+    def samples(self, stage: str, skip: int = 0) -> np.ndarray:
+        """
+        Return retained samples of a stage numbered skip or later, oldest first.
+        
+        Rows hold the FIELDS columns in bytes.
+        """
+        count = self._count.get(stage, 0)
+        first = max(skip, count - self.capacity)
+        if count <= first:
+            return np.zeros((0, len(self.FIELDS)), dtype=np.int64)
+        return self._samples[stage][np.arange(first, count) % self.capacity]
+    
+    def steady_state_bytes(self, stage: str = 'frame', skip: int = 0) -> Optional[int]:
+        """Return the most any sample after the first skip allocated, or None without any."""
+        samples = self.samples(stage, skip)
+        if len(samples) == 0:
+            return None
+        return int((samples[:, 0] + samples[:, 2]).max())
+    
+    def summary(self, stage: str) -> Optional[Dict[str, float]]:
+        """Return byte statistics for a stage, or None without samples."""
+        samples = self.samples(stage)
+        if len(samples) == 0:
+            return None
+        allocated = samples[:, 0] + samples[:, 2]
+        return {
+            'count': self._count[stage],
+            'allocated_mean': float(allocated.mean()),
+            'allocated_max': int(allocated.max()),
+            'transient_max': int(samples[:, 0].max()),
+            'retained_total': int(samples[:, 1].sum()),
+            'pool_total': int(samples[:, 2].sum()),
+        }
+    
+    def report(self) -> Dict:
+        """Return process totals and every stage's summary."""
+        traced = self._traced_at_stop
+        if tracemalloc.is_tracing():
+            traced = tracemalloc.get_traced_memory()[0]
+        return {
+            'peak_rss_bytes': peak_rss_bytes(),
+            'traced_bytes': traced,
+            'traced_peak_bytes': self.traced_peak,
+            'pool_allocated_bytes': self._pool_bytes(),
+            'pool_free_bytes': self.pool.free_bytes() if self.pool is not None else 0,
+            'stages': {stage: self.summary(stage) for stage in self.stages()},
+        }
+    
+    def reset(self) -> None:
+        """Forget every sample."""
+        with self._lock:
+            self._samples.clear()
+            self._count.clear()
+
+
+def format_memory_table(telemetry: MemoryTelemetry) -> List[str]:
+    """Return text lines with process totals and per-stage allocation."""
+    report = telemetry.report()
+    rss = report['peak_rss_bytes']
+    lines = [f"peak RSS {format_bytes(rss) if rss is not None else 'n/a'}  "
+             f"traced {format_bytes(report['traced_bytes'])} "
+             f"(peak {format_bytes(report['traced_peak_bytes'])})  "
+             f"pool {format_bytes(report['pool_allocated_bytes'])}"]
+    for stage, stats in report['stages'].items():
+        lines.append(f"{stage:<9} alloc mean {format_bytes(stats['allocated_mean'])}  "
+                     f"max {format_bytes(stats['allocated_max'])}")
+    return lines
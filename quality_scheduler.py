@@ -0,0 +1,140 @@
+"""
+Quality Scheduler Module
+
+Adjusts the filter's processing scale and disables expensive effects so each
+frame fits in the monitor's refresh interval, and restores quality once there
+is headroom again.
+"""
+
+import numpy as np
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Tuple
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    """A processing scale and the effects switched off at that level."""
+    scale: float
+    suspended: Tuple[str, ...] = ()
+    
+    def describe(self) -> str:
+        """Return a short human-readable summary."""
+        effects = ', '.join(name.replace('_', ' ') for name in self.suspended)
+        return f"scale {self.scale:.2f}" + (f", no {effects}" if effects else "")
+
+
+# Best quality first. Curvature (a full-frame gather) goes before chromatic
+# aberration; scanlines and vignette share one multiply and are always kept
+SCALED_LEVELS = [
+    QualityLevel(1.0),
+    QualityLevel(0.75),
+    QualityLevel(0.5),
+    QualityLevel(0.33),
+    QualityLevel(0.33, ('curvature',)),
+    QualityLevel(0.33, ('curvature', 'chromatic_aberration')),
+]
+FULL_SIZE_LEVELS = [
+    QualityLevel(1.0),
+    QualityLevel(1.0, ('curvature',)),
+    QualityLevel(1.0, ('curvature', 'chromatic_aberration')),
+]
+
+# Assumed relative cost of turning a suspended effect back on
+EFFECT_COST = 1.3
+
+
+class QualityScheduler:
+    """
+    Picks a quality level from measured per-frame work times.
+    
+    Quality drops one level as soon as the median of a full window of samples
+    exceeds the budget. It rises one level only after upgrade_hold consecutive
+    samples predict that the better level would still fit in upgrade_margin of
+    the budget, so it does not oscillate between neighbouring levels.
+    """
+    
+    def __init__(self, refresh_rate: float, headroom: float = 0.85, window: int = 20,
+                 upgrade_margin: float = 0.8, upgrade_hold: int = 90,
+                 allow_scaling: bool = True):
+        self.budget_ms = 1000.0 / refresh_rate * headroom if refresh_rate > 0 else float('inf')
+        self.window = window
+        self.upgrade_margin = upgrade_margin
+        self.upgrade_hold = upgrade_hold
+        self._samples: deque = deque(maxlen=window)
+        self._headroom_count = 0
+        self.changes = 0
+        self.allow_scaling = allow_scaling
+        self.levels: List[QualityLevel] = []
+        self.level_index = 0
+        self._select_ladder(allow_scaling)
+    
+    def _select_ladder(self, allow_scaling: bool) -> None:
+        """Switch between the scaled and full-size level ladders."""
+        self.allow_scaling = allow_scaling
+        if allow_scaling:
+            self.levels = SCALED_LEVELS
+            # Start where the fixed performance mode used to run
+            self.level_index = self.levels.index(QualityLevel(0.5))
+        else:
+            self.levels = FULL_SIZE_LEVELS
+            self.level_index = 0
+        self._reset_window()
+    
+    def _reset_window(self) -> None:
+        """Forget samples measured at the previous level."""
+        self._samples.clear()
+        self._headroom_count = 0
+    
+    @property
+    def level(self) -> QualityLevel:
+        return self.levels[self.level_index]
+    
+    def describe(self) -> str:
+        """Return the current level for display."""
+        return f"Level {self.level_index + 1}/{len(self.levels)}: {self.level.describe()}"
+    
+    def set_allow_scaling(self, allow_scaling: bool) -> bool:
+        """Follow the performance mode setting; returns True if the level changed."""
+        if allow_scaling == self.allow_scaling:
+            return False
+        self._select_ladder(allow_scaling)
+        self.changes += 1
+        return True
+    
+    def _predicted_cost(self, better: QualityLevel, current: QualityLevel) -> float:
+        """Return the estimated cost of a better level relative to the current one."""
+        ratio = (better.scale / current.scale) ** 2
+        restored = len(set(current.suspended) - set(better.suspended))
+        return ratio * EFFECT_COST ** restored
+    
+    def observe(self, work_ms: float) -> bool:
+        """
+        Record one frame's work time; returns True if the level changed.
+        """
+        self._samples.append(work_ms)
+        if len(self._samples) < self.window:
+            return False
+        
+        median = float(np.median(self._samples))
+        if median > self.budget_ms and self.level_index < len(self.levels) - 1:
+            self.level_index += 1
+            self.changes += 1
+            self._reset_window()
+            return True
+        
+        if self.level_index == 0:
+            return False
+        better = self.levels[self.level_index - 1]
+        predicted = median * self._predicted_cost(better, self.level)
+        if predicted < self.budget_ms * self.upgrade_margin:
+            self._headroom_count += 1
+        else:
+            self._headroom_count = 0
+        
+        if self._headroom_count >= self.upgrade_hold:
+            self.level_index -= 1
+            self.changes += 1
+            self._reset_window()
+            return True
+        return False
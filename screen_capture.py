@@ -4,58 +4,126 @@ Screen Capture Module
 Handles screen capture functionality with overlay window management.
 """
 
-import mss
 import pygame
-import time
-from PIL import Image
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple, Union
+from buffer_pool import BufferPool
+from capture_sources import BGRX_MASKS, CaptureSource, create_capture_source
+from frame_recording import FrameRecorder
+from frame_timing import StageTimings
 from window_manager import WindowManager
 
 
 class ScreenCapture:
     """Manages screen capture with overlay window coordination."""
     
-    def __init__(self, window_manager: WindowManager):
-        self.sct = mss.mss()
+    def __init__(self, window_manager: WindowManager, source: Union[str, CaptureSource] = 'mss',
+                 pool: Optional[BufferPool] = None):
         self.window_manager = window_manager
+        if isinstance(source, str):
+            source = create_capture_source(source, window_manager.window_id)
+        self.source = source
+        
+        # Whether the last capture unmapped the overlay, losing its contents
+        self.hides_overlay = False
+        
+        # Capture surfaces come from the pool and go back to it when released
+        self.pool = pool if pool is not None else BufferPool()
+        
+        # Recording settings, and the recorder once the frame size is known
+        self._recording: Optional[Tuple[str, str]] = None
+        self.recorder: Optional[FrameRecorder] = None
+        
+        # Hide/grab/restore durations; FilterEngine shares its own timings here
+        self.timings = StageTimings()
     
     def capture_screen(self, monitor_index: int) -> Optional[pygame.Surface]:
         """
         Capture screen with overlay window hiding to prevent feedback.
         
+        Sources that can see beneath the overlay capture with it left mapped.
         Returns pygame surface of captured screen or None if capture fails.
         """
         try:
+            monitor_info = self.source.monitors()[monitor_index + 1]
+        except Exception as e:
+            print(f"Error during screen capture: {e}")
+            return None
+        return self.capture_region(monitor_info)
+    
+    def capture_region(self, region: Dict) -> Optional[pygame.Surface]:
+        """
+        Capture one rectangle of the screen, given as an mss-style region dict.
+        
+        The overlay is hidden around the grab exactly as for capture_screen.
+        Returns a surface of the region's size or None if capture fails.
+        """
+        try:
+            surface = self.pool.acquire_surface((region['width'], region['height']), BGRX_MASKS)
+            
             # Hide overlay window before capture
-            window_hidden = self.window_manager.hide_window()
+            with self.timings.measure('hide'):
+                window_hidden = self.source.needs_overlay_hidden and self.window_manager.hide_window()
+            if (not window_hidden and self.source.needs_overlay_hidden
+                    and self.window_manager.has_window()):
+                # The overlay may still be on screen, so a grab now would feed
+                # the filter its own output; skip this frame
+                self.hides_overlay = True
+                self.window_manager.ensure_window_restored()
+                self.pool.release_surface(surface)
+                return None
+            self.hides_overlay = window_hidden
             
             # Capture screen
-            monitor_info = self.sct.monitors[monitor_index + 1]
-            screen_shot = self.sct.grab(monitor_info)
+            with self.timings.measure('grab'):
+                surface = self.source.grab(region, surface)
             
             # Restore overlay window after capture
             if window_hidden:
-                self.window_manager.restore_window()
-            
-            # Convert to pygame surface
-            return self._convert_to_pygame_surface(screen_shot)
+                with self.timings.measure('restore'):
+                    self.window_manager.restore_window()
             
+            if self._recording is not None:
+                self._record(surface)
+            return surface
+        
         except Exception as e:
             print(f"Error during screen capture: {e}")
             # Ensure window is restored even if there's an error
             self.window_manager.ensure_window_restored()
             return None
     
-    def _convert_to_pygame_surface(self, screenshot) -> pygame.Surface:
-        """Convert MSS screenshot to pygame surface."""
-        # Convert to PIL Image
-        img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
+    def start_recording(self, path: str, codec: str = 'zlib') -> None:
+        """Record every captured frame to a file from now on."""
+        self.stop_recording()
+        self._recording = (path, codec)
+    
+    def stop_recording(self) -> None:
+        """Finish writing the current recording, if any."""
+        self._recording = None
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.frames_written} frames to {self.recorder.path} "
+                  f"({self.recorder.dropped} dropped)")
+            self.recorder = None
+    
+    def _record(self, surface: pygame.Surface) -> None:
+        """Hand a captured frame to the recorder, creating it on the first frame."""
+        if self.recorder is None:
+            path, codec = self._recording
+            width, height = surface.get_size()
+            self.recorder = FrameRecorder(path, width, height, codec)
+        self.recorder.write(surface)
+    
+    def release_surface(self, surface: pygame.Surface) -> None:
+        """
+        Hand a captured surface back for reuse by a later capture.
         
-        # Convert to pygame surface
-        img_str = img.tobytes()
-        screen_surface = pygame.image.fromstring(img_str, img.size, img.mode)
-        return screen_surface.convert()  # Convert to display format
+        Callers must not touch the surface afterwards. Surfaces that are never
+        released are simply left to the garbage collector.
+        """
+        self.pool.release_surface(surface)
     
     def close(self) -> None:
         """Clean up resources."""
-        self.sct.close()
+        self.stop_recording()
+        self.source.close()
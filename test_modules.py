@@ -5,10 +5,74 @@ Test script for the CRT Filter application.
 This script tests the modular components to ensure everything works correctly.
 """
 
+import os
 import sys
 import unittest
 from unittest.mock import Mock, patch
 
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+
+def make_test_surface(width, height, seed=0):
+    """Create a surface filled with reproducible random pixels."""
+    import numpy as np
+    import pygame
+    
+    rng = np.random.default_rng(seed)
+    surface = pygame.Surface((width, height))
+    pygame.surfarray.blit_array(surface, rng.integers(0, 256, (width, height, 3), dtype=np.uint8))
+    return surface
+
+
+def assert_frame_allocation_within_budget(test, width, height, settings=None, frames=10,
+                                         warmup=3, bytes_per_pixel=None, base=None):
+    """
+    Capture and filter frames of a size with memory telemetry, failing the test
+    if any frame after the warm-up allocates more than the configured budget.
+    
+    Returns the telemetry for further checks.
+    """
+    from buffer_pool import BufferPool
+    from capture_sources import SyntheticSource
+    from crt_filter import CRTFilter
+    from frame_timing import StageTimings
+    from memory_telemetry import MemoryTelemetry, format_bytes, frame_allocation_budget
+    from screen_capture import ScreenCapture
+    from window_manager import WindowManager
+    
+    pool = BufferPool()
+    timings = StageTimings()
+    telemetry = MemoryTelemetry(pool)
+    timings.memory = telemetry
+    screen_capture = ScreenCapture(WindowManager(), SyntheticSource(width, height), pool)
+    screen_capture.timings = timings
+    crt_filter = CRTFilter(width, height)
+    crt_filter.pool = pool
+    crt_filter.timings = timings
+    crt_filter.output_buffers = 3
+    crt_filter.update_parameters(**(settings or {}))
+    
+    region = {'left': 0, 'top': 0, 'width': width, 'height': height}
+    telemetry.start()
+    try:
+        telemetry.mark_frame()
+        for _ in range(warmup + frames):
+            with timings.measure('capture'):
+                captured = screen_capture.capture_region(region)
+            with timings.measure('filter'):
+                crt_filter.process_frame(captured)
+                screen_capture.release_surface(captured)
+            telemetry.mark_frame()
+    finally:
+        telemetry.stop()
+    
+    allocated = telemetry.steady_state_bytes('frame', skip=warmup)
+    budget = frame_allocation_budget(width, height, bytes_per_pixel, base)
+    test.assertLessEqual(allocated, budget,
+                         f"{width}x{height} frames allocate {format_bytes(allocated)}, "
+                         f"over the {format_bytes(budget)} budget")
+    return telemetry
+
 
 class TestCRTFilterModules(unittest.TestCase):
     """Test cases for CRT Filter modules."""
@@ -35,6 +99,247 @@ class TestCRTFilterModules(unittest.TestCase):
         crt_filter.update_parameters(scanline_intensity=0.1)
         self.assertEqual(crt_filter.scanline_intensity, 0.1)
     
+    def test_curvature_remap_cache(self):
+        """Test that curvature remap tables are cached and invalidated."""
+        from crt_filter import CRTFilter
+        
+        crt_filter = CRTFilter(64, 48)
+        crt_filter.update_parameters(curvature=0.3)
+        surface = make_test_surface(64, 48)
+        
+        crt_filter.apply_curvature(surface)
+        table = crt_filter.get_remap_table(64, 48)
+        self.assertEqual(table.dtype.name, 'int32')
+        self.assertEqual(table.shape, (48, 64))
+        self.assertIs(crt_filter.get_remap_table(64, 48), table)
+        
+        # Tables for the old curvature are dropped by the next lookup, not by
+        # the (possibly other) thread changing the parameter
+        crt_filter.update_parameters(curvature=0.4)
+        self.assertEqual(len(crt_filter._remap_cache), 1)
+        self.assertIsNot(crt_filter.get_remap_table(64, 48), table)
+        self.assertEqual(len(crt_filter._remap_cache), 1)
+    
+    def test_parameter_updates_during_rendering(self):
+        """Test that moving the curvature slider while frames render is safe."""
+        import threading
+        from crt_filter import CRTFilter
+        
+        crt_filter = CRTFilter(64, 48)
+        crt_filter.incremental = True
+        surface = make_test_surface(64, 48)
+        errors = []
+        done = threading.Event()
+        
+        def render():
+            try:
+                while not done.is_set():
+                    crt_filter.process_frame(surface)
+            except Exception as e:
+                errors.append(e)
+        
+        renderer = threading.Thread(target=render)
+        renderer.start()
+        try:
+            for step in range(300):
+                crt_filter.update_parameters(curvature=0.1 + (step % 5) * 0.05)
+        finally:
+            done.set()
+            renderer.join()
+        self.assertEqual(errors, [])
+    
+    def test_gain_mask(self):
+        """Test the combined scanline/vignette gain mask."""
+        import numpy as np
+        from crt_filter import CRTFilter
+        
+        crt_filter = CRTFilter(64, 48)
+        crt_filter.update_parameters(scanline_intensity=0.2, vignette_intensity=0.0)
+        mask = crt_filter.get_gain_mask(64, 48)
+        self.assertEqual(mask.dtype, np.uint16)
+        self.assertTrue((mask[1::2] == 256).all())
+        self.assertTrue((mask[::2] < 256).all())
+        self.assertIs(crt_filter.get_gain_mask(64, 48), mask)
+        
+        crt_filter.update_parameters(vignette_intensity=0.3)
+        self.assertIsNot(crt_filter.get_gain_mask(64, 48), mask)
+        
+        crt_filter.update_parameters(scanline_intensity=0.0, vignette_intensity=0.0)
+        self.assertIsNone(crt_filter.get_gain_mask(64, 48))
+    
+    def test_fused_pipeline_matches_chain(self):
+        """Test that the fused effect pipeline matches the surface chain."""
+        import pygame
+        from crt_filter import CRTFilter
+        
+        surface = make_test_surface(80, 60)
+        for curvature in (0.0, 0.3):
+            for performance_mode in (False, True):
+                crt_filter = CRTFilter(80, 60)
+                crt_filter.update_parameters(
+                    curvature=curvature,
+                    chromatic_aberration=2.0,
+                    scanline_intensity=0.2,
+                    vignette_intensity=0.3,
+                    performance_mode=performance_mode
+                )
+                fused = pygame.surfarray.array3d(crt_filter.apply_effects(surface))
+                crt_filter.fused_pipeline = False
+                chained = pygame.surfarray.array3d(crt_filter.apply_effects(surface))
+                self.assertTrue((fused == chained).all())
+    
+    def test_band_parallel_matches_serial(self):
+        """Test that band-parallel rendering matches single-threaded output."""
+        import pygame
+        from crt_filter import CRTFilter
+        
+        surface = make_test_surface(80, 60)
+        for curvature in (0.0, 0.5):
+            crt_filter = CRTFilter(80, 60)
+            crt_filter.update_parameters(curvature=curvature, chromatic_aberration=2.0,
+                                         performance_mode=False)
+            expected = pygame.surfarray.array3d(crt_filter.apply_effects(surface))
+            
+            crt_filter.workers = 4
+            try:
+                bands = crt_filter.get_row_bands(80, 60, 4)
+                self.assertEqual(len(bands), 4)
+                actual = pygame.surfarray.array3d(crt_filter.apply_effects(surface))
+            finally:
+                crt_filter.close()
+            self.assertTrue((actual == expected).all())
+    
+    def test_feedback_detection_signatures(self):
+        """Test feedback detection on compact frame signatures."""
+        from config import CONFIG
+        from crt_filter import CRTFilter
+        
+        crt_filter = CRTFilter(640, 360)
+        self.assertEqual(crt_filter.buffer_size, CONFIG.frame_buffer_size)
+        self.assertEqual(crt_filter.feedback_threshold, CONFIG.feedback_threshold)
+        
+        frame = make_test_surface(640, 360, seed=1)
+        signature = crt_filter.compute_frame_signature(frame)
+        self.assertEqual(signature.shape, (64, 36, 3))
+        
+        self.assertFalse(crt_filter.detect_feedback_loop(frame))
+        for seed in range(2, 6):
+            crt_filter.add_frame_to_buffer(make_test_surface(640, 360, seed=seed))
+        self.assertEqual(crt_filter._signatures.shape[0], CONFIG.frame_buffer_size)
+        self.assertFalse(crt_filter.detect_feedback_loop(frame))
+        
+        crt_filter.add_frame_to_buffer(frame)
+        self.assertTrue(crt_filter.detect_feedback_loop(frame))
+    
+    def test_damage_tracker(self):
+        """Test per-tile change detection between captured frames."""
+        import pygame
+        from damage_tracker import DamageTracker
+        
+        tracker = DamageTracker(tile_size=16)
+        surface = make_test_surface(64, 40)
+        self.assertIsNone(tracker.update(surface))
+        self.assertFalse(tracker.update(surface).any())
+        
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[20, 35] = (1, 2, 3)
+        del pixels
+        dirty = tracker.update(surface)
+        self.assertEqual(dirty.shape, (3, 4))
+        self.assertEqual([tuple(tile) for tile in zip(*dirty.nonzero())], [(2, 1)])
+    
+    def test_processing_contexts(self):
+        """Test per-size processing contexts sharing one filter's parameters."""
+        from crt_filter import CRTFilter
+        
+        crt_filter = CRTFilter(1920, 1080)
+        crt_filter.update_parameters(curvature=0.2, chromatic_aberration=4.0)
+        context = crt_filter.get_context(320, 180)
+        self.assertIs(crt_filter.get_context(320, 180), context)
+        self.assertIs(crt_filter.get_context(1920, 1080), crt_filter)
+        self.assertIs(context.parameters, crt_filter.parameters)
+        
+        # Parameters are shared, caches are not
+        crt_filter.update_parameters(curvature=0.3)
+        self.assertEqual(context.curvature, 0.3)
+        context.get_remap_table(320, 180)
+        self.assertEqual(len(crt_filter._remap_cache), 0)
+        self.assertEqual(context._aberration_offset(320), 1)
+        
+        # Performance mode keeps each frame at its own size
+        for performance_mode in (False, True):
+            crt_filter.update_parameters(performance_mode=performance_mode)
+            for scale_quality in ('fast', 'smooth'):
+                crt_filter.scale_quality = scale_quality
+                result = context.apply_effects(make_test_surface(320, 180))
+                self.assertEqual(result.get_size(), (320, 180))
+    
+    def test_integer_factor_scaling(self):
+        """Test box downsampling, pixel-repeat upsampling and output-rate scanlines."""
+        import numpy as np
+        import pygame
+        from crt_filter import CRTFilter
+        
+        for factor, (width, height) in ((2, (64, 48)), (3, (65, 49))):
+            crt_filter = CRTFilter(width, height)
+            crt_filter.update_parameters(curvature=0.0, chromatic_aberration=0.0,
+                                         vignette_intensity=0.0, scanline_intensity=0.2,
+                                         performance_mode=True)
+            crt_filter.processing_scale = 1 / factor
+            surface = make_test_surface(width, height)
+            
+            workspace = crt_filter.get_scale_workspace(width, height, factor)
+            crt_filter._box_downsample(surface, workspace)
+            pixels = pygame.surfarray.array3d(surface).transpose(1, 0, 2).astype(int)
+            small_h, small_w = height // factor, width // factor
+            blocks = pixels[:small_h * factor, :small_w * factor]
+            expected = blocks.reshape(small_h, factor, small_w, factor, 3).sum(axis=(1, 3))
+            expected = (expected + factor * factor // 2) // (factor * factor)
+            small = pygame.surfarray.array3d(workspace.small).transpose(1, 0, 2)
+            self.assertTrue((small == expected).all())
+            
+            result = crt_filter.apply_effects(surface)
+            self.assertEqual(result.get_size(), (width, height))
+            output = pygame.surfarray.array3d(result).transpose(1, 0, 2).astype(int)
+            gain = crt_filter.scanline_gain()
+            # Each output row is its block's pixels, darkened on even rows
+            for y in (0, 1, factor, factor + 1):
+                row = np.repeat(expected[y // factor], factor, axis=0)
+                if y % 2 == 0:
+                    row = row * gain >> 8
+                self.assertTrue((output[y, :small_w * factor] == row).all())
+            if height % factor:
+                # Leftover rows and columns repeat the last block
+                self.assertTrue((output[height - 1] == output[height - 3]).all())
+                self.assertTrue((output[:, width - 1] == output[:, small_w * factor - 1]).all())
+    
+    def test_incremental_matches_full(self):
+        """Test that dirty-tile rendering matches full-frame rendering."""
+        import pygame
+        from crt_filter import CRTFilter
+        
+        for buffers in (1, 3):
+            crt_filter = CRTFilter(96, 64)
+            crt_filter.update_parameters(curvature=0.3, chromatic_aberration=3.0,
+                                         performance_mode=False)
+            crt_filter.incremental = True
+            crt_filter.output_buffers = buffers
+            crt_filter.damage_tracker.tile_size = 16
+            
+            surface = make_test_surface(96, 64)
+            _, rects = crt_filter.apply_effects_incremental(surface)
+            self.assertIsNone(rects)
+            
+            for step in range(4):
+                pixels = pygame.surfarray.pixels3d(surface)
+                pixels[10 * step:10 * step + 5, 40:44] = (255, 0, step)
+                del pixels
+                result, rects = crt_filter.apply_effects_incremental(surface)
+                self.assertTrue(rects)
+                
+                expected = pygame.surfarray.array3d(crt_filter.apply_effects_fused(surface))
+                self.assertTrue((pygame.surfarray.array3d(result) == expected).all())
+    
     def test_window_manager(self):
         """Test window manager functionality."""
         from window_manager import WindowManager, get_monitor_refresh_rate
@@ -48,6 +353,73 @@ class TestCRTFilterModules(unittest.TestCase):
         self.assertIsInstance(refresh_rate, float)
         self.assertGreater(refresh_rate, 0)
     
+    def test_failed_hide_skips_capture(self):
+        """Test that capture is skipped when the overlay does not unmap in time."""
+        from capture_sources import SyntheticSource
+        from screen_capture import ScreenCapture
+        from window_manager import WindowManager
+        
+        window_manager = WindowManager()
+        window_manager.window_id = '1'
+        window_manager._display = Mock()
+        window_manager._window = Mock(id=1)
+        with patch.object(window_manager, '_wait_for_event', return_value=False):
+            self.assertFalse(window_manager.hide_window())
+        
+        source = SyntheticSource(32, 24)
+        source.needs_overlay_hidden = True
+        window_manager.hide_window = Mock(return_value=False)
+        window_manager.ensure_window_restored = Mock()
+        screen_capture = ScreenCapture(window_manager, source)
+        region = {'left': 0, 'top': 0, 'width': 32, 'height': 24}
+        self.assertIsNone(screen_capture.capture_region(region))
+        self.assertEqual(source.frame_index, 0)
+        window_manager.ensure_window_restored.assert_called_once()
+        
+        # Without an overlay there is nothing to hide, so capture goes ahead
+        window_manager.window_id = None
+        self.assertIsNotNone(screen_capture.capture_region(region))
+    
+    def test_overlay_resize_during_hide(self):
+        """Test that a resize waits for the capture thread's hide and keeps the connection."""
+        import threading
+        import time
+        from window_manager import WindowManager
+        
+        window_manager = WindowManager()
+        window_manager.window_id = '1'
+        display = Mock()
+        window_manager._display = display
+        window_manager._window = Mock(id=1)
+        
+        events = []
+        hiding = threading.Event()
+        
+        def slow_hide():
+            hiding.set()
+            time.sleep(0.05)
+            events.append('hidden')
+            return True
+        
+        window_manager._hide_window_xlib = slow_hide
+        capture = threading.Thread(target=window_manager.hide_window)
+        capture.start()
+        hiding.wait(1.0)
+        display.create_resource_object.side_effect = \
+            lambda kind, window_id: events.append('bound') or Mock(id=window_id)
+        with patch('pygame.display.set_mode'), \
+                patch('pygame.display.get_wm_info', return_value={'window': 2}), \
+                patch.object(window_manager, '_setup_linux_window_properties'), \
+                patch.object(window_manager, 'move_overlay'):
+            window_manager.resize_overlay({'left': 0, 'top': 0, 'width': 64, 'height': 48})
+        capture.join()
+        
+        self.assertEqual(events, ['hidden', 'bound'])
+        self.assertIs(window_manager._display, display)
+        display.close.assert_not_called()
+        self.assertEqual(window_manager._window.id, 2)
+        self.assertEqual(window_manager.window_id, '2')
+    
     def test_screen_capture(self):
         """Test screen capture module."""
         from screen_capture import ScreenCapture
@@ -59,6 +431,204 @@ class TestCRTFilterModules(unittest.TestCase):
         # Test cleanup
         screen_capture.close()
     
+    def test_capture_sources(self):
+        """Test the synthetic capture source through both capture front ends."""
+        import numpy as np
+        import pygame
+        from capture_server import SharedMemoryCapture
+        from capture_sources import SyntheticSource, create_capture_source
+        from screen_capture import ScreenCapture
+        from window_manager import WindowManager
+        
+        source = create_capture_source('synthetic')
+        self.assertIsInstance(source, SyntheticSource)
+        self.assertFalse(source.needs_overlay_hidden)
+        with self.assertRaises(ValueError):
+            create_capture_source('missing')
+        
+        window_manager = WindowManager()
+        screen_capture = ScreenCapture(window_manager, SyntheticSource(96, 64))
+        first = screen_capture.capture_screen(0)
+        self.assertEqual(first.get_size(), (96, 64))
+        self.assertFalse(screen_capture.hides_overlay)
+        first_pixels = pygame.surfarray.array2d(first)
+        screen_capture.release_surface(first)
+        second = screen_capture.capture_screen(0)
+        self.assertIs(second, first)
+        self.assertFalse(np.array_equal(pygame.surfarray.array2d(second), first_pixels))
+        screen_capture.close()
+        
+        monitor = {'left': 0, 'top': 0, 'width': 96, 'height': 64}
+        server = SharedMemoryCapture(window_manager, monitor, 'synthetic', frame_timeout=5.0)
+        try:
+            surface = server.capture_screen(0)
+            self.assertIsNotNone(surface)
+            self.assertEqual(surface.get_size(), (96, 64))
+            blue = pygame.surfarray.pixels3d(surface)[:, :, 2]
+            self.assertEqual(set(np.unique(blue)), {64, 255})
+            del blue
+            server.release_surface(surface)
+            self.assertFalse(server.hides_overlay)
+        finally:
+            server.close()
+    
+    def test_composite_paint_plan(self):
+        """Test that composite capture reads only the visible parts of windows."""
+        from composite_capture import plan_paint, subtract_rect
+        
+        self.assertEqual(subtract_rect([(0, 0, 10, 10)], (20, 20, 30, 30)), [(0, 0, 10, 10)])
+        self.assertEqual(subtract_rect([(0, 0, 10, 10)], (-5, -5, 15, 15)), [])
+        pieces = subtract_rect([(0, 0, 10, 10)], (3, 3, 6, 6))
+        self.assertEqual(sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in pieces), 100 - 9)
+        
+        region = (0, 0, 100, 100)
+        windows = [
+            ('desktop', (0, 0, 100, 100), True),
+            ('hidden', (10, 10, 40, 40), True),
+            ('editor', (0, 0, 60, 100), True),
+            ('tooltip', (50, 50, 70, 70), False),
+        ]
+        plan, background = plan_paint(windows, region)
+        self.assertEqual([key for key, rects in plan], ['desktop', 'editor', 'tooltip'])
+        self.assertEqual(dict(plan)['desktop'], [(60, 0, 100, 100)])
+        self.assertEqual(background, [])
+        
+        # Nothing opaque over part of the region leaves the root window showing
+        plan, background = plan_paint([('tooltip', (0, 0, 50, 100), False)], region)
+        self.assertEqual(plan, [('tooltip', [(0, 0, 50, 100)])])
+        self.assertEqual(background, [region])
+        plan, background = plan_paint([('editor', (0, 0, 50, 100), True)], region)
+        self.assertEqual(background, [(50, 0, 100, 100)])
+    
+    def test_frame_recording(self):
+        """Test recording captured frames and replaying them with each codec."""
+        import tempfile
+        import numpy as np
+        import pygame
+        from capture_sources import SyntheticSource
+        from frame_recording import FrameRecorder, ReplaySource
+        from screen_capture import ScreenCapture
+        from window_manager import WindowManager
+        
+        source = SyntheticSource(48, 32, bar_width=4, speed=5)
+        region = source.monitors()[1]
+        frames = [pygame.surfarray.array2d(source.grab(region)) for _ in range(4)]
+        
+        with tempfile.TemporaryDirectory() as directory:
+            for codec in ('raw', 'zlib', 'delta'):
+                path = os.path.join(directory, f'{codec}.crtrec')
+                recorder = FrameRecorder(path, 48, 32, codec)
+                for index, frame in enumerate(frames):
+                    surface = pygame.Surface((48, 32), 0, 32)
+                    pygame.surfarray.blit_array(surface, frame)
+                    self.assertTrue(recorder.write(surface, timestamp=index * 0.01))
+                recorder.close()
+                self.assertEqual(recorder.frames_written, 4)
+                
+                replay = ReplaySource(path, realtime=False)
+                try:
+                    self.assertEqual(replay.frame_count, 4)
+                    self.assertEqual(replay.timestamps[-1], 0.03)
+                    for frame in frames + frames[:1]:
+                        replayed = pygame.surfarray.array2d(replay.grab(region))
+                        self.assertTrue(np.array_equal(replayed & 0xFFFFFF, frame & 0xFFFFFF))
+                finally:
+                    replay.close()
+            
+            # Recording through ScreenCapture starts with the first captured frame
+            path = os.path.join(directory, 'capture.crtrec')
+            screen_capture = ScreenCapture(WindowManager(), SyntheticSource(48, 32))
+            screen_capture.start_recording(path, 'delta')
+            for _ in range(3):
+                screen_capture.release_surface(screen_capture.capture_screen(0))
+            screen_capture.close()
+            replay = ReplaySource(path, realtime=False)
+            self.assertEqual(replay.frame_count, 3)
+            replay.close()
+    
+    def test_capture_grab_format(self):
+        """Test that CaptureSource.grab copies raw BGRA rows into a BGRX surface."""
+        import numpy as np
+        import pygame
+        from capture_sources import CaptureSource
+        
+        bgra = np.zeros((4, 6, 4), dtype=np.uint8)
+        bgra[..., 0] = 10   # blue
+        bgra[..., 1] = 20   # green
+        bgra[..., 2] = 30   # red
+        bgra[..., 3] = 0    # undefined alpha
+        
+        class RawSource(CaptureSource):
+            def monitors(self):
+                return []
+            
+            def grab_into(self, region, pixels):
+                pixels[:] = np.frombuffer(bgra.tobytes(), dtype=np.uint32).reshape(pixels.shape)
+        
+        region = {'left': 0, 'top': 0, 'width': 6, 'height': 4}
+        surface = RawSource().grab(region)
+        self.assertEqual(surface.get_size(), (6, 4))
+        self.assertEqual(tuple(pygame.surfarray.pixels3d(surface)[5, 3]), (30, 20, 10))
+        self.assertIs(RawSource().grab(region, surface), surface)
+    
+    def test_capture_frame_ring(self):
+        """Test the shared-memory frame ring slot protocol."""
+        import threading
+        from multiprocessing import shared_memory
+        from capture_server import FrameRing
+        
+        shm = shared_memory.SharedMemory(create=True, size=FrameRing.required_size(8, 4, 3))
+        try:
+            ring = FrameRing(shm, threading.Lock(), 8, 4, 3)
+            ring.reset()
+            self.assertIsNone(ring.acquire_latest(0))
+            
+            first = ring.begin_write()
+            ring.slots[first][:] = 1
+            ring.end_write(first)
+            held = ring.acquire_latest(0)
+            self.assertEqual(held, first)
+            self.assertIsNone(ring.acquire_latest(1))
+            
+            # The writer must avoid the held slot and the newest slot
+            second = ring.begin_write()
+            self.assertNotEqual(second, first)
+            ring.end_write(second)
+            third = ring.begin_write()
+            self.assertNotIn(third, (first, second))
+            ring.end_write(third)
+            self.assertEqual(ring.begin_write(), second)
+            self.assertTrue((ring.slots[first] == 1).all())
+            
+            ring.release(held)
+            self.assertEqual(ring.begin_write(), first)
+            ring = None
+        finally:
+            shm.close()
+            shm.unlink()
+    
+    def test_capture_server_follows_region(self):
+        """Test that the capture process keeps regions on screen and follows resizes."""
+        from capture_server import SharedMemoryCapture, clamp_origin
+        
+        screen = {'left': 0, 'top': 0, 'width': 1280, 'height': 720}
+        self.assertEqual(clamp_origin(1200, -10, 320, 180, screen), (960, 0))
+        self.assertEqual(clamp_origin(100, 50, 320, 180, screen), (100, 50))
+        self.assertEqual(clamp_origin(100, 50, 2000, 180, screen), (0, 50))
+        
+        capture = SharedMemoryCapture(Mock(window_id=None),
+                                      {'left': 0, 'top': 0, 'width': 64, 'height': 48},
+                                      'synthetic', frame_timeout=5.0)
+        try:
+            frame = capture.capture_region({'left': 1260, 'top': 0, 'width': 64, 'height': 48})
+            self.assertEqual(frame.get_size(), (64, 48))
+            capture.release_surface(frame)
+            frame = capture.capture_region({'left': 10, 'top': 20, 'width': 80, 'height': 40})
+            self.assertEqual(frame.get_size(), (80, 40))
+            capture.release_surface(frame)
+        finally:
+            capture.close()
+    
     def test_filter_engine_components(self):
         """Test filter engine imports."""
         from filter_engine import FilterEngine, run_filter
@@ -66,6 +636,563 @@ class TestCRTFilterModules(unittest.TestCase):
         # Just test that the imports work
         self.assertTrue(callable(run_filter))
     
+    def test_latest_frame_queue(self):
+        """Test that the pipeline queue keeps only the newest frame."""
+        from filter_engine import LatestFrameQueue
+        
+        dropped = []
+        frames = LatestFrameQueue(on_drop=lambda stale, frame: dropped.append(stale))
+        frames.put('frame 1')
+        frames.put('frame 2')
+        
+        self.assertEqual(frames.get(timeout=0.01), 'frame 2')
+        self.assertIsNone(frames.get(timeout=0.01))
+        self.assertEqual(dropped, ['frame 1'])
+        self.assertEqual(frames.dropped, 1)
+    
+        # A producer waiting for its frame to be taken wakes when it is
+        import threading
+        self.assertTrue(frames.wait_until_taken(timeout=0.01))
+        frames.put('frame 3')
+        self.assertFalse(frames.wait_until_taken(timeout=0.01))
+        threading.Timer(0.05, frames.get, kwargs={'timeout': 1.0}).start()
+        self.assertTrue(frames.wait_until_taken(timeout=1.0))
+    
+    def test_filter_engine_loops(self):
+        """Test the serial and pipelined frame loops with a fake capture."""
+        import pygame
+        from filter_engine import FilterEngine
+        
+        monitor = {'left': 0, 'top': 0, 'width': 64, 'height': 48}
+        for pipelined in (False, True):
+            control_panel = Mock(running=True, selected_monitor=0, crt_filter=None)
+            presented = []
+            
+            def capture_region(region):
+                return make_test_surface(region['width'], region['height'])
+            
+            def present(surface, rects=None):
+                presented.append(surface)
+                if len(presented) >= 3:
+                    control_panel.running = False
+            
+            pygame.init()
+            try:
+                with patch('filter_engine.ScreenCapture') as screen_capture:
+                    screen_capture.return_value.capture_region.side_effect = capture_region
+                    engine = FilterEngine(control_panel, monitor)
+                    engine.pipelined = pipelined
+                    engine._present = present
+                    engine.run()
+                    screen_capture.return_value.close.assert_called_once()
+            finally:
+                pygame.quit()
+            
+            self.assertGreaterEqual(len(presented), 3)
+            self.assertEqual(presented[0].get_size(), (64, 48))
+    
+    def test_pipelined_outputs_not_overwritten(self):
+        """Test that the pipelined filter never renders into a frame being presented."""
+        import itertools
+        import time
+        import pygame
+        from filter_engine import FilterEngine
+        
+        monitor = {'left': 0, 'top': 0, 'width': 64, 'height': 48}
+        control_panel = Mock(running=True, selected_monitor=0, crt_filter=None)
+        seeds = itertools.count()
+        presented = []
+        torn = []
+        
+        def capture_region(region):
+            return make_test_surface(region['width'], region['height'], seed=next(seeds))
+        
+        def present(surface, rects=None):
+            # Present far slower than the filter renders
+            before = pygame.image.tobytes(surface, 'RGB')
+            time.sleep(0.02)
+            if pygame.image.tobytes(surface, 'RGB') != before:
+                torn.append(len(presented))
+            presented.append(surface)
+            if len(presented) >= 8:
+                control_panel.running = False
+        
+        pygame.init()
+        try:
+            with patch('filter_engine.ScreenCapture') as screen_capture:
+                screen_capture.return_value.capture_region.side_effect = capture_region
+                engine = FilterEngine(control_panel, monitor)
+                engine.pipelined = True
+                engine.crt_filter.output_buffers = 3
+                engine.pacer.set_refresh_rate(0)
+                engine._present = present
+                engine.run()
+        finally:
+            pygame.quit()
+        
+        self.assertGreaterEqual(len(presented), 8)
+        self.assertEqual(torn, [])
+    
+    def test_pipelined_slow_capture_keeps_frames(self):
+        """Test that frames are not dropped as stale when capture is slower than the threshold."""
+        import time
+        import pygame
+        from filter_engine import FilterEngine
+        
+        monitor = {'left': 0, 'top': 0, 'width': 64, 'height': 48}
+        control_panel = Mock(running=True, selected_monitor=0, crt_filter=None)
+        presented = []
+        
+        def capture_region(region):
+            # Slower than two refresh periods at 60 Hz
+            time.sleep(0.05)
+            return make_test_surface(region['width'], region['height'], seed=len(presented))
+        
+        def present(surface, rects=None):
+            presented.append(surface)
+            if len(presented) >= 5:
+                control_panel.running = False
+        
+        pygame.init()
+        try:
+            with patch('filter_engine.ScreenCapture') as screen_capture:
+                screen_capture.return_value.capture_region.side_effect = capture_region
+                engine = FilterEngine(control_panel, monitor)
+                engine.pipelined = True
+                engine.crt_filter.output_buffers = 3
+                engine.pacer.set_refresh_rate(60.0)
+                process_frame = engine.crt_filter.process_frame
+                calls = []
+                
+                def slow_process_frame(surface):
+                    # Every other frame filters slowly, so the next one waits in
+                    # the queue past the stale threshold with nothing newer
+                    calls.append(surface)
+                    time.sleep(0.09 if len(calls) % 2 else 0.01)
+                    return process_frame(surface)
+                
+                engine.crt_filter.process_frame = slow_process_frame
+                engine._present = present
+                engine.run()
+        finally:
+            pygame.quit()
+        
+        self.assertGreaterEqual(len(presented), 5)
+        self.assertEqual(engine.pacer.stale_frames, 0)
+    
+    def test_benchmark_suite(self):
+        """Test the benchmark runner and regression comparison."""
+        import copy
+        import pygame
+        from benchmark_filter import compare_reports, run_benchmarks
+        
+        pygame.init()
+        try:
+            report = run_benchmarks(['64x48'], (False, True), workers=(1, 2), repeat=2,
+                                    warmup=0, log=lambda line: None)
+        finally:
+            pygame.quit()
+        
+        # Four effects timed once, plus two whole-frame stages at two worker
+        # counts for each performance mode
+        self.assertEqual(len(report['results']), 12)
+        effects = [result for result in report['results'] if result['performance_mode'] is None]
+        self.assertEqual(len(effects), 4)
+        for result in report['results']:
+            self.assertGreater(result['median_ms'], 0)
+            self.assertGreaterEqual(result['p95_ms'], result['median_ms'])
+        
+        self.assertEqual(compare_reports(report, report), [])
+        slower = copy.deepcopy(report)
+        slower['results'][0]['median_ms'] = report['results'][0]['median_ms'] * 2 + 1
+        regressions = compare_reports(report, slower)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0]['key'][0], 'apply_chromatic_aberration')
+    
+    def test_benchmark_frames_defeat_feedback_detection(self):
+        """Test that every benchmarked process_frame call runs the effects."""
+        import pygame
+        from benchmark_filter import make_filter, make_frames
+        from config import FilterSettings
+        
+        pygame.init()
+        try:
+            # Frames differing only by the synthetic bar fail this at 720p
+            frames = make_frames(1280, 720)
+            crt_filter = make_filter(1280, 720, FilterSettings(), True, 1)
+            try:
+                for index in range(6):
+                    crt_filter.process_frame(frames[index % len(frames)])
+            finally:
+                crt_filter.close()
+        finally:
+            pygame.quit()
+        self.assertEqual(crt_filter.timings.count('effects'), 6)
+    
+    def test_stage_timings(self):
+        """Test the per-stage timing ring buffers."""
+        from frame_timing import StageTimings
+        
+        timings = StageTimings(capacity=4)
+        for value in range(6):
+            timings.record('filter', value * 1_000_000, value)
+        with timings.measure('present'):
+            pass
+        
+        self.assertEqual(timings.stages(), ['filter', 'present'])
+        wall, cpu = timings.samples('filter')
+        self.assertEqual(list(wall), [2_000_000, 3_000_000, 4_000_000, 5_000_000])
+        self.assertEqual(list(cpu), [2, 3, 4, 5])
+        summary = timings.summary('filter')
+        self.assertEqual(summary['count'], 6)
+        self.assertAlmostEqual(summary['p50_ms'], 3.5)
+        self.assertIsNone(timings.summary('capture'))
+    
+    def test_timing_hud_and_export(self):
+        """Test the timing HUD, text table and sample export."""
+        import csv
+        import json
+        import tempfile
+        import pygame
+        from frame_timing import StageTimings, TimingExporter, TimingHud, format_stage_table
+        
+        def make_timings():
+            timings = StageTimings()
+            for _ in range(3):
+                timings.record('frame', 16_000_000)
+                timings.record('effects', 4_000_000, 3_000_000)
+                timings.record('capture', 2_000_000, 1_000_000)
+            return timings
+        
+        timings = make_timings()
+        lines = format_stage_table(timings)
+        self.assertIn('fps', lines[0])
+        self.assertTrue(lines[1].startswith('capture'))
+        self.assertTrue(lines[2].startswith('effects'))
+        
+        pygame.init()
+        try:
+            hud = TimingHud()
+            panel = hud.render(timings)
+            self.assertIs(hud.render(timings), panel)
+            self.assertEqual(hud.rect().size, panel.get_size())
+        finally:
+            pygame.quit()
+        
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('timings.csv', 'timings.jsonl'):
+                path = os.path.join(directory, name)
+                timings = make_timings()
+                exporter = TimingExporter(path)
+                exporter.export(timings)
+                timings.record('capture', 5_000_000)
+                exporter.export(timings)
+                exporter.close()
+                with open(path) as f:
+                    if name.endswith('.csv'):
+                        rows = list(csv.DictReader(f))
+                    else:
+                        rows = [json.loads(line) for line in f]
+                self.assertEqual(len(rows), 10)
+                self.assertEqual(int(rows[-1]['wall_ns']), 5_000_000)
+        
+        # A stage emptied after being listed is skipped rather than failing
+        timings = make_timings()
+        timings.stages = lambda: ['capture', 'present']
+        self.assertEqual(len(format_stage_table(timings)), 2)
+    
+    def test_quality_scheduler(self):
+        """Test adaptive quality step-down, hysteresis and suspended effects."""
+        from crt_filter import CRTFilter
+        from quality_scheduler import QualityScheduler
+        
+        scheduler = QualityScheduler(60.0, headroom=1.0, window=5, upgrade_hold=10)
+        self.assertEqual(scheduler.level.scale, 0.5)
+        
+        # Over budget: one step down per full window
+        changes = [scheduler.observe(25.0) for _ in range(10)]
+        self.assertEqual(changes.count(True), 2)
+        self.assertEqual(scheduler.level.scale, 0.33)
+        self.assertEqual(scheduler.level.suspended, ('curvature',))
+        
+        # Just under budget, but restoring curvature would not fit: stay put
+        for _ in range(50):
+            self.assertFalse(scheduler.observe(15.0))
+        
+        # Plenty of headroom, held long enough: one step up
+        changes = [scheduler.observe(5.0) for _ in range(20)]
+        self.assertEqual(changes.count(True), 1)
+        self.assertEqual(scheduler.level.suspended, ())
+        
+        # Without performance mode only effects are switched off
+        self.assertTrue(scheduler.set_allow_scaling(False))
+        self.assertEqual(scheduler.level.scale, 1.0)
+        
+        crt_filter = CRTFilter(64, 48)
+        crt_filter.update_parameters(curvature=0.2, chromatic_aberration=2.0)
+        crt_filter.set_quality(0.75, ('curvature', 'chromatic_aberration'))
+        self.assertEqual(crt_filter.curvature, 0.0)
+        self.assertEqual(crt_filter._aberration_offset(64), 0)
+        crt_filter.update_parameters(curvature=0.3)
+        self.assertEqual(crt_filter.curvature, 0.0)
+        crt_filter.set_quality(1.0)
+        self.assertEqual(crt_filter.curvature, 0.3)
+        self.assertEqual(crt_filter.chromatic_aberration, 2.0)
+    
+    def test_preview_mailbox(self):
+        """Test engine preview thumbnails and the single-slot mailbox."""
+        from filter_engine import PreviewMailbox, make_thumbnail
+        
+        surface = make_test_surface(640, 360)
+        thumbnail = make_thumbnail(surface, (300, 200))
+        self.assertEqual(thumbnail.shape, (120, 214, 3))
+        self.assertTrue(thumbnail.flags['C_CONTIGUOUS'])
+        
+        mailbox = PreviewMailbox()
+        self.assertIsNone(mailbox.take())
+        mailbox.post(thumbnail)
+        mailbox.post(thumbnail[::2])
+        seen, latest = mailbox.take()
+        self.assertEqual(seen, 2)
+        self.assertEqual(latest.shape, (60, 214, 3))
+        self.assertIsNone(mailbox.take(seen))
+    
+    def test_batch_filter(self):
+        """Test offline filtering of raw and Y4M streams, in order, across processes."""
+        import io
+        import numpy as np
+        from batch_filter import (filter_frames, read_raw, read_y4m, rgb_to_yuv, write_raw,
+                                  write_y4m, yuv_to_rgb)
+        from config import FilterSettings
+        
+        width, height = 48, 32
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8).tobytes()
+                  for _ in range(5)]
+        settings = FilterSettings(curvature=0.2, performance_mode=False)
+        
+        serial = list(filter_frames(read_raw(io.BytesIO(b''.join(frames)), width, height),
+                                    settings))
+        self.assertEqual(len(serial), 5)
+        self.assertTrue(all(len(frame) == width * height * 3 for frame in serial))
+        parallel = io.BytesIO()
+        jobs = read_raw(io.BytesIO(b''.join(frames)), width, height)
+        write_raw(parallel, filter_frames(jobs, settings, workers=2, max_in_flight=3))
+        self.assertEqual(parallel.getvalue(), b''.join(serial))
+        
+        # Y4M with odd sizes and 4:2:0 chroma round-trips through RGB
+        rgb = np.full((21, 31, 3), (200, 100, 50), dtype=np.uint8)
+        yuv = rgb_to_yuv(rgb, 'yuv420')
+        self.assertEqual(len(yuv), 21 * 31 + 2 * 11 * 16)
+        self.assertLessEqual(np.abs(yuv_to_rgb(yuv, 31, 21, 'yuv420').astype(int) - rgb).max(), 2)
+        
+        stream = io.BytesIO(b'YUV4MPEG2 W31 H21 F25:1 C420jpeg\n' + (b'FRAME\n' + yuv) * 2)
+        header, y4m_frames = read_y4m(stream)
+        output = io.BytesIO()
+        self.assertEqual(write_y4m(output, header, filter_frames(y4m_frames, settings)), 2)
+        self.assertTrue(output.getvalue().startswith(header + b'FRAME\n'))
+        self.assertEqual(len(output.getvalue()), len(stream.getvalue()))
+    
+    def test_capture_targets(self):
+        """Test region and window targets and the engine following them."""
+        import pygame
+        from capture_target import (RegionTarget, WindowTarget, clip_region, make_region,
+                                    monitor_for_region, parse_window_id)
+        from filter_engine import FilterEngine
+        from window_manager import WindowManager
+        
+        screen = make_region(0, 0, 200, 100)
+        self.assertEqual(clip_region(make_region(150, -10, 100, 50), screen),
+                         make_region(150, 0, 50, 40))
+        self.assertIsNone(clip_region(make_region(300, 0, 10, 10), screen))
+        monitors = [make_region(0, 0, 100, 100), make_region(100, 0, 100, 100)]
+        self.assertEqual(monitor_for_region(make_region(90, 0, 40, 10), monitors), monitors[1])
+        self.assertEqual(parse_window_id('0x3a00007 Terminal'), 0x3a00007)
+        self.assertEqual(parse_window_id('123'), 123)
+        self.assertRaises(ValueError, parse_window_id, 'terminal')
+        self.assertRaises(ValueError, RegionTarget, make_region(0, 0, 0, 10))
+        
+        # Windows are re-queried once per poll interval and clipped to the screen
+        geometries = [make_region(10, 10, 40, 30), make_region(180, 20, 40, 30), None]
+        with patch.object(WindowTarget, '_query_geometry', side_effect=geometries):
+            target = WindowTarget(0x42, bounds=screen, poll_interval=0)
+            self.assertEqual(target.region(), make_region(180, 20, 20, 30))
+            self.assertEqual(target.region(), make_region(180, 20, 20, 30))
+            self.assertTrue(target.lost)
+        
+        # The engine resizes the overlay and captures the new region
+        regions = [make_region(0, 0, 64, 48), make_region(8, 8, 64, 48), make_region(8, 8, 32, 24)]
+        target = Mock(region=Mock(side_effect=lambda: regions[min(len(presented), 2)]))
+        control_panel = Mock(running=True, selected_monitor=0, crt_filter=None)
+        presented = []
+        
+        def present(surface, rects=None):
+            presented.append(surface.get_size())
+            if len(presented) >= 4:
+                control_panel.running = False
+        
+        pygame.init()
+        try:
+            with patch('filter_engine.ScreenCapture') as screen_capture, \
+                    patch.object(WindowManager, 'move_overlay') as move_overlay, \
+                    patch.object(WindowManager, 'resize_overlay') as resize_overlay:
+                screen_capture.return_value.capture_region.side_effect = \
+                    lambda region: make_test_surface(region['width'], region['height'])
+                engine = FilterEngine(control_panel, regions[0], target=target)
+                engine.pipelined = False
+                engine._present = present
+                engine.run()
+        finally:
+            pygame.quit()
+        
+        self.assertEqual(presented[0], (64, 48))
+        self.assertEqual(presented[-1], (32, 24))
+        move_overlay.assert_called_once_with(regions[1])
+        resize_overlay.assert_called_once_with(regions[2])
+        target.close.assert_called_once()
+    
+    def test_frame_pacer(self):
+        """Test deadline pacing, missed-deadline counts and stale frames on a fake clock."""
+        from frame_pacer import FramePacer
+        
+        now = [0.0]
+        sleeps = []
+        
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds if seconds > 0 else 0.0005
+        
+        pacer = FramePacer(100.0, spin_margin=0.002, stale_periods=2.0,
+                           clock=lambda: now[0], sleep=sleep)
+        self.assertTrue(pacer.wait())
+        self.assertAlmostEqual(pacer.next_deadline(), 0.01)
+        
+        # Early frames sleep coarsely, then spin up to the deadline
+        now[0] = 0.004
+        self.assertTrue(pacer.wait())
+        self.assertAlmostEqual(sleeps[0], 0.004)
+        self.assertGreaterEqual(now[0], 0.01)
+        self.assertAlmostEqual(pacer.next_deadline(), 0.02)
+        
+        # A frame 2.5 periods late is presented at once and the grid resumes
+        # after the last vblank it missed, without catch-up presents
+        now[0] = 0.045
+        self.assertFalse(pacer.wait())
+        self.assertEqual((pacer.deadlines_met, pacer.deadlines_missed, pacer.vblanks_skipped),
+                         (1, 1, 2))
+        self.assertAlmostEqual(pacer.next_deadline(), 0.05)
+        self.assertTrue(pacer.wait())
+        self.assertEqual(pacer.deadlines_met, 2)
+        
+        self.assertFalse(pacer.skip_stale(now[0] - 0.015, True))
+        self.assertTrue(pacer.skip_stale(now[0] - 0.025, True))
+        # With nothing newer captured yet, an old frame is still filtered
+        self.assertFalse(pacer.skip_stale(now[0] - 0.025, False))
+        self.assertEqual(pacer.stale_frames, 1)
+        
+        # Without a refresh rate nothing waits or goes stale
+        pacer.set_refresh_rate(0)
+        self.assertTrue(pacer.wait())
+        self.assertFalse(pacer.is_stale(-1.0))
+    
+    def test_buffer_pool_steady_state(self):
+        """Test that capture and filtering stop allocating large buffers once warm."""
+        import numpy as np
+        from buffer_pool import BufferPool
+        
+        pool = BufferPool(max_free=2)
+        array = pool.acquire_array((4, 8), np.uint16)
+        pool.release_array(array)
+        pool.release_array(array[1:])
+        self.assertIs(pool.acquire_array((4, 8), np.uint16), array)
+        surface = pool.acquire_surface((8, 4))
+        pool.release_surface(surface)
+        self.assertIs(pool.acquire_surface((8, 4)), surface)
+        self.assertEqual((pool.allocations, pool.reuses), (2, 2))
+        
+        # Feedback signatures are small; any frame-sized temporary is not
+        for settings in ({'performance_mode': False, 'curvature': 0.2},
+                         {'performance_mode': True}):
+            telemetry = assert_frame_allocation_within_budget(
+                self, 320, 180, dict(chromatic_aberration=2.0, **settings),
+                bytes_per_pixel=2.0, base=0)
+            self.assertEqual(telemetry.samples('frame', skip=3)[:, 2].sum(), 0)
+            
+    def test_memory_telemetry(self):
+        """Test per-stage allocation accounting and the frame allocation budget."""
+        import numpy as np
+        from buffer_pool import BufferPool
+        from frame_timing import StageTimings
+        from memory_telemetry import MemoryTelemetry, format_memory_table
+            
+        pool = BufferPool()
+        timings = StageTimings()
+        telemetry = MemoryTelemetry(pool)
+        timings.memory = telemetry
+        telemetry.start()
+        try:
+            for _ in range(2):
+                with timings.measure('outer'):
+                    pool.release_surface(pool.acquire_surface((64, 64)))
+                    with timings.measure('inner'):
+                        np.ones(1 << 20, dtype=np.uint8)
+                    kept = np.ones(1 << 16, dtype=np.uint8)
+                    del kept
+        finally:
+            telemetry.stop()
+        
+        # Nested stages both see the inner temporary; only the first pass allocates a surface
+        for stage in ('outer', 'inner'):
+            self.assertEqual(timings.count(stage), 2)
+            self.assertGreaterEqual(telemetry.summary(stage)['transient_max'], 1 << 20)
+        self.assertEqual(telemetry.samples('outer')[:, 2].tolist(), [64 * 64 * 4, 0])
+        self.assertLess(abs(telemetry.samples('inner')[:, 1]).max(), 1 << 16)
+        
+        report = telemetry.report()
+        self.assertGreaterEqual(report['traced_peak_bytes'], 1 << 20)
+        if report['peak_rss_bytes'] is not None:
+            self.assertGreater(report['peak_rss_bytes'], report['traced_peak_bytes'])
+        self.assertEqual(len(format_memory_table(telemetry)), 3)
+        
+        # The budget scales with resolution, and a run over it fails
+        settings = {'performance_mode': False, 'curvature': 0.2, 'chromatic_aberration': 2.0}
+        for width, height in ((160, 90), (480, 270)):
+            assert_frame_allocation_within_budget(self, width, height, settings, frames=5)
+        with self.assertRaises(AssertionError):
+            assert_frame_allocation_within_budget(self, 160, 90, settings, frames=2,
+                                                  bytes_per_pixel=0.0, base=0)
+    
+    def test_engine_benchmark(self):
+        """Test a short headless run of the engine benchmark."""
+        from benchmark_engine import run_engine
+        
+        for pipelined in (False, True):
+            report = run_engine(5, 64, 48, 'synthetic', pipelined=pipelined,
+                                memory=not pipelined)
+            self.assertGreaterEqual(report['frames_presented'], 5)
+            self.assertGreater(report['fps'], 0)
+            # Every frame ran the effects and flip; none was passed through as
+            # feedback. The pipelined loop may also have filtered the frames
+            # still queued and in progress when it stopped
+            self.assertEqual(report['frames_flipped'], report['frames_presented'])
+            self.assertEqual(report['stages']['effects']['count'], report['frames_filtered'])
+            if pipelined:
+                self.assertLessEqual(report['frames_filtered'] - report['frames_presented'], 2)
+                # Capture waits for the filter to take each frame, rather than
+                # grabbing flat out and dropping all but the newest
+                self.assertLessEqual(report['stages']['capture']['count'],
+                                     report['frames_filtered'] + report['pacing']['stale_frames'] + 2)
+                self.assertGreaterEqual(report['frames_filtered'], report['frames_presented'])
+            else:
+                self.assertEqual(report['frames_filtered'], report['frames_presented'])
+            self.assertEqual(sum(report['frame_time_ms']['histogram'].values()),
+                             report['frames_presented'] - 1)
+            for stage in ('capture', 'filter', 'present'):
+                self.assertIn(stage, report['stages'])
+            if not pipelined:
+                self.assertGreaterEqual(report['memory']['stages']['frame']['count'], 4)
+                self.assertIn('effects', report['memory']['stages'])
+    
     def test_gui_components(self):
         """Test GUI module imports."""
         from gui import ControlPanel
@@ -74,6 +1201,119 @@ class TestCRTFilterModules(unittest.TestCase):
         self.assertTrue(callable(ControlPanel))
 
 
+class TestX11Integration(unittest.TestCase):
+    """Tests that need a real X server; they run under Xvfb when available."""
+    
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import Xlib.display
+        except ImportError:
+            raise unittest.SkipTest("python-xlib is not installed")
+        from benchmark_engine import start_xvfb
+        
+        try:
+            cls.xvfb, cls.display_name = start_xvfb(320, 240)
+        except RuntimeError as e:
+            raise unittest.SkipTest(str(e))
+        cls.previous_display = os.environ.get('DISPLAY')
+        os.environ['DISPLAY'] = cls.display_name
+        cls.display = Xlib.display.Display(cls.display_name)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.display.close()
+        cls.xvfb.kill()
+        cls.xvfb.wait()
+        if cls.previous_display is None:
+            os.environ.pop('DISPLAY', None)
+        else:
+            os.environ['DISPLAY'] = cls.previous_display
+    
+    def create_window(self, x=0, y=0, width=100, height=80, pixel=0):
+        """Create and map a top-level window filled with a solid pixel value."""
+        from Xlib import X
+        
+        screen = self.display.screen()
+        window = screen.root.create_window(
+            x, y, width, height, 0, screen.root_depth,
+            background_pixel=pixel, event_mask=X.StructureNotifyMask
+        )
+        window.map()
+        self.display.sync()
+        self.addCleanup(window.destroy)
+        return window
+    
+    def test_xlib_hide_restore(self):
+        """Test overlay hide/restore over the persistent Xlib connection."""
+        from Xlib import X
+        from window_manager import WindowManager
+        
+        window = self.create_window()
+        window_manager = WindowManager()
+        window_manager.window_id = str(window.id)
+        try:
+            self.assertTrue(window_manager.hide_window())
+            self.display.sync()
+            self.assertEqual(window.get_attributes().map_state, X.IsUnmapped)
+            
+            window_manager.restore_window()
+            self.display.sync()
+            self.assertEqual(window.get_attributes().map_state, X.IsViewable)
+            self.assertIsNotNone(window_manager._window)
+        finally:
+            window_manager.close()
+    
+    def test_xshm_capture(self):
+        """Test MIT-SHM capture into the reused shared segment."""
+        import pygame
+        from capture_sources import XShmSource
+        
+        self.create_window(10, 10, 50, 40, pixel=0x0000FF)
+        source = XShmSource()
+        try:
+            region = {'left': 0, 'top': 0, 'width': 80, 'height': 60}
+            surface = source.grab(region)
+            segment = source.segment
+            self.assertEqual(tuple(pygame.surfarray.pixels3d(surface)[20, 20]), (0, 0, 255))
+            self.assertIs(source.grab(region, surface), surface)
+            self.assertEqual(source.segment, segment)
+        finally:
+            source.close()
+    
+    def test_composite_capture(self):
+        """Test that composite capture sees beneath a mapped overlay."""
+        import pygame
+        from Xlib import X
+        from composite_capture import CompositeCapture
+        
+        backdrop = self.create_window(0, 0, 120, 100, pixel=0x00FF00)
+        overlay = self.create_window(20, 20, 60, 40, pixel=0xFF0000)
+        capture = CompositeCapture(str(overlay.id))
+        try:
+            surface = capture.grab({'left': 0, 'top': 0, 'width': 160, 'height': 120})
+            pixels = pygame.surfarray.pixels3d(surface)
+            self.assertEqual(tuple(pixels[40, 30]), (0, 255, 0))
+            self.assertEqual(tuple(pixels[150, 110]), (0, 0, 0))
+            del pixels
+            self.assertEqual(overlay.get_attributes().map_state, X.IsViewable)
+            
+            # The cached window list follows windows appearing and moving
+            region = {'left': 0, 'top': 0, 'width': 160, 'height': 120}
+            above = self.create_window(30, 25, 20, 10, pixel=0x0000FF)
+            surface = capture.grab(region, surface)
+            self.assertEqual(tuple(pygame.surfarray.pixels3d(surface)[40, 30]), (0, 0, 255))
+            above.configure(x=130, y=90)
+            self.display.sync()
+            surface = capture.grab(region, surface)
+            pixels = pygame.surfarray.pixels3d(surface)
+            self.assertEqual(tuple(pixels[40, 30]), (0, 255, 0))
+            self.assertEqual(tuple(pixels[140, 95]), (0, 0, 255))
+            del pixels
+        finally:
+            capture.close()
+
+
 def main():
     """Run the test suite."""
     print("Running CRT Filter Module Tests...")
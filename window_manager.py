@@ -5,11 +5,24 @@ Handles overlay window creation, positioning, and manipulation for the CRT filte
 """
 
 import pygame
+import select
 import subprocess
 import sys
 import os
+import threading
 import time
 from typing import Dict, Optional, Tuple
+from config import CONFIG
+
+try:
+    from Xlib import X
+    from Xlib import display as xdisplay
+    from Xlib.protocol import event as xevent
+except ImportError:  # python-xlib is optional; fall back to xdotool/wmctrl
+    xdisplay = None
+
+# _NET_WM_STATE client message action that adds a state
+NET_WM_STATE_ADD = 1
 
 
 class WindowManager:
@@ -18,7 +31,20 @@ class WindowManager:
     def __init__(self):
         self.window_id: Optional[str] = None
         self.capture_delay = 0.02  # 20ms delay after hiding before capture
+        self.operation_timeout = CONFIG.window_operation_timeout
         
+        # Persistent X connection for hide/restore, opened on first use. The
+        # capture thread uses it while the main thread may resize the overlay,
+        # so both hold the lock around it
+        self._display = None
+        self._window = None
+        self._xlib_failed = False
+        self._lock = threading.RLock()
+        
+        # Separate connection for moving the overlay; the persistent one above
+        # is used by the capture thread
+        self._layout_display = None
+    
     def setup_overlay_window(self, monitor: Dict) -> pygame.Surface:
         """Set up a transparent, click-through overlay window on the selected monitor."""
         # Set window position and size to match the selected monitor
@@ -32,6 +58,53 @@ class WindowManager:
         self._setup_linux_window_properties()
         return screen
     
+    def move_overlay(self, region: Dict) -> None:
+        """Move the overlay so its top-left corner matches the region's."""
+        if not self.window_id or self.window_id == 'None':
+            return
+        
+        if xdisplay is not None and not self._xlib_failed:
+            try:
+                if self._layout_display is None:
+                    self._layout_display = xdisplay.Display()
+                window = self._layout_display.create_resource_object('window', int(self.window_id))
+                window.configure(x=region['left'], y=region['top'])
+                self._layout_display.flush()
+                return
+            except Exception as e:
+                print(f"Error moving window: {e}")
+        
+        try:
+            subprocess.run(['xdotool', 'windowmove', self.window_id,
+                            str(region['left']), str(region['top'])],
+                           check=False, timeout=0.1)
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            pass
+    
+    def resize_overlay(self, region: Dict) -> pygame.Surface:
+        """Resize and move the overlay to cover a region; returns the new display surface."""
+        screen = pygame.display.set_mode(
+            (region['width'], region['height']),
+            pygame.NOFRAME | pygame.SRCALPHA
+        )
+        
+        # SDL normally resizes the existing window, but set it up again if it
+        # had to create a new one. The capture thread may be hiding or
+        # restoring the old window, so the connection is kept and only pointed
+        # at the new window once that is done
+        window_id = str(pygame.display.get_wm_info().get('window'))
+        if window_id != self.window_id:
+            with self._lock:
+                self.window_id = window_id
+                if window_id == 'None':
+                    self._close_display()
+                elif self._display is not None:
+                    self._bind_window()
+            self._setup_linux_window_properties()
+        
+        self.move_overlay(region)
+        return screen
+    
     def _setup_linux_window_properties(self) -> None:
         """Configure Linux-specific window properties for click-through overlay."""
         if sys.platform != "linux":
@@ -86,11 +159,99 @@ class WindowManager:
             '-set', '_MOTIF_WM_HINTS', '2, 0, 0, 0, 0'
         ], check=False)
     
+    def _connect(self) -> bool:
+        """
+        Open the persistent X connection for the overlay window, if possible.
+        
+        Call with the lock held.
+        """
+        if self._window is not None:
+            return True
+        if xdisplay is None or self._xlib_failed or not self.window_id or self.window_id == 'None':
+            return False
+        
+        try:
+            self._display = xdisplay.Display()
+            self._net_wm_state = self._display.intern_atom('_NET_WM_STATE')
+            self._net_wm_state_above = self._display.intern_atom('_NET_WM_STATE_ABOVE')
+        except Exception as e:
+            print(f"Could not open X connection, using xdotool/wmctrl: {e}")
+            self._close_display()
+            self._xlib_failed = True
+            return False
+        return self._bind_window()
+    
+    def _bind_window(self) -> bool:
+        """Point the persistent connection at window_id; call with the lock held."""
+        try:
+            self._window = self._display.create_resource_object('window', int(self.window_id))
+            # Map/unmap of the window are reported as MapNotify/UnmapNotify
+            self._window.change_attributes(event_mask=X.StructureNotifyMask)
+            self._display.sync()
+            return True
+        except Exception as e:
+            print(f"Could not watch the overlay window, using xdotool/wmctrl: {e}")
+            self._close_display()
+            self._xlib_failed = True
+            return False
+    
+    def _wait_for_event(self, event_type: int) -> bool:
+        """Wait up to operation_timeout for a structure event on the overlay."""
+        deadline = time.monotonic() + self.operation_timeout
+        while True:
+            while self._display.pending_events():
+                event = self._display.next_event()
+                if event.type == event_type and event.window.id == self._window.id:
+                    return True
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([self._display.fileno()], [], [], remaining)
+    
+    def _keep_above_xlib(self) -> None:
+        """Ask the window manager to keep the overlay above other windows."""
+        root = self._display.screen().root
+        message = xevent.ClientMessage(
+            window=self._window,
+            client_type=self._net_wm_state,
+            data=(32, [NET_WM_STATE_ADD, self._net_wm_state_above, 0, 1, 0])
+        )
+        root.send_event(message, event_mask=X.SubstructureRedirectMask | X.SubstructureNotifyMask)
+        self._display.flush()
+    
+    def _hide_window_xlib(self) -> bool:
+        """Unmap the overlay and wait until the server reports it unmapped."""
+        self._window.unmap()
+        self._display.flush()
+        return self._wait_for_event(X.UnmapNotify)
+    
+    def _restore_window_xlib(self) -> bool:
+        """Map the overlay, wait until it is mapped and keep it on top."""
+        self._window.map()
+        self._display.flush()
+        mapped = self._wait_for_event(X.MapNotify)
+        self._keep_above_xlib()
+        return mapped
+    
+    def has_window(self) -> bool:
+        """Return True if there is an overlay window to hide."""
+        return bool(self.window_id) and self.window_id != 'None'
+    
     def hide_window(self) -> bool:
         """Hide the overlay window for screen capture. Returns True if successful."""
         if not self.window_id or self.window_id == 'None':
             return False
             
+        with self._lock:
+            if self._connect():
+                try:
+                    # False if the server did not report the unmap in time
+                    return self._hide_window_xlib()
+                except Exception as e:
+                    print(f"Error hiding window: {e}")
+                    return False
+        
         try:
             # Try xdotool first (more reliable)
             subprocess.run(['xdotool', 'windowminimize', self.window_id], 
@@ -112,6 +273,14 @@ class WindowManager:
         if not self.window_id or self.window_id == 'None':
             return
             
+        with self._lock:
+            if self._connect():
+                try:
+                    self._restore_window_xlib()
+                except Exception as e:
+                    print(f"Error restoring window: {e}")
+                return
+        
         try:
             # Try to unminimize first
             subprocess.run(['xdotool', 'windowmap', self.window_id], 
@@ -136,6 +305,14 @@ class WindowManager:
         if not self.window_id or self.window_id == 'None':
             return
             
+        with self._lock:
+            if self._connect():
+                try:
+                    self._restore_window_xlib()
+                    return
+                except Exception:
+                    pass
+        
         try:
             subprocess.run(['xdotool', 'windowmap', self.window_id], check=False, timeout=0.1)
             subprocess.run(['wmctrl', '-i', '-r', self.window_id, '-b', 'remove,hidden'], 
@@ -144,6 +321,28 @@ class WindowManager:
                          check=False, timeout=0.1)
         except:
             pass
+    
+    def _close_display(self) -> None:
+        """Close the persistent connection; call with the lock held."""
+        if self._display is not None:
+            try:
+                self._display.close()
+            except Exception:
+                pass
+        self._display = None
+        self._window = None
+    
+    def close(self) -> None:
+        """Close the X connections."""
+        with self._lock:
+            self._close_display()
+        
+        if self._layout_display is not None:
+            try:
+                self._layout_display.close()
+            except Exception:
+                pass
+        self._layout_display = None
 
 
 def get_monitor_refresh_rate(monitor: Dict) -> float: